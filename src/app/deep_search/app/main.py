@@ -29,6 +29,8 @@ async def lifespan(app: FastAPI):
         yield
     finally:
         logger.info("🛑 Shutting down Socket Mode…")
+        if gensee_agent_controller is not None:
+            await gensee_agent_controller.aclose()
         logger.info("✅ Clean shutdown complete")
 
 app = FastAPI(title="Deep Search", lifespan=lifespan)
@@ -87,6 +87,9 @@ async def lifespan(app: FastAPI):
         #    close_async() exists for the async handler
         if socket_handler:
             await socket_handler.close_async()
+        # 3) Persist pending history and release the controller's resources
+        if gensee_agent_controller is not None:
+            await gensee_agent_controller.aclose()
         logging.info("✅ Clean shutdown complete")
 
 app = FastAPI(title="Gensee Agent for Slack", lifespan=lifespan)
@@ -0,0 +1,170 @@
+from collections import OrderedDict
+import hashlib
+import re
+from typing import Optional
+
+from gensee_agent.controller.dataclass.llm_response import LLMResponses
+from gensee_agent.controller.dataclass.llm_use import LLMUse
+from gensee_agent.controller.llm_manager import LLMManager
+from gensee_agent.exceptions.gensee_exceptions import GenseeError
+from gensee_agent.utils.configs import BaseConfig, register_configs
+from gensee_agent.utils.logging import configure_logger
+from gensee_agent.utils.tokens import CHARS_PER_TOKEN, estimate_tokens
+
+logger = configure_logger(__name__)
+
+# Tool results as formatted by ToolManager.tool_response_to_string, after the title line added by LLMUse.
+_TOOL_RESULT_RE = re.compile(r"^(<title>.*?</title>\n)?(\[[^\]\n]+\] (?:Arguments: [^\n]*\n)?Result:\n)", re.DOTALL)
+# Tokens added by the chat format for each message, on top of its content.
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = """You compress tool results for an AI agent that has limited context.
+Summarize the tool result given by the user in at most {max_tokens} tokens.  Keep the facts, numbers, names, URLs and IDs the agent may need later, and drop boilerplate.
+Output only the summary."""
+
+class ContextManager:
+    """Keep the prompts sent to the LLM within a token budget.
+
+    History is not modified: `prepare()` returns a compacted copy of the LLMUse to send.  Under the budget, the
+    prompts are sent unchanged.  Over the budget, the system prompt, the first user message (the objective) and
+    the most recent messages are kept verbatim, and older tool results are shrunk, oldest first, until the prompts
+    fit: summarized by `summary_model` if set, else truncated.  If that is not enough, the oldest turns outside
+    the kept messages are dropped (sliding window), each assistant message with the tool results that follow it.
+    """
+
+    @register_configs("context_manager")
+    class Config(BaseConfig):
+        max_context_tokens: Optional[int] = None  # Token budget of the prompts sent to the LLM.  None to send them unchanged.
+        keep_recent_messages: int = 6  # Number of most recent messages always kept verbatim.
+        compacted_tool_result_tokens: int = 300  # Target size of an older tool result once truncated or summarized.
+        summary_model: Optional[str] = None  # Cheap model to summarize older tool results.  None to truncate them instead.
+        summary_cache_size: int = 1024  # Number of summaries kept, since the same results are compacted at every step.
+
+        def __post_init__(self):
+            if self.max_context_tokens is not None and self.max_context_tokens <= 0:
+                raise ValueError(f"max_context_tokens must be positive, got {self.max_context_tokens}.")
+
+    def __init__(self, config: dict, llm_manager: LLMManager):
+        self.config = self.Config.from_dict(config)
+        self.llm_manager = llm_manager
+        if self.config.summary_model is not None and self.config.summary_model not in llm_manager.models:
+            raise ValueError(f"Summary model {self.config.summary_model} is not in available models {llm_manager.config.available_models}.")
+        self.summaries: OrderedDict[str, str] = OrderedDict()  # Summary by hash of the tool result.
+
+    async def prepare(self, llm_use: LLMUse) -> tuple[LLMUse, dict, list[LLMResponses]]:
+        """Return the LLMUse to send, a report of the token counts and the compaction done, and the responses of the
+        summarization calls made, whose usage is part of the task."""
+        prompts = llm_use.prompts
+        tokens = [estimate_tokens(prompt["content"]) + _MESSAGE_OVERHEAD_TOKENS for prompt in prompts]
+        total = sum(tokens)
+        report = {
+            "budget": self.config.max_context_tokens,
+            "messages": len(prompts),
+            "tokens_before": total,
+            "tokens_after": total,
+            "truncated_messages": 0,
+            "summarized_messages": 0,
+            "dropped_messages": 0,
+        }
+        summary_responses: list[LLMResponses] = []
+        budget = self.config.max_context_tokens
+        if budget is None or total <= budget:
+            return llm_use, report, summary_responses
+
+        protected = self._protected_indexes(prompts)
+        compacted = list(prompts)
+        for index, prompt in enumerate(prompts):
+            if total <= budget:
+                break
+            if index in protected:
+                continue
+            match = _TOOL_RESULT_RE.match(prompt["content"])
+            if match is None:
+                continue
+            header = prompt["content"][:match.end()]
+            body = prompt["content"][match.end():]
+            if estimate_tokens(body) <= self.config.compacted_tool_result_tokens:
+                continue
+            summary = await self._summarize(body, summary_responses)
+            if summary is not None:
+                report["summarized_messages"] += 1
+                new_body = f"[Summary of an earlier result]\n{summary}\n"
+            else:
+                report["truncated_messages"] += 1
+                new_body = self._truncate(body)
+            compacted[index] = {"role": prompt["role"], "content": header + new_body}
+            new_tokens = estimate_tokens(compacted[index]["content"]) + _MESSAGE_OVERHEAD_TOKENS
+            total -= tokens[index] - new_tokens
+            tokens[index] = new_tokens
+
+        if total > budget:
+            # Sliding window: drop the oldest turns that are not protected, whole, so that no tool result is kept
+            # without the tool use it answers.
+            kept = []
+            for turn in self._turns(compacted):
+                if total > budget and protected.isdisjoint(turn):
+                    total -= sum(tokens[index] for index in turn)
+                    report["dropped_messages"] += len(turn)
+                    continue
+                kept.extend(compacted[index] for index in turn)
+            compacted = kept
+            if report["dropped_messages"] > 0:
+                logger.warning(f"Dropped {report['dropped_messages']} messages to fit the context budget of {budget} tokens.")
+
+        report["tokens_after"] = total
+        new_llm_use = LLMUse(prompts=compacted, model_name=llm_use.model_name)
+        logger.info(f"Compacted context: {report}")
+        return new_llm_use, report, summary_responses
+
+    def _protected_indexes(self, prompts: list[dict]) -> set[int]:
+        protected = set(range(max(0, len(prompts) - self.config.keep_recent_messages), len(prompts)))
+        for index, prompt in enumerate(prompts):
+            if prompt["role"] == "system":
+                protected.add(index)
+            elif prompt["role"] == "user":
+                # The first user message carries the objective.
+                protected.add(index)
+                break
+        return protected
+
+    @staticmethod
+    def _turns(prompts: list[dict]) -> list[list[int]]:
+        """Indexes of the prompts grouped by turn: an assistant message with the messages that answer it, e.g., the
+        results of its tool uses.  Messages before the first assistant message are turns of their own."""
+        turns: list[list[int]] = []
+        for index, prompt in enumerate(prompts):
+            if prompt["role"] == "assistant" or not turns or prompts[turns[-1][0]]["role"] != "assistant":
+                turns.append([index])
+            else:
+                turns[-1].append(index)
+        return turns
+
+    def _truncate(self, body: str) -> str:
+        kept_chars = self.config.compacted_tool_result_tokens * CHARS_PER_TOKEN
+        omitted_tokens = estimate_tokens(body[kept_chars:])
+        return f"{body[:kept_chars]}\n... [{omitted_tokens} more tokens of this earlier result omitted]\n"
+
+    async def _summarize(self, body: str, summary_responses: list[LLMResponses]) -> Optional[str]:
+        if self.config.summary_model is None:
+            return None
+        key = hashlib.sha256(body.encode()).hexdigest()
+        if key in self.summaries:
+            self.summaries.move_to_end(key)
+            return self.summaries[key]
+        summary_llm_use = LLMUse(prompts=[
+            {"role": "system", "content": SUMMARY_PROMPT.format(max_tokens=self.config.compacted_tool_result_tokens)},
+            {"role": "user", "content": body},
+        ], model_name=self.config.summary_model)
+        try:
+            responses = await self.llm_manager.completion(summary_llm_use)
+        except GenseeError as e:
+            logger.warning(f"Failed to summarize a tool result, truncating it instead: {e}")
+            return None
+        summary_responses.append(responses)
+        if not responses or not responses[-1].content:
+            return None
+        summary = responses[-1].content.strip()
+        self.summaries[key] = summary
+        if len(self.summaries) > self.config.summary_cache_size:
+            self.summaries.popitem(last=False)
+        return summary
@@ -2,13 +2,19 @@ from typing import AsyncIterator, Awaitable, Callable, Optional
 
 from redis.asyncio import Redis, RedisCluster
 from gensee_agent.utils.configs import BaseConfig, register_configs
+from gensee_agent.controller.context_manager import ContextManager
 from gensee_agent.controller.dataclass.llm_use import LLMUse
 from gensee_agent.controller.history_manager import HistoryManager
+from gensee_agent.controller.history_writer import HistoryWriter
 from gensee_agent.controller.message_handler import MessageHandler
+from gensee_agent.controller.llm_cache import CacheMode
 from gensee_agent.controller.llm_manager import LLMManager
 from gensee_agent.controller.prompt_manager import PromptManager
+from gensee_agent.controller.recording import Recorder
+from gensee_agent.controller.retry_manager import RetryManager
 from gensee_agent.controller.task_manager import TaskManager
 from gensee_agent.controller.tool_manager import ToolManager
+from gensee_agent.history_backends.base import close_history_backends
 from gensee_agent.utils.logging import configure_logger
 
 logger = configure_logger(__name__)
@@ -20,15 +26,22 @@ class Controller:
         name: str  # Name of the controller.
         allow_user_interaction: bool = False  # Whether to allow user interaction
         streaming: bool = False  # Whether to enable streaming mode.
+        parallel_tool_use: bool = False  # Whether the LLM may request several tools in one message, which run concurrently.
+        max_parallel_tool_calls: int = 4  # Max number of tool calls running concurrently when parallel_tool_use is enabled.
 
     def __init__(self, config: dict, token: str, interactive_callback: Optional[Callable[[str], Awaitable[str]]] = None):
         assert token == "secret_token", "This class should be initialized with create() method, not directly."
         self.raw_config = config
         self.config = self.Config.from_dict(config)
-        self.llm_manager = LLMManager(config)
+        self.recorder = Recorder(config)
+        self.llm_manager = LLMManager(config, recorder=self.recorder)
+        self.context_manager = ContextManager(config, self.llm_manager)
         self.profile = None
         self.prompt_manager = PromptManager(config)
         self.message_handler = MessageHandler(config)
+        self.retry_manager = RetryManager(config)
+        history_writer = HistoryWriter(config)
+        self.history_writer = history_writer if history_writer.config.enabled else None
         self.interactive_callback = interactive_callback
         self.tool_manager = None
 
@@ -36,13 +49,34 @@ class Controller:
     async def create(cls, config: dict, interactive_callback: Optional[Callable[[str], Awaitable[str]]] = None) -> "Controller":
         self = cls(config, token="secret_token", interactive_callback=interactive_callback)
         if self.config.allow_user_interaction:
-            self.tool_manager = await ToolManager.create(config, use_interaction=True, interactive_callback=interactive_callback)
+            self.tool_manager = await ToolManager.create(config, use_interaction=True, interactive_callback=interactive_callback, recorder=self.recorder)
         else:
-            self.tool_manager = await ToolManager.create(config, use_interaction=False)
+            self.tool_manager = await ToolManager.create(config, use_interaction=False, recorder=self.recorder)
+        await self.llm_manager.prewarm()
         return self
 
+    def stats(self) -> dict:
+        """Process-wide counters of the managers, for monitoring."""
+        return {
+            "llm_manager": self.llm_manager.stats(),
+            "retry_manager": self.retry_manager.stats(),
+            **({"tool_manager": self.tool_manager.stats()} if self.tool_manager is not None else {}),
+            **({"history_writer": self.history_writer.stats()} if self.history_writer is not None else {}),
+        }
+
+    async def aclose(self):
+        """Release the resources of the controller.  To be called when the application shuts down."""
+        if self.history_writer is not None:
+            await self.history_writer.shutdown()
+        await close_history_backends()
+        await self.llm_manager.aclose()
+        if self.tool_manager is not None:
+            await self.tool_manager.aclose()
+
     async def run(self, title: str, task: str, *, model_name: Optional[str] = None, use_tool: bool = True, session_id: Optional[str] = None, additional_context: Optional[str] = None,
-                  redis_client: Optional[Redis|RedisCluster] = None) -> AsyncIterator[str]:
+                  redis_client: Optional[Redis|RedisCluster] = None, llm_cache: CacheMode = "use", priority: int = 0) -> AsyncIterator[str]:
+        """Run a task.  `priority` orders its LLM calls waiting for the rate limits, lower first: e.g., 0 for interactive
+        sessions and higher for batch jobs."""
         assert isinstance(self.tool_manager, ToolManager)
 
         # self.config.pretty_print()
@@ -58,9 +92,15 @@ class Controller:
             message_handler=self.message_handler,
             allow_interaction=self.config.allow_user_interaction,
             streaming=self.config.streaming,
+            parallel_tool_use=self.config.parallel_tool_use,
+            max_parallel_tool_calls=self.config.max_parallel_tool_calls,
+            retry_manager=self.retry_manager,
+            context_manager=self.context_manager,
+            llm_cache=llm_cache,
+            priority=priority,
         )
 
-        history_manager = HistoryManager(self.raw_config, session_id=session_id, redis_client=redis_client)
+        history_manager = HistoryManager(self.raw_config, session_id=session_id, redis_client=redis_client, history_writer=self.history_writer)
         await task_manager.create_task(title, task, model_name=model_name, use_tool=use_tool, history_manager=history_manager, additional_context=additional_context)
         try:
             async for chunk in task_manager.start():
@@ -68,9 +108,12 @@ class Controller:
         except Exception as e:
             logger.error(f"Error during task execution: {e}", exc_info=True)
             raise e
+        finally:
+            # The task's history must be persisted when it completes.
+            await history_manager.flush()
 
     async def append_context(self, session_id: str, title: str, role: str, prompt: str, *, model_name: Optional[str] = None, use_tool: bool = True, additional_context: Optional[str] = None, redis_client: Optional[Redis|RedisCluster] = None):
-        history_manager = HistoryManager(self.raw_config, session_id=session_id, redis_client=redis_client)
+        history_manager = HistoryManager(self.raw_config, session_id=session_id, redis_client=redis_client, history_writer=self.history_writer)
         if role not in ["system", "user", "assistant"]:
             raise ValueError("Role must be one of 'system', 'user', or 'assistant'.")
         if role == "system":
@@ -79,6 +122,8 @@ class Controller:
                 user_objective=prompt,
                 tool_descriptions=self.tool_manager.tool_descriptions,
                 allow_interaction=self.config.allow_user_interaction,
+                parallel_tool_use=self.config.parallel_tool_use,
+                native_tool_calls=self.llm_manager.config.native_tool_calls,
                 additional_context=additional_context,
                 use_tool=use_tool,
             )
@@ -105,3 +150,4 @@ class Controller:
                     prompt = llm_use.add_title(prompt, title)
                 llm_use.append_assistant_prompt(prompt)
         await history_manager.add_entry("llm_use", title, llm_use)
+        await history_manager.flush()
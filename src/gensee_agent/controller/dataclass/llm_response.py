@@ -1,12 +1,26 @@
 from dataclasses import dataclass
 from typing import Optional, TypeAlias
 
+@dataclass
+class LLMUsage:
+    """Token counts and timing of one LLM call."""
+    model_name: Optional[str] = None  # Model that answered, which may be a backup of the requested one.
+    prompt_tokens: int = 0  # Input tokens, including the cached ones.
+    cached_prompt_tokens: int = 0  # Input tokens read from the provider's prefix cache.
+    output_tokens: int = 0  # Output tokens, including reasoning tokens.
+    latency_seconds: float = 0.0  # Time from the request to the complete response.
+    first_token_seconds: Optional[float] = None  # Time to the first content chunk, when streaming.
+    cost: Optional[float] = None  # In USD, if the prices of the model are configured.
+    cached: bool = False  # Whether the response came from the LLM completion cache, without calling the provider.
+
 @dataclass
 class SingleLLMResponse:
     finish_reason: str
     title: str
     content: Optional[str]
     partial: bool = False
+    usage: Optional[LLMUsage] = None  # Usage of the whole call, set on the first complete response of the call.
+    provider_state: Optional[dict] = None  # State of the conversation kept by the provider after this response (see LLMUse).
 
 
-LLMResponses: TypeAlias = list[SingleLLMResponse]
\ No newline at end of file
+LLMResponses: TypeAlias = list[SingleLLMResponse]
@@ -1,13 +1,92 @@
-from dataclasses import dataclass
 from typing import Optional
 
-@dataclass
+class MessageLog:
+    """Append-only list of messages shared by the LLMUse objects of a session.
+
+    Each LLMUse sees a prefix of the log, so a conversation that only grows stores each message once,
+    however many LLMUse snapshots the history keeps.  Messages in the log are never modified.
+    """
+    def __init__(self, messages: Optional[list[dict]] = None):
+        self.messages: list[dict] = messages if messages is not None else []
+        self._prefix: Optional[list[dict]] = None  # Last list returned by prefix().
+
+    def prefix(self, length: int) -> list[dict]:
+        """The first `length` messages.  The list is shared by the callers asking for the same length, so it must not be modified."""
+        # The log is append-only, so a prefix never changes once built.
+        if self._prefix is None or len(self._prefix) != length:
+            self._prefix = self.messages[:length]
+        return self._prefix
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+
 class LLMUse:
-    prompts: list[dict] # Example: [{"role": "user", "content": "What is the capital of France?"}]
-    model_name: Optional[str] = None  # The name of the model to use.  None to use default.
+    """The prompts to send to the LLM.
+
+    prompts: Example: [{"role": "user", "content": "What is the capital of France?"}]
+    model_name: The name of the model to use.  None to use default.
+    provider_state: State of the conversation kept by the provider, e.g., {"model_name": "openai.gpt-5",
+                    "response_id": "resp_...", "length": 5}: the provider has the first `length` prompts under
+                    that response id, so only the next prompts need to be sent.  None if there is none.
+
+    `prompts` is read-only: the list is shared by the accesses at the same length, so that reading it at every
+    step of a task doesn't copy the conversation each time.  Use the append and set methods to change it.
+
+    The prompts are the first `length` messages of a MessageLog.  `copy()` shares the log, and appending
+    to an LLMUse whose prompts are the whole log just extends the log.  Otherwise (appending to an older
+    snapshot, or updating the system prompt), the prompts are copied to a new log first.
+    """
+    def __init__(self, prompts: Optional[list[dict]] = None, model_name: Optional[str] = None, provider_state: Optional[dict] = None):
+        self._log = MessageLog(list(prompts) if prompts is not None else [])
+        self._length = len(self._log)
+        self.model_name = model_name
+        self.provider_state = provider_state
+
+    @property
+    def prompts(self) -> list[dict]:
+        return self._log.prefix(self._length)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, LLMUse):
+            return NotImplemented
+        return self.model_name == other.model_name and self.prompts == other.prompts
+
+    def __repr__(self) -> str:
+        return f"LLMUse(prompts={self.prompts!r}, model_name={self.model_name!r})"
+
+    def to_dict(self) -> dict:
+        return {"prompts": self.prompts, "model_name": self.model_name, "provider_state": self.provider_state}
+
+    def shares_prefix_with(self, other: "LLMUse") -> bool:
+        """Whether the prompts of `other` are the first prompts of this one, without comparing them."""
+        return self._log is other._log and other._length <= self._length
+
+    def common_prefix_length(self, other: Optional["LLMUse"]) -> int:
+        """Number of first prompts that are the same in `other` and this one.
+
+        O(1) in the usual case where this LLMUse was derived from `other` by appending prompts.
+        """
+        if other is None:
+            return 0
+        if self.shares_prefix_with(other):
+            return other._length
+        length = 0
+        for other_prompt, prompt in zip(other.prompts, self.prompts):
+            if other_prompt != prompt:
+                break
+            length += 1
+        return length
 
     def append_prompt(self, role: str, content: str) -> None:
-        self.prompts.append({"role": role, "content": content})
+        if self._length != len(self._log):
+            # Another LLMUse extended the log past this one, so fork it.
+            self._log = MessageLog(list(self.prompts))
+        self._log.messages.append({"role": role, "content": content})
+        self._length += 1
 
     def append_user_prompt(self, content: str, title: str) -> None:
         # User prompt does not have the title field in the content, so need to add it.
@@ -20,14 +99,26 @@ class LLMUse:
     def set_or_update_system_prompt(self, role: str, content: str) -> None:
         if role != "system":
             raise ValueError("Role must be 'system' to set or update system prompt.")
-        for prompt in self.prompts:
+        prompts = list(self.prompts)
+        for index, prompt in enumerate(prompts):
             if prompt["role"] == "system":
-                prompt["content"] = content
-                return
-        self.prompts.insert(0, {"role": "system", "content": content})
+                prompts[index] = {"role": "system", "content": content}
+                break
+        else:
+            prompts.insert(0, {"role": "system", "content": content})
+        # Earlier snapshots keep the previous system prompt.
+        self._log = MessageLog(prompts)
+        self._length = len(prompts)
+        # The provider has the previous system prompt.
+        self.provider_state = None
 
     def copy(self) -> "LLMUse":
-        return LLMUse(prompts=self.prompts.copy(), model_name=self.model_name)
+        new_llm_use = LLMUse.__new__(LLMUse)
+        new_llm_use._log = self._log
+        new_llm_use._length = self._length
+        new_llm_use.model_name = self.model_name
+        new_llm_use.provider_state = self.provider_state
+        return new_llm_use
 
     def has_title(self, content: str) -> bool:
         # Check if the title field exists in the content
@@ -36,4 +127,4 @@ class LLMUse:
     def add_title(self, content: str, title: str) -> str:
         if self.has_title(content):
             return content
-        return f"<title>{title}</title>\n{content}"
\ No newline at end of file
+        return f"<title>{title}</title>\n{content}"
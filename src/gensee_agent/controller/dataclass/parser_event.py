@@ -0,0 +1,23 @@
+from dataclasses import dataclass
+from typing import Literal, Optional
+
+from gensee_agent.controller.dataclass.tool_use import ToolUse
+
+@dataclass
+class ParserEvent:
+    """An event emitted by the streaming message parser as soon as a tag closes.
+
+    Attributes:
+    type: "title" when </title> closes, "tool_name" when </name> of a tool use closes,
+          "tool_use" when the tool use is complete: when </tool_use> closes, or already when </arguments> closes
+          valid JSON arguments if </tool_use> is a stop sequence (see `StreamingMessageParser`).
+    title (str): The title, for "title" events.
+    tool_name (str): The requested API name, for "tool_name" events.
+    tool_use (ToolUse): The parsed tool use, for "tool_use" events.
+    index (int): Index of the tool use in the message, for "tool_name" and "tool_use" events.
+    """
+    type: Literal["title", "tool_name", "tool_use"]
+    title: Optional[str] = None
+    tool_name: Optional[str] = None
+    tool_use: Optional[ToolUse] = None
+    index: int = 0
@@ -1,6 +1,6 @@
 from dataclasses import dataclass, field
-import random
-import string
+from typing import TypeAlias
+import uuid
 
 from gensee_agent.settings import Settings
 
@@ -19,10 +19,8 @@ class ToolUse:
 
     @classmethod
     def generate_call_id(cls) -> str:
-        chars = ''.join(c for c in string.ascii_uppercase + string.digits
-                   if c not in 'IL10O')
-        random_id = ''.join(random.choices(chars, k=4))
-        return random_id
+        # Unique, since the results of the tool uses of a step are kept by call id.
+        return uuid.uuid4().hex
 
     def tool_name(self) -> str:
         return Settings.SEPARATOR.join(self.api_name.split(Settings.SEPARATOR)[:-1])
@@ -32,3 +30,6 @@ class ToolUse:
 
     def title(self) -> str:
         return f"Tool: {self.api_name} ID: {self.call_id}"
+
+
+ToolUses: TypeAlias = list[ToolUse]
@@ -5,16 +5,23 @@ import json
 import os
 from typing import Any, Optional
 from dataclasses import asdict, is_dataclass
+import orjson
 from redis.asyncio import Redis, RedisCluster
 
 from gensee_agent.utils.configs import BaseConfig, register_configs
 from gensee_agent.utils.logging import configure_logger
+from gensee_agent.controller.dataclass.llm_response import SingleLLMResponse
 from gensee_agent.controller.dataclass.llm_use import LLMUse
+from gensee_agent.controller.history_writer import HistoryWriter
+from gensee_agent.history_backends.base import BaseSessionStore, get_history_backend
+from gensee_agent.history_backends.redis_backend import RedisSessionStore
 
 logger = configure_logger(__name__)
 
 class CustomJSONEncoder(json.JSONEncoder):
     def default(self, o):
+        if isinstance(o, LLMUse):
+            return o.to_dict()
         # Handle dataclasses
         if is_dataclass(o) and not isinstance(o, type):
             return asdict(o)
@@ -24,13 +31,25 @@ class CustomJSONEncoder(json.JSONEncoder):
         # Handle other types by converting to string
         return str(o)
 
+def _orjson_default(o: Any) -> Any:
+    # Same fallbacks as CustomJSONEncoder.  orjson already handles dataclasses.
+    if isinstance(o, LLMUse):
+        return o.to_dict()
+    if hasattr(o, '__dict__'):
+        return o.__dict__
+    return str(o)
+
 class HistoryManager:
 
     @register_configs("history_manager")
     class Config(BaseConfig):
-        history_dump_path: Optional[str] = None  # Path to dump history, if needed.
+        history_dump_path: Optional[str] = None  # Path to dump history as JSONL (one line per entry, appended), if needed.
+        backend: Optional[str] = None  # History backend storing the sessions ("redis", "sqlite"), used unless a redis_client is given.  None to not store them.
+        redis_key_prefix: str = "gensee"  # Prefix of the Redis keys of the sessions, when a redis_client is given.
+        session_ttl_seconds: Optional[int] = None  # Expire stored sessions after this many seconds without update.  None to keep them.
 
-    def __init__(self, config: dict, session_id: Optional[str] = None, redis_client: Optional[Redis | RedisCluster] = None):
+    def __init__(self, config: dict, session_id: Optional[str] = None, redis_client: Optional[Redis | RedisCluster] = None,
+                 history_writer: Optional[HistoryWriter] = None):
         self.config = self.Config.from_dict(config)
         if self.config.history_dump_path is not None:
             # Add the current timestamp to the dump path to avoid overwriting
@@ -41,7 +60,21 @@ class HistoryManager:
 
         self.redis_client = redis_client
         self.session_id = session_id
+        self.history_writer = history_writer  # If set, writes are queued there instead of done inline.
+        self.session_store: Optional[BaseSessionStore]
+        if session_id is None:
+            self.session_store = None
+        elif redis_client is not None:
+            self.session_store = RedisSessionStore(
+                redis_client, session_id, key_prefix=self.config.redis_key_prefix, ttl_seconds=self.config.session_ttl_seconds)
+        elif self.config.backend is not None:
+            self.session_store = get_history_backend(self.config.backend, config).session_store(
+                session_id, ttl_seconds=self.config.session_ttl_seconds)
+        else:
+            self.session_store = None
         self.history = []
+        self._dumped_llm_use: Optional[LLMUse] = None  # Snapshot of the last dumped llm_use entry.
+        self.llm_usages: list[dict] = []  # Usage of each LLM call of the task, with the title of its response.
 
     async def add_entry(self, name: str, title: str, entry: Any):
         history_entry = {
@@ -50,60 +83,146 @@ class HistoryManager:
             "entry": entry
         }
         self.history.append(history_entry)
+        if name in ("llm_response", "summary"):
+            self._record_usage(title, entry)
         if self.dump_path is not None:
-            async with aiofiles.open(self.dump_path, "w") as f:
-                await f.write(json.dumps(self.history, indent=2, cls=CustomJSONEncoder))
-        if self.redis_client is not None and self.session_id is not None:
+            if self.history_writer is not None:
+                self.history_writer.append_dump(self.dump_path, self._dump_line(history_entry))
+            else:
+                async with aiofiles.open(self.dump_path, "ab") as f:
+                    await f.write(self._dump_line(history_entry))
+        if self.session_store is not None:
             # Only need to store the last entry for "llm_use" type in Redis
             if name == "llm_use":
-                await self.redis_client.set(self.session_id, json.dumps(history_entry, cls=CustomJSONEncoder, separators=(',', ':'), indent=None) + "\n")
+                if self.history_writer is not None:
+                    self.history_writer.save_session(self.session_store, title, entry)
+                else:
+                    await self.session_store.save(title, entry)
+
+    def _record_usage(self, title: str, responses: Any):
+        for response in responses:
+            if isinstance(response, SingleLLMResponse) and response.usage is not None:
+                self.llm_usages.append({"title": title, **asdict(response.usage)})
+
+    def usage_summary(self) -> dict:
+        """Totals of the LLM calls of the task, and the usage of each call."""
+        prompt_tokens = sum(usage["prompt_tokens"] for usage in self.llm_usages)
+        cached_prompt_tokens = sum(usage["cached_prompt_tokens"] for usage in self.llm_usages)
+        costs = [usage["cost"] for usage in self.llm_usages if usage["cost"] is not None]
+        return {
+            "llm_calls": len(self.llm_usages),
+            "cached_responses": sum(1 for usage in self.llm_usages if usage["cached"]),
+            "prompt_tokens": prompt_tokens,
+            "cached_prompt_tokens": cached_prompt_tokens,
+            "output_tokens": sum(usage["output_tokens"] for usage in self.llm_usages),
+            "prefix_cache_hit_ratio": cached_prompt_tokens / prompt_tokens if prompt_tokens else 0.0,
+            "latency_seconds": sum(usage["latency_seconds"] for usage in self.llm_usages),
+            "cost": sum(costs) if costs else None,
+            "calls": list(self.llm_usages),
+        }
+
+    async def flush(self):
+        """Wait until the entries added so far are persisted."""
+        if self.history_writer is not None:
+            await self.history_writer.flush()
+
+    def _dump_line(self, history_entry: dict) -> bytes:
+        """Serialize one entry as a line of the JSONL dump.
+
+        `llm_use` entries are stored as a delta against the previous `llm_use` entry: the number of prompts kept
+        from it ("keep"), followed by the new prompts.  Consecutive entries usually only append prompts, so the
+        size of a line doesn't grow with the length of the conversation.
+        """
+        if history_entry["name"] != "llm_use" or not isinstance(history_entry["entry"], LLMUse):
+            return orjson.dumps(history_entry, default=_orjson_default, option=orjson.OPT_APPEND_NEWLINE)
+        llm_use = history_entry["entry"]
+        keep = llm_use.common_prefix_length(self._dumped_llm_use)
+        self._dumped_llm_use = llm_use.copy()
+        delta = {
+            "keep": keep,
+            "prompts": llm_use.prompts[keep:],
+            "model_name": llm_use.model_name,
+            "provider_state": llm_use.provider_state,
+        }
+        return orjson.dumps({"name": "llm_use", "title": history_entry["title"], "delta": delta},
+                            default=_orjson_default, option=orjson.OPT_APPEND_NEWLINE)
+
+    @staticmethod
+    def load_dump(dump_path: str) -> list[dict]:
+        """Rebuild the history from a JSONL dump written by `add_entry`.
+
+        `llm_use` entries are restored as LLMUse objects.  Other entries are plain dicts / lists, as serialized.
+        """
+        history = []
+        llm_use: Optional[LLMUse] = None
+        with open(dump_path, "rb") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = orjson.loads(line)
+                if "delta" in record:
+                    delta = record.pop("delta")
+                    if llm_use is not None and delta["keep"] == len(llm_use):
+                        # Share the prompts with the previous entry, as in the live history.
+                        llm_use = llm_use.copy()
+                        llm_use.model_name = delta["model_name"]
+                        llm_use.provider_state = delta.get("provider_state")
+                    else:
+                        kept_prompts = llm_use.prompts[:delta["keep"]] if llm_use is not None else []
+                        llm_use = LLMUse(prompts=kept_prompts, model_name=delta["model_name"], provider_state=delta.get("provider_state"))
+                    for prompt in delta["prompts"]:
+                        llm_use.append_prompt(prompt["role"], prompt["content"])
+                    record["entry"] = llm_use
+                history.append(record)
+        return history
+
+    @classmethod
+    def from_dump(cls, config: dict, dump_path: str, session_id: Optional[str] = None) -> "HistoryManager":
+        """Create a history manager with the history of a JSONL dump, e.g., to inspect or resume a session offline."""
+        self = cls(config, session_id=session_id)
+        self.history = cls.load_dump(dump_path)
+        return self
 
     async def get_history(self) -> Optional[dict]:
         """
         Return value: dict of "name", "title", and "entry".  Entry will be a plain dict, not LLMUse class.
         """
-        if self.redis_client is None or self.session_id is None:
+        if self.session_store is None:
+            return None
+        await self.flush()
+        stored = await self.session_store.load()
+        if stored is None:
             return None
-        raise NotImplementedError("get_history is deprecated and not implemented.  Currently it doesn't handle model_name properly.  Needs to reimplement.")
-        # data = await self.redis_client.get(self.session_id)
-        # if data is None:
-        #     return None
-        # history_entry = json.loads(data)
-        # logger.info(f"Loaded history for session_id {self.session_id}")
-        # return history_entry
+        title, llm_use = stored
+        return {"name": "llm_use", "title": title, "entry": llm_use.to_dict()}
 
     async def read_history(self) -> bool:
         """
         Returns True if history exists and is loaded, False otherwise.
         """
-        history_entry = await self.get_history()
-        if history_entry is None:
+        if self.session_store is None:
             return False
-        raise NotImplementedError("read_history is deprecated and not implemented.  Currently it doesn't handle model_name properly.  Needs to reimplement.")
-        # if history_entry is not None:
-        #     history_entry["entry"] = LLMUse(**history_entry["entry"])
-        #     self.history = [history_entry]
-        #     return True
-        # return False
+        await self.flush()
+        stored = await self.session_store.load()
+        if stored is None:
+            return False
+        title, llm_use = stored
+        self.history = [{"name": "llm_use", "title": title, "entry": llm_use}]
+        return True
 
     async def set_history(self, history: dict, model_name: Optional[str] = None):
         """
         history: dict of "name", "title", and "entry".  Entry will be a plain dict, not LLMUse class.
         """
-        if self.redis_client is None or self.session_id is None:
+        if self.session_store is None:
+            return
+        if await self.get_history() is not None:
+            # Don't overwrite existing history
             return
-        raise NotImplementedError("set_history is deprecated and not implemented.  Currently it doesn't handle model_name properly.  Needs to reimplement.")
-        # if await self.get_history() is not None:
-        #     # Don't overwrite existing history
-        #     return
-        # if self.redis_client is not None and self.session_id is not None:
-        #     response = await self.redis_client.set(self.session_id, json.dumps(history, separators=(',', ':'), indent=None) + "\n")
-        #     if not response:
-        #         logger.error(f"Failed to set history for session_id {self.session_id}")
-        #     else:
-        #         logger.info(f"Set history for session_id {self.session_id}")
-        # history["entry"] = LLMUse(**history["entry"], model_name=model_name)
-        # self.history = [history]
+        llm_use = LLMUse(prompts=history["entry"]["prompts"], model_name=model_name, provider_state=history["entry"].get("provider_state"))
+        await self.session_store.save(history["title"], llm_use)
+        logger.info(f"Set history for session_id {self.session_id}")
+        self.history = [{"name": history["name"], "title": history["title"], "entry": llm_use}]
 
     def get_last_entry_of_type(self, name: str) -> Any:
         for record in reversed(self.history):
@@ -0,0 +1,192 @@
+import asyncio
+import time
+from typing import Optional
+
+import aiofiles
+
+from gensee_agent.controller.dataclass.llm_use import LLMUse
+from gensee_agent.history_backends.base import BaseSessionStore, SessionSave
+from gensee_agent.utils.configs import BaseConfig, register_configs
+from gensee_agent.utils.logging import configure_logger
+
+logger = configure_logger(__name__)
+
+class HistoryWriter:
+    """Write-behind persistence of history entries, shared by all the sessions of a controller.
+
+    `HistoryManager.add_entry` only queues its writes here and returns, so storage latency is not added to the
+    agent steps.  A background task flushes the queue when it reaches `max_pending_entries` or every
+    `flush_interval_seconds`:
+    - Dump lines are appended with one write per dump file.
+    - Sessions saved several times since the last flush are only saved once, with their latest `llm_use`
+      (the prompts appended in between are still all pushed, since the store sends the delta from what it stored).
+      The saves are batched by the session stores, e.g., one Redis pipeline per client, one SQLite transaction.
+
+    `flush()` waits until everything queued so far is written, and `shutdown()` flushes and stops the task.
+
+    Failed writes are retried by the next flushes, with an exponential backoff while the storage keeps failing.
+    They are dropped, counted in `dropped_entries` and logged, after `max_retries` consecutive failed flushes, or
+    when the queued dump lines exceed `max_pending_bytes`, so that a storage outage does not exhaust the memory.
+    """
+
+    @register_configs("history_writer")
+    class Config(BaseConfig):
+        enabled: bool = False  # Whether to persist history in the background instead of inline in each step.
+        flush_interval_seconds: float = 0.05  # Max time an entry waits before being written.
+        max_pending_entries: int = 256  # Flush right away when this many entries are waiting.
+        max_retries: int = 8  # Consecutive failed flushes after which the failed writes are dropped.
+        retry_base_delay_seconds: float = 0.1  # Delay before retrying after the first failed flush, doubled after each next one.
+        retry_max_delay_seconds: float = 30.0  # Max delay between retries.
+        max_pending_bytes: int = 64 * 1024 * 1024  # Max size of the queued dump lines.  Failed writes over it are dropped.
+
+    def __init__(self, config: dict):
+        self.config = self.Config.from_dict(config)
+        self.pending_dump_lines: dict[str, list[bytes]] = {}  # Lines to append, by dump path.
+        self.pending_saves: dict[int, SessionSave] = {}  # Latest llm_use to save, by id of the store.
+        self.pending_count = 0
+        self.pending_bytes = 0  # Size of the queued dump lines.
+        self.consecutive_failures = 0  # Failed flushes since the last successful one.
+        self.flush_lock = asyncio.Lock()
+        self.wakeup = asyncio.Event()
+        self.flush_task: Optional[asyncio.Task] = None
+        self.writer_stats = {
+            "entries": 0,  # Writes queued.
+            "coalesced_saves": 0,  # Session saves skipped because a later save of the same session was queued.
+            "flushes": 0,
+            "write_errors": 0,
+            "dropped_entries": 0,  # Failed writes given up on.
+            "max_flush_seconds": 0.0,
+        }
+
+    def append_dump(self, dump_path: str, line: bytes):
+        self.pending_dump_lines.setdefault(dump_path, []).append(line)
+        self.pending_bytes += len(line)
+        self._queued()
+
+    def save_session(self, session_store: BaseSessionStore, title: str, llm_use: LLMUse):
+        if id(session_store) in self.pending_saves:
+            self.writer_stats["coalesced_saves"] += 1
+        self.pending_saves[id(session_store)] = (session_store, title, llm_use.copy())
+        self._queued()
+
+    def _queued(self):
+        self.pending_count += 1
+        self.writer_stats["entries"] += 1
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self._flush_loop())
+        if self.pending_count >= self.config.max_pending_entries:
+            self.wakeup.set()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.config.flush_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            if self.pending_count == 0:
+                continue
+            try:
+                # Shielded, so that shutdown() does not interrupt a flush halfway.
+                await asyncio.shield(self.flush())
+            except Exception as e:
+                # Already counted and logged.  The failed writes are queued again, so the next flush retries them.
+                logger.debug(f"Background history flush failed: {e}")
+                await asyncio.sleep(min(self.config.retry_max_delay_seconds,
+                                        self.config.retry_base_delay_seconds * 2 ** (self.consecutive_failures - 1)))
+
+    async def flush(self):
+        """Write everything queued so far.
+
+        Failed writes are queued again, in order, for the next flush: llm_use dump lines are deltas of the previous
+        line, so a dropped line would break the loading of every later one.  Errors are still raised, so that
+        callers know their history is not durable yet.
+        """
+        async with self.flush_lock:
+            dump_lines, self.pending_dump_lines = self.pending_dump_lines, {}
+            saves, self.pending_saves = self.pending_saves, {}
+            self.pending_count = 0
+            self.pending_bytes = 0
+            if not dump_lines and not saves:
+                return
+            start = time.perf_counter()
+            save_groups = self._group_by_store_class(saves.values())
+            results = await asyncio.gather(
+                *(self._write_dump(dump_path, lines) for dump_path, lines in dump_lines.items()),
+                *(self._write_saves(group) for group in save_groups),
+                return_exceptions=True,
+            )
+            elapsed = time.perf_counter() - start
+            self.writer_stats["flushes"] += 1
+            self.writer_stats["max_flush_seconds"] = max(self.writer_stats["max_flush_seconds"], elapsed)
+            errors = [result for result in results if isinstance(result, BaseException)]
+            if not errors:
+                self.consecutive_failures = 0
+            else:
+                self.consecutive_failures += 1
+                self._requeue(dump_lines, save_groups, results)
+                self.writer_stats["write_errors"] += len(errors)
+                for error in errors:
+                    logger.error(f"Failed to write history: {error}")
+                raise errors[0]
+
+    def _requeue(self, dump_lines: dict[str, list[bytes]], save_groups: list[list[SessionSave]], results: list):
+        """Queue the failed writes of a flush again, before what was queued during the flush, unless they are over
+        the limits."""
+        give_up = self.consecutive_failures >= self.config.max_retries
+        dump_results, save_results = results[:len(dump_lines)], results[len(dump_lines):]
+        for (dump_path, lines), result in zip(dump_lines.items(), dump_results):
+            if isinstance(result, BaseException):
+                size = sum(len(line) for line in lines)
+                if give_up or self.pending_bytes + size > self.config.max_pending_bytes:
+                    # The later llm_use lines of the dump are deltas of the dropped ones, so it cannot be fully loaded.
+                    self._drop(len(lines), f"{len(lines)} lines of history dump {dump_path}")
+                    continue
+                self.pending_dump_lines[dump_path] = lines + self.pending_dump_lines.get(dump_path, [])
+                self.pending_count += len(lines)
+                self.pending_bytes += size
+        for group, result in zip(save_groups, save_results):
+            if isinstance(result, BaseException):
+                for save in group:
+                    # A save of the same session queued since then has a later llm_use, and supersedes this one.
+                    if id(save[0]) in self.pending_saves:
+                        continue
+                    if give_up:
+                        # The store forgot what it stored after the failure, so its next save rewrites the whole session.
+                        self._drop(1, f"save of session store {type(save[0]).__name__}")
+                        continue
+                    self.pending_saves[id(save[0])] = save
+                    self.pending_count += 1
+
+    def _drop(self, count: int, description: str):
+        self.writer_stats["dropped_entries"] += count
+        logger.error(f"Dropped {description} after {self.consecutive_failures} failed flushes, {self.pending_bytes} bytes queued")
+
+    def _group_by_store_class(self, saves) -> list[list[SessionSave]]:
+        groups: dict[type, list[SessionSave]] = {}
+        for save in saves:
+            groups.setdefault(type(save[0]), []).append(save)
+        return list(groups.values())
+
+    async def _write_dump(self, dump_path: str, lines: list[bytes]):
+        async with aiofiles.open(dump_path, "ab") as f:
+            await f.write(b"".join(lines))
+
+    async def _write_saves(self, saves: list[SessionSave]):
+        # Each store class batches the writes of its sessions, e.g., one Redis pipeline per client.
+        await type(saves[0][0]).save_many(saves)
+
+    async def shutdown(self):
+        """Flush everything queued and stop the background task."""
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            try:
+                await self.flush_task
+            except asyncio.CancelledError:
+                pass
+            self.flush_task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {"writes": dict(self.writer_stats), "pending_entries": self.pending_count, "pending_bytes": self.pending_bytes,
+                "consecutive_failures": self.consecutive_failures}
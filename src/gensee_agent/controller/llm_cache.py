@@ -0,0 +1,154 @@
+from collections import OrderedDict
+from dataclasses import asdict, field
+import hashlib
+import os
+import time
+from typing import Literal, Optional
+
+import aiofiles
+import orjson
+from redis.asyncio import Redis
+
+from gensee_agent.controller.dataclass.llm_response import LLMResponses, SingleLLMResponse
+from gensee_agent.utils.configs import BaseConfig, register_configs
+from gensee_agent.utils.logging import configure_logger
+
+logger = configure_logger(__name__)
+
+CacheMode = Literal["use", "bypass"]  # "bypass" neither reads nor writes the cache for that call.
+
+class LLMCache:
+    """Exact-match cache of LLM completions, keyed by a hash of the model name, the messages, the stop sequences
+    and the native tools.
+
+    Entries live in an in-memory LRU, and optionally in a second tier ("disk": one file per entry, "redis") that
+    survives restarts and is shared between processes.  A hit in the second tier is copied to memory.
+    """
+
+    @register_configs("llm_cache")
+    class Config(BaseConfig):
+        enabled: bool = False  # Whether to cache LLM completions.
+        max_entries: int = 1024  # Max number of entries of the in-memory tier.
+        ttl_seconds: Optional[float] = 3600  # Default time to live of an entry.  None to never expire.
+        model_ttl_seconds: dict[str, float] = field(default_factory=dict)  # TTL by model name, overriding ttl_seconds.  0 to not cache a model.
+        tier: Optional[Literal["disk", "redis"]] = None  # Second tier, shared between processes.  None for memory only.
+        disk_path: str = ".llm_cache"  # Directory of the disk tier.
+        redis_url: str = "redis://localhost:6379/0"  # Server of the Redis tier.
+        redis_key_prefix: str = "gensee:llm_cache"  # Prefix of the keys of the Redis tier.
+
+    def __init__(self, config: dict):
+        self.config = self.Config.from_dict(config)
+        self.entries: OrderedDict[str, tuple[Optional[float], LLMResponses]] = OrderedDict()  # (expires_at, responses) by key.
+        self.redis_client: Optional[Redis] = None
+        if self.config.enabled and self.config.tier == "redis":
+            self.redis_client = Redis.from_url(self.config.redis_url)
+        elif self.config.enabled and self.config.tier == "disk":
+            os.makedirs(self.config.disk_path, exist_ok=True)
+        self.cache_stats = {
+            "hits": 0,
+            "memory_hits": 0,
+            "tier_hits": 0,
+            "misses": 0,
+            "bypasses": 0,
+            "stores": 0,
+        }
+
+    def key(self, model_name: str, prompts: list[dict], stop: Optional[list[str]], tools: Optional[list[dict]] = None) -> str:
+        request = {"model_name": model_name, "prompts": prompts, "stop": stop}
+        if tools:
+            # Only set with native tool calls, so that the keys of the other calls stay the same.
+            request["tools"] = tools
+        data = orjson.dumps(request, option=orjson.OPT_SORT_KEYS)
+        return hashlib.sha256(data).hexdigest()
+
+    def is_active(self, model_name: str, mode: CacheMode) -> bool:
+        """Whether the cache applies to a call.  Counts bypassed calls."""
+        if not self.config.enabled:
+            return False
+        if mode == "bypass":
+            self.cache_stats["bypasses"] += 1
+            return False
+        return self._ttl(model_name) != 0
+
+    async def get(self, key: str) -> Optional[LLMResponses]:
+        now = time.time()
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires_at, responses = entry
+            if expires_at is None or expires_at > now:
+                self.entries.move_to_end(key)
+                self.cache_stats["hits"] += 1
+                self.cache_stats["memory_hits"] += 1
+                return responses
+            del self.entries[key]
+        stored = await self._tier_get(key)
+        if stored is not None and (stored["expires_at"] is None or stored["expires_at"] > now):
+            # The usage of the original call is not restored: LLMManager reports a cached call instead.
+            responses = [SingleLLMResponse(**{**response, "usage": None}) for response in stored["responses"]]
+            self._memory_set(key, stored["expires_at"], responses)
+            self.cache_stats["hits"] += 1
+            self.cache_stats["tier_hits"] += 1
+            return responses
+        self.cache_stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, model_name: str, responses: LLMResponses):
+        ttl = self._ttl(model_name)
+        expires_at = time.time() + ttl if ttl is not None else None
+        self._memory_set(key, expires_at, responses)
+        self.cache_stats["stores"] += 1
+        try:
+            await self._tier_set(key, ttl, {"expires_at": expires_at, "responses": [asdict(response) for response in responses]})
+        except Exception as e:
+            # The cache is an optimization, so failing to fill the second tier is not an error of the call.
+            logger.warning(f"Failed to store LLM response in the {self.config.tier} cache: {e}")
+
+    def _ttl(self, model_name: str) -> Optional[float]:
+        return self.config.model_ttl_seconds.get(model_name, self.config.ttl_seconds)
+
+    def _memory_set(self, key: str, expires_at: Optional[float], responses: LLMResponses):
+        self.entries[key] = (expires_at, responses)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.config.max_entries:
+            self.entries.popitem(last=False)
+
+    async def _tier_get(self, key: str) -> Optional[dict]:
+        try:
+            if self.config.tier == "redis" and self.redis_client is not None:
+                data = await self.redis_client.get(f"{self.config.redis_key_prefix}:{key}")
+                return orjson.loads(data) if data is not None else None
+            if self.config.tier == "disk":
+                path = self._disk_path(key)
+                if not os.path.exists(path):
+                    return None
+                async with aiofiles.open(path, "rb") as f:
+                    stored = orjson.loads(await f.read())
+                if stored["expires_at"] is not None and stored["expires_at"] <= time.time():
+                    os.remove(path)
+                    return None
+                return stored
+        except Exception as e:
+            logger.warning(f"Failed to read LLM response from the {self.config.tier} cache: {e}")
+        return None
+
+    async def _tier_set(self, key: str, ttl: Optional[float], stored: dict):
+        if self.config.tier == "redis" and self.redis_client is not None:
+            await self.redis_client.set(f"{self.config.redis_key_prefix}:{key}", orjson.dumps(stored), ex=max(1, int(ttl)) if ttl is not None else None)
+        elif self.config.tier == "disk":
+            path = self._disk_path(key)
+            # Write then rename, so that concurrent readers never see a partial file.
+            temporary_path = f"{path}.{os.getpid()}.tmp"
+            async with aiofiles.open(temporary_path, "wb") as f:
+                await f.write(orjson.dumps(stored))
+            os.replace(temporary_path, path)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.config.disk_path, f"{key}.json")
+
+    async def aclose(self):
+        if self.redis_client is not None:
+            await self.redis_client.aclose()
+
+    def stats(self) -> dict:
+        lookups = self.cache_stats["hits"] + self.cache_stats["misses"]
+        return {**self.cache_stats, "hit_ratio": self.cache_stats["hits"] / lookups if lookups else 0.0, "entries": len(self.entries)}
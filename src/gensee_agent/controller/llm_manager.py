@@ -1,18 +1,39 @@
-from typing import AsyncGenerator
+import asyncio
+import dataclasses
+from dataclasses import field
+import time
+from typing import Any, AsyncGenerator, Optional
 from gensee_agent.utils.configs import BaseConfig, register_configs
-from gensee_agent.controller.dataclass.llm_response import LLMResponses
+from gensee_agent.controller.dataclass.llm_response import LLMResponses, LLMUsage, SingleLLMResponse
 from gensee_agent.controller.dataclass.llm_use import LLMUse
+from gensee_agent.controller.llm_cache import CacheMode, LLMCache
+from gensee_agent.controller.message_handler import MessageHandler
+from gensee_agent.controller.llm_router import LLMRouter
+from gensee_agent.controller.message_parser import StreamingMessageParser
+from gensee_agent.controller.rate_limiter import RateLimiter
+from gensee_agent.controller.recording import Recorder
 from gensee_agent.models.base import _MODEL_REGISTRY
+from gensee_agent.models.client_pool import ProviderClients, close_provider_clients
 from gensee_agent.utils.logging import configure_logger
+from gensee_agent.utils.tokens import estimate_tokens
 
 logger = configure_logger(__name__)
 
+TOOL_USE_STOP_SEQUENCE = "</tool_use>"
+
 class LLMManager:
     @register_configs("llm_manager")
     class Config(BaseConfig):
         available_models: list[str]  # List of available model names.
         default_model: str  # Default model name.
-        streaming: bool = False  # Whether to enable streaming mode.
+        streaming: bool = False  # Whether to enable streaming mode.  If disabled, completion_stream() yields the complete response at once.
+        stop_at_tool_use: bool = True  # Whether to stop the LLM output right after </tool_use> when tools are active.
+        # Whether to declare the tools to the provider and read its structured tool calls, instead of describing the tools
+        # in the system prompt.  Tool uses written as <tool_use> blocks in the text are still parsed.
+        native_tool_calls: bool = False
+        # USD per million tokens by model name, e.g., {"openai:gpt-5": {"prompt": 1.25, "cached_prompt": 0.125, "output": 10.0}}.
+        # "cached_prompt" defaults to the "prompt" price.  Models without prices get no cost.
+        prices_per_million_tokens: dict[str, dict[str, float]] = field(default_factory=dict)
 
         def __post_init__(self):
             if self.default_model not in self.available_models:
@@ -21,27 +42,361 @@ class LLMManager:
                 if model_name not in _MODEL_REGISTRY:
                     raise ValueError(f"Model {model_name} is not registered in the model registry.")
 
-    def __init__(self, config: dict):
+    def __init__(self, config: dict, recorder: Optional[Recorder] = None):
         self.config = self.Config.from_dict(config)
+        self.raw_config = config
+        self.recorder = recorder if recorder is not None and recorder.enabled else None  # Records the provider calls, to replay them offline.
         self.models = {
             model_name: _MODEL_REGISTRY[model_name](model_name, config)
             for model_name in self.config.available_models
         }
+        if self.config.native_tool_calls:
+            unsupported = [model_name for model_name, model in self.models.items() if not model.supports_native_tool_calls]
+            if unsupported:
+                raise ValueError(f"Models {unsupported} do not support native tool calls.")
+        self.message_handler = MessageHandler(config)
+        self.cache = LLMCache(config)
+        self.router = LLMRouter(config, self.config.available_models)
+        self.rate_limiter = RateLimiter(config)
+        self.stop_stats = {
+            "requests_with_stop": 0,  # Requests sent with stop sequences.
+            "stopped_responses": 0,  # Responses cut by the provider at a stop sequence.
+            "truncated_responses": 0,  # Responses cut on the client side, for providers without stop sequence support.
+            "discarded_output_tokens": 0,  # Estimated output tokens generated after a stop sequence and thrown away.
+            # Baseline of the savings: responses the provider did not stop at </tool_use>, and the text they have after it.
+            "observed_tool_uses": 0,
+            "observed_trailers": 0,  # Those with text after </tool_use>.
+            "observed_trailer_tokens": 0,  # Estimated output tokens of that text.
+        }
+
+    def default_stop_sequences(self, use_tool: bool, parallel_tool_use: bool, native_tool_calls: bool = False) -> Optional[list[str]]:
+        """Stop sequences to use for a task.
+
+        The output is cut after </tool_use> when tools are active, since anything after it (typically made-up
+        tool results) is thrown away.  This is not possible when several tool uses per message are allowed.
+        Native tool calls need none: the provider ends the response at the calls, and cutting the <tool_use> blocks
+        rendered from them would make the response differ from the one the provider keeps (see `provider_state`).
+        """
+        if use_tool and not parallel_tool_use and not native_tool_calls and self.config.stop_at_tool_use:
+            return [TOOL_USE_STOP_SEQUENCE]
+        return None
+
+    async def completion(self, llm_use: LLMUse, stop: Optional[list[str]] = None, cache: CacheMode = "use", priority: int = 0,
+                         tools: Optional[list[dict]] = None, parallel_tool_calls: bool = True) -> LLMResponses:
+        """Complete `llm_use`.  `priority` orders the requests waiting for the rate limits of the model, lower first.
 
-    async def completion(self, llm_use: LLMUse) -> LLMResponses:
+        `tools` are declared to the provider as native tools (see `ToolManager.get_tool_specs()`).  Their calls are
+        rendered as <tool_use> blocks in the content.  Without `parallel_tool_calls`, the provider is asked for at
+        most one call per response.
+        """
         model_name = llm_use.model_name or self.config.default_model
         if model_name not in self.models:
             raise ValueError(f"Model {model_name} is not available. Available models: {self.config.available_models}")
-        model = self.models[model_name]
         logger.info(f"LLMUse Prompts: {llm_use.prompts}")
-        raw_response = await model.completion(llm_use.prompts)
+        start = time.perf_counter()
+        cache_key = None
+        if self.cache.is_active(model_name, cache):
+            cache_key = self.cache.key(model_name, llm_use.prompts, stop, tools)
+            cached_responses = await self.cache.get(cache_key)
+            if cached_responses is not None:
+                logger.info(f"Cached response: {cached_responses}")
+                return self._with_usage(cached_responses, LLMUsage(model_name=model_name, latency_seconds=time.perf_counter() - start, cost=0.0, cached=True))
+        if stop:
+            self.stop_stats["requests_with_stop"] += 1
+        reserved_tokens = self.rate_limiter.estimate_tokens(llm_use.prompts)
+        routed_model_name, raw_response = await self.router.run(
+            model_name, lambda name: self._provider_completion(name, llm_use, stop, tools, parallel_tool_calls, reserved_tokens, priority))
+        model = self.models[routed_model_name]
         logger.info(f"Raw response: {raw_response}")
-        return model.to_llm_responses(raw_response)
-
-    # async def completion_stream(self, llm_use: LLMUse) -> AsyncGenerator[LLMResponses, None]:
-    #     model_name = llm_use.model_name or self.config.default_model
-    #     if model_name not in self.models:
-    #         raise ValueError(f"Model {model_name} is not available. Available models: {self.config.available_models}")
-    #     model = self.models[model_name]
-    #     async for chunk in model.completion_stream(llm_use.prompts):
-    #         yield model.to_llm_responses(chunk)
\ No newline at end of file
+        usage = model.to_llm_usage(raw_response) or LLMUsage()
+        self.rate_limiter.settle(routed_model_name, reserved_tokens, usage)
+        usage.model_name = routed_model_name
+        usage.latency_seconds = time.perf_counter() - start
+        usage.cost = self._cost(routed_model_name, usage)
+        model_responses = model.to_llm_responses(raw_response)
+        responses = self._apply_stop_sequences(model_responses, stop)
+        if responses == model_responses:
+            responses = self._with_provider_state(responses, routed_model_name, llm_use, model.to_provider_state(raw_response))
+        responses = self._with_usage(responses, usage)
+        if self.recorder is not None:
+            await self.recorder.record_llm(llm_use.prompts, stop, routed_model_name, responses, usage)
+        if cache_key is not None:
+            await self.cache.set(cache_key, model_name, responses)
+        return responses
+
+    async def completion_stream(self, llm_use: LLMUse, parser: Optional[StreamingMessageParser] = None,
+                                stop: Optional[list[str]] = None, cache: CacheMode = "use", priority: int = 0,
+                                tools: Optional[list[dict]] = None, parallel_tool_calls: bool = True) -> AsyncGenerator[LLMResponses, None]:
+        """Stream the completion of `llm_use`.
+
+        Yields partial responses (`partial=True`) carrying only the new content of each provider chunk,
+        and finally the complete responses assembled from all chunks (`partial=False`).
+
+        If `parser` is given, it is fed with the content of the first response as it arrives, so its events
+        are available to the caller after each yield.  Its title is also used for the assembled response.
+        A cached response is yielded at once, as in non-streaming mode.
+        """
+        model_name = llm_use.model_name or self.config.default_model
+        start = time.perf_counter()
+        cache_key = None
+        if self.config.streaming and self.cache.is_active(model_name, cache):
+            cache_key = self.cache.key(model_name, llm_use.prompts, stop, tools)
+            cached_responses = await self.cache.get(cache_key)
+            if cached_responses is not None:
+                logger.info(f"Cached response (streaming): {cached_responses}")
+                cached_responses = self._with_usage(cached_responses, LLMUsage(model_name=model_name, latency_seconds=time.perf_counter() - start, cost=0.0, cached=True))
+                if parser is not None and cached_responses and cached_responses[0].content:
+                    parser.feed(cached_responses[0].content)
+                    parser.close()
+                yield cached_responses
+                return
+        if not self.config.streaming:
+            responses = await self.completion(llm_use, stop=stop, cache=cache, priority=priority, tools=tools,
+                                             parallel_tool_calls=parallel_tool_calls)
+            if parser is not None and responses and responses[0].content:
+                parser.feed(responses[0].content)
+                parser.close()
+            yield responses
+            return
+        if model_name not in self.models:
+            raise ValueError(f"Model {model_name} is not available. Available models: {self.config.available_models}")
+        logger.info(f"LLMUse Prompts (streaming): {llm_use.prompts}")
+        if stop:
+            self.stop_stats["requests_with_stop"] += 1
+        reserved_tokens = self.rate_limiter.estimate_tokens(llm_use.prompts)
+        routed_model_name, stream = await self.router.run(
+            model_name, lambda name: self._provider_stream(name, llm_use, stop, tools, parallel_tool_calls, reserved_tokens, priority),
+            kind="stream", discard=lambda stream: stream.aclose())
+        model = self.models[routed_model_name]
+        # Providers without stop sequence support are cut on the client side, by closing the stream.
+        client_side_stop = stop if stop and not model.supports_stop_sequences else None
+        stop_tail = ""  # End of the first response, long enough to find a stop sequence split across chunks.
+        stopped = False
+        contents: list[list[str]] = []
+        finish_reasons: list[str] = []
+        usage: Optional[LLMUsage] = None
+        provider_state: Optional[dict] = None
+        first_token_seconds: Optional[float] = None
+        try:
+            async for chunk in stream:
+                usage = model.to_llm_usage(chunk) or usage
+                provider_state = model.to_provider_state(chunk) or provider_state
+                partial_responses = model.to_partial_llm_responses(chunk)
+                if first_token_seconds is None and any(partial_response.content for partial_response in partial_responses):
+                    first_token_seconds = time.perf_counter() - start
+                for index, partial_response in enumerate(partial_responses):
+                    if index >= len(contents):
+                        contents.append([])
+                        finish_reasons.append("unknown")
+                    if index == 0 and client_side_stop and partial_response.content:
+                        cut = self._find_stop_sequence(stop_tail + partial_response.content, client_side_stop)
+                        if cut is not None:
+                            kept = max(0, cut - len(stop_tail))
+                            partial_response = dataclasses.replace(partial_response, content=partial_response.content[:kept], finish_reason="stop")
+                            partial_responses[index] = partial_response
+                            stopped = True
+                            self.stop_stats["truncated_responses"] += 1
+                        else:
+                            stop_tail = (stop_tail + partial_response.content)[-max(len(s) for s in client_side_stop):]
+                    if partial_response.content:
+                        contents[index].append(partial_response.content)
+                        if index == 0 and parser is not None:
+                            parser.feed(partial_response.content)
+                    if partial_response.finish_reason:
+                        finish_reasons[index] = partial_response.finish_reason
+                if any(partial_response.content for partial_response in partial_responses):
+                    yield partial_responses
+                if stopped:
+                    break
+        finally:
+            # Also when the loop stops early, so that the connection is released rather than left to the garbage collector.
+            await stream.aclose()
+
+        responses = []
+        for index, (content_parts, finish_reason) in enumerate(zip(contents, finish_reasons)):
+            content = "".join(content_parts)
+            if index == 0 and parser is not None:
+                title = parser.title
+            else:
+                title = self.message_handler.extract_title(content)
+            responses.append(SingleLLMResponse(title=title or "[No Title]", content=content, finish_reason=finish_reason, partial=False))
+        assembled_responses = responses
+        responses = self._apply_stop_sequences(responses, stop, counted=stopped)
+        if not stopped and responses == assembled_responses:
+            responses = self._with_provider_state(responses, routed_model_name, llm_use, provider_state)
+        # The usage is only known when the stream was read to the end.
+        self.rate_limiter.settle(routed_model_name, reserved_tokens, usage)
+        usage = usage or LLMUsage()
+        usage.model_name = routed_model_name
+        usage.latency_seconds = time.perf_counter() - start
+        usage.first_token_seconds = first_token_seconds
+        usage.cost = self._cost(routed_model_name, usage)
+        responses = self._with_usage(responses, usage)
+        if parser is not None:
+            if responses and responses[0].content and contents:
+                # Feed the restored closing tag, if any.
+                parser.feed(responses[0].content[len("".join(contents[0])):])
+            parser.close()
+        logger.info(f"Assembled streaming response: {responses}")
+        if self.recorder is not None:
+            await self.recorder.record_llm(llm_use.prompts, stop, routed_model_name, responses, usage)
+        if cache_key is not None:
+            await self.cache.set(cache_key, model_name, responses)
+        yield responses
+
+    def _provider_kwargs(self, model_name: str, llm_use: LLMUse, stop: Optional[list[str]], tools: Optional[list[dict]],
+                         parallel_tool_calls: bool) -> dict:
+        model = self.models[model_name]
+        kwargs: dict[str, Any] = {"stop": stop if model.supports_stop_sequences else None}
+        # Optional arguments are only passed when set, so that models which don't use them need not accept them.
+        if tools:
+            kwargs["tools"] = tools
+            if not parallel_tool_calls:
+                kwargs["parallel_tool_calls"] = False
+        if llm_use.provider_state is not None and llm_use.provider_state.get("model_name") == model_name:
+            kwargs["provider_state"] = llm_use.provider_state
+        return kwargs
+
+    async def _provider_completion(self, model_name: str, llm_use: LLMUse, stop: Optional[list[str]], tools: Optional[list[dict]],
+                                   parallel_tool_calls: bool, reserved_tokens: int, priority: int) -> Any:
+        await self.rate_limiter.acquire(model_name, reserved_tokens, priority)
+        return await self.models[model_name].completion(llm_use.prompts, **self._provider_kwargs(model_name, llm_use, stop, tools, parallel_tool_calls))
+
+    async def _provider_stream(self, model_name: str, llm_use: LLMUse, stop: Optional[list[str]], tools: Optional[list[dict]],
+                               parallel_tool_calls: bool, reserved_tokens: int, priority: int) -> AsyncGenerator[Any, None]:
+        """Open a stream and wait for its first chunk, so that LLMRouter races streams to their first chunk."""
+        await self.rate_limiter.acquire(model_name, reserved_tokens, priority)
+        stream = self.models[model_name].completion_stream(llm_use.prompts, **self._provider_kwargs(model_name, llm_use, stop, tools, parallel_tool_calls))
+        try:
+            first_chunk = await anext(stream)
+        except StopAsyncIteration:
+            return _chunks([], stream)
+        except BaseException:
+            await stream.aclose()
+            raise
+        return _chunks([first_chunk], stream)
+
+    def _with_usage(self, responses: LLMResponses, usage: LLMUsage) -> LLMResponses:
+        """Set the usage of the call on the first response."""
+        if not responses:
+            return responses
+        return [dataclasses.replace(responses[0], usage=usage), *responses[1:]]
+
+    def _with_provider_state(self, responses: LLMResponses, model_name: str, llm_use: LLMUse, state: Optional[dict]) -> LLMResponses:
+        """Set the provider state on the response, covering the prompts and the response itself.
+
+        Only for a single response that is not modified after the provider returned it, since the provider keeps
+        that exact response as the last message of the conversation.
+        """
+        if state is None or len(responses) != 1:
+            return responses
+        return [dataclasses.replace(responses[0], provider_state={**state, "model_name": model_name, "length": len(llm_use) + 1})]
+
+    def _cost(self, model_name: str, usage: LLMUsage) -> Optional[float]:
+        prices = self.config.prices_per_million_tokens.get(model_name)
+        if prices is None:
+            return None
+        uncached_prompt_tokens = usage.prompt_tokens - usage.cached_prompt_tokens
+        return (uncached_prompt_tokens * prices.get("prompt", 0.0)
+                + usage.cached_prompt_tokens * prices.get("cached_prompt", prices.get("prompt", 0.0))
+                + usage.output_tokens * prices.get("output", 0.0)) / 1_000_000
+
+    def _find_stop_sequence(self, content: str, stop: list[str]) -> Optional[int]:
+        """Return the position right after the first stop sequence in `content`, if any."""
+        positions = [content.find(sequence) for sequence in stop]
+        found = [(position, sequence) for position, sequence in zip(positions, stop) if position >= 0]
+        if not found:
+            return None
+        position, sequence = min(found)
+        return position + len(sequence)
+
+    def _apply_stop_sequences(self, responses: LLMResponses, stop: Optional[list[str]], counted: bool = False) -> LLMResponses:
+        """Make responses look the same whether or not the provider stopped at a stop sequence.
+
+        Providers drop the stop sequence itself, so a closing tag used as stop sequence is added back if its
+        opening tag is left unclosed.  Text after a stop sequence (when the provider does not support them) is
+        cut.  `counted` tells that the response was already cut on the client side while streaming.
+        """
+        results = []
+        for response in responses:
+            content = response.content
+            if not content:
+                results.append(response)
+                continue
+            end = self._find_stop_sequence(content, [TOOL_USE_STOP_SEQUENCE])
+            if end is not None and not counted:
+                self._observe_trailer(content[end:], discarded=bool(stop and TOOL_USE_STOP_SEQUENCE in stop))
+            if stop:
+                end = self._find_stop_sequence(content, stop)
+                if end is not None:
+                    if content[end:].strip() and not counted:
+                        self.stop_stats["truncated_responses"] += 1
+                    content = content[:end]
+                else:
+                    for sequence in stop:
+                        if self._has_unclosed_tag(content, sequence):
+                            content += sequence
+                            self.stop_stats["stopped_responses"] += 1
+                            break
+            results.append(dataclasses.replace(response, content=content) if content != response.content else response)
+        return results
+
+    def _has_unclosed_tag(self, content: str, closing_tag: str) -> bool:
+        if not (closing_tag.startswith("</") and closing_tag.endswith(">")):
+            return False
+        opening_tag = "<" + closing_tag[2:]
+        lowered = content.lower()
+        return lowered.rfind(opening_tag.lower()) > lowered.rfind(closing_tag.lower())
+
+    def _observe_trailer(self, trailer: str, discarded: bool):
+        self.stop_stats["observed_tool_uses"] += 1
+        if not trailer.strip():
+            return
+        tokens = estimate_tokens(trailer)
+        self.stop_stats["observed_trailers"] += 1
+        self.stop_stats["observed_trailer_tokens"] += tokens
+        if discarded:
+            self.stop_stats["discarded_output_tokens"] += tokens
+
+    def stop_savings(self) -> Optional[int]:
+        """Estimated output tokens not generated thanks to the provider stopping at </tool_use>.
+
+        An estimate: the text after </tool_use> of a stopped response is never generated, so each stopped response
+        counts the mean of the observed tool uses (see `observed_tool_uses`), e.g., of providers without stop
+        sequences or of tasks without them.  None until there is such a baseline.
+        """
+        if self.stop_stats["observed_tool_uses"] == 0:
+            return None
+        return round(self.stop_stats["stopped_responses"] * self.stop_stats["observed_trailer_tokens"] / self.stop_stats["observed_tool_uses"])
+
+    def stats(self) -> dict:
+        return {"stop_sequences": {**self.stop_stats, "estimated_output_tokens_saved": self.stop_savings()}, "cache": self.cache.stats(),
+                "routing": self.router.stats(), "rate_limits": self.rate_limiter.stats()}
+
+    async def prewarm(self):
+        """Open connections to the providers of the available models, so the first requests don't pay for them.
+
+        Models with the same client share its connection pool, so each client is prewarmed through one of its models.
+        """
+        connections = ProviderClients.Config.from_dict(self.raw_config).prewarm_connections
+        if connections <= 0:
+            return
+        clients = {model.client_key: model for model in self.models.values() if model.client_key is not None}
+        results = await asyncio.gather(
+            *(model.prewarm() for model in clients.values() for _ in range(connections)), return_exceptions=True)
+        for error in results:
+            if isinstance(error, BaseException):
+                logger.warning(f"Failed to prewarm a provider connection: {error}")
+
+    async def aclose(self):
+        await self.cache.aclose()
+        await close_provider_clients()
+
+async def _chunks(first_chunks: list, stream: AsyncGenerator[Any, None]) -> AsyncGenerator[Any, None]:
+    try:
+        for chunk in first_chunks:
+            yield chunk
+        async for chunk in stream:
+            yield chunk
+    finally:
+        await stream.aclose()
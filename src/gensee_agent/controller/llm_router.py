@@ -0,0 +1,173 @@
+import asyncio
+from collections import deque
+from dataclasses import field
+import time
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+from gensee_agent.exceptions.gensee_exceptions import LLMError
+from gensee_agent.utils.configs import BaseConfig, register_configs
+from gensee_agent.utils.logging import configure_logger
+
+logger = configure_logger(__name__)
+
+T = TypeVar("T")
+
+class LLMRouter:
+    """Hedged and fallback requests across models, to cut the tail latency of LLM calls.
+
+    For a model with backups in `routes`:
+    - Hedging: if a request is still running after the `hedge_percentile` latency of the model (over its recent
+      requests), the same request is sent to the first backup and the first response wins.  The other request is
+      cancelled.  At most `max_hedge_ratio` of the requests are hedged, which bounds the extra spend.
+    - Fallback: if a request fails with an LLMError, the next backup is tried.
+
+    Streams race to their first chunk: once a stream has produced a chunk, it is the one read to the end.
+    Models without backups are called directly.
+    """
+
+    @register_configs("llm_router")
+    class Config(BaseConfig):
+        routes: dict[str, list[str]] = field(default_factory=dict)  # Backup models by model name, in order of preference.
+        hedge: bool = True  # Whether to hedge slow requests to the first backup.  If disabled, backups are only used on errors.
+        hedge_percentile: float = 0.95  # Hedge a request once it runs longer than this percentile of the latency of the model.
+        min_hedge_delay_seconds: float = 1.0  # Never hedge a request earlier than this.
+        min_latency_samples: int = 20  # Number of latencies of a model needed before hedging its requests.
+        latency_window: int = 200  # Number of recent latencies kept per model.
+        max_hedge_ratio: float = 0.1  # Max fraction of the routed requests that are hedged.
+        fallback_on_error: bool = True  # Whether to try the next backup when a request fails.
+
+    def __init__(self, config: dict, available_models: list[str]):
+        self.config = self.Config.from_dict(config)
+        for model_name, backups in self.config.routes.items():
+            for name in [model_name, *backups]:
+                if name not in available_models:
+                    raise ValueError(f"Model {name} in llm_router routes is not in available models {available_models}.")
+        # Recent latencies by (model name, kind), where kind tells whether it is the full response or the first chunk of a stream.
+        self.latencies: dict[tuple[str, str], deque[float]] = {}
+        self.routing_stats = {
+            "requests": 0,  # Requests to models with backups.
+            "hedged": 0,  # Requests also sent to a backup because they were slow.
+            "hedge_wins": 0,  # Hedged requests answered first by the backup.
+            "fallbacks": 0,  # Requests sent to a backup because the previous model failed.
+            "cancelled": 0,  # Losing requests cancelled.
+            "failed": 0,  # Requests that failed on all models.
+        }
+        self.wins: dict[str, int] = {}  # Requests answered, by model.
+        self.errors: dict[str, int] = {}  # Failed requests, by model.
+
+    def candidates(self, model_name: str) -> list[str]:
+        return [model_name, *self.config.routes.get(model_name, [])]
+
+    async def run(self, model_name: str, call: Callable[[str], Awaitable[T]], *, kind: str = "completion",
+                  discard: Optional[Callable[[T], Awaitable[Any]]] = None) -> tuple[str, T]:
+        """Run `call(model_name)`, hedged and falling back to the backups of the model.
+
+        Returns the name of the model that answered and its result.  `discard` releases a result that arrived
+        but lost the race, e.g., closes a stream.
+        """
+        candidates = self.candidates(model_name)
+        if len(candidates) == 1:
+            return model_name, await call(model_name)
+        self.routing_stats["requests"] += 1
+        start = time.perf_counter()
+        running: dict[asyncio.Task, str] = {}
+        next_index = 0
+        hedged = False
+        last_error: Optional[LLMError] = None
+
+        def launch():
+            nonlocal next_index
+            name = candidates[next_index]
+            next_index += 1
+            running[asyncio.create_task(self._timed(name, kind, call))] = name
+
+        launch()
+        try:
+            while running:
+                timeout = None
+                if not hedged and next_index < len(candidates) and self._may_hedge():
+                    delay = self._hedge_delay(model_name, kind)
+                    if delay is not None:
+                        timeout = max(0.0, start + delay - time.perf_counter())
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    self.routing_stats["hedged"] += 1
+                    logger.info(f"Hedging a {kind} request to {candidates[next_index]} after {time.perf_counter() - start:.2f}s")
+                    launch()
+                    continue
+                for task in done:
+                    name = running.pop(task)
+                    try:
+                        result = task.result()
+                    except LLMError as e:
+                        logger.warning(f"Request to {name} failed: {e}")
+                        self.errors[name] = self.errors.get(name, 0) + 1
+                        last_error = e
+                        continue
+                    self.wins[name] = self.wins.get(name, 0) + 1
+                    if hedged and name != model_name:
+                        self.routing_stats["hedge_wins"] += 1
+                    # Several requests may finish at once: only the first one is used.
+                    for other in done:
+                        if other in running:
+                            running.pop(other)
+                            if discard is not None and not other.cancelled() and other.exception() is None:
+                                await discard(other.result())
+                    return name, result
+                if not running and next_index < len(candidates) and self.config.fallback_on_error:
+                    self.routing_stats["fallbacks"] += 1
+                    logger.info(f"Falling back to {candidates[next_index]}")
+                    launch()
+            self.routing_stats["failed"] += 1
+            assert last_error is not None
+            raise last_error
+        finally:
+            for task in running:
+                task.cancel()
+                self.routing_stats["cancelled"] += 1
+            if running:
+                losers = await asyncio.gather(*running, return_exceptions=True)
+                if discard is not None:
+                    for loser in losers:
+                        if not isinstance(loser, BaseException):
+                            await discard(loser)
+
+    async def _timed(self, model_name: str, kind: str, call: Callable[[str], Awaitable[T]]) -> T:
+        start = time.perf_counter()
+        result = await call(model_name)
+        # Only completed requests are samples: a cancelled hedge loser would pull the percentiles towards the winner.
+        self._record_latency(model_name, kind, time.perf_counter() - start)
+        return result
+
+    def _record_latency(self, model_name: str, kind: str, latency: float):
+        key = (model_name, kind)
+        if key not in self.latencies:
+            self.latencies[key] = deque(maxlen=self.config.latency_window)
+        self.latencies[key].append(latency)
+
+    def _may_hedge(self) -> bool:
+        return self.config.hedge and self.routing_stats["hedged"] < self.config.max_hedge_ratio * self.routing_stats["requests"]
+
+    def _hedge_delay(self, model_name: str, kind: str) -> Optional[float]:
+        latencies = self.latencies.get((model_name, kind))
+        if latencies is None or len(latencies) < self.config.min_latency_samples:
+            return None
+        return max(self.config.min_hedge_delay_seconds, _percentile(latencies, self.config.hedge_percentile))
+
+    def stats(self) -> dict:
+        requests = self.routing_stats["requests"]
+        return {
+            **self.routing_stats,
+            "hedge_win_rate": self.routing_stats["hedge_wins"] / self.routing_stats["hedged"] if self.routing_stats["hedged"] else 0.0,
+            "win_rates": {name: wins / requests for name, wins in self.wins.items()} if requests else {},
+            "errors": dict(self.errors),
+            "latency_seconds": {
+                f"{name}:{kind}": {"p50": _percentile(latencies, 0.5), "p95": _percentile(latencies, 0.95), "samples": len(latencies)}
+                for (name, kind), latencies in self.latencies.items() if latencies
+            },
+        }
+
+def _percentile(values: deque[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
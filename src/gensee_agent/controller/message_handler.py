@@ -1,18 +1,45 @@
 import html
 import json
-import re
 from typing import Optional
 from defusedxml import ElementTree as ET
 from xml.etree.ElementTree import ParseError
 from xml.parsers.expat import ExpatError
 
 from gensee_agent.controller.dataclass.tool_use import ToolUse
+from gensee_agent.controller.message_parser import StreamingMessageParser
 from gensee_agent.exceptions.gensee_exceptions import ToolParsingError
 
 class MessageHandler:
+    # End of a <tool_use> block rendered by `format_tool_use`.
+    TOOL_USE_CLOSING = "\n</arguments>\n</tool_use>\n"
+
     def __init__(self, config: dict):
         pass
 
+    @staticmethod
+    def tool_use_opening(api_name: str) -> str:
+        """Start of a <tool_use> block rendered by `format_tool_use`, up to the arguments."""
+        return f"<tool_use>\n<name>{api_name}</name>\n<arguments>\n"
+
+    @classmethod
+    def format_tool_use(cls, api_name: str, arguments: str) -> str:
+        """Render a tool call, e.g., a native tool call of the provider, in the format parsed by `extract_tool_use`.
+
+        `arguments` is the JSON of the arguments.
+        """
+        return cls.tool_use_opening(api_name) + arguments + cls.TOOL_USE_CLOSING
+
+    def create_parser(self, stop_sequences: Optional[list[str]] = None) -> StreamingMessageParser:
+        """Create an incremental parser, to be fed with the deltas of a streamed message requested with `stop_sequences`."""
+        return StreamingMessageParser(stop_sequences)
+
+    def parse(self, message: str) -> StreamingMessageParser:
+        """Parse a complete message in one pass."""
+        parser = self.create_parser()
+        parser.feed(message)
+        parser.close()
+        return parser
+
     def extract_tool_use(self, message: str) -> Optional[ToolUse]:
         """
         Parse LLM response to extract tool use with JSON arguments.
@@ -32,32 +59,17 @@ class MessageHandler:
         <name>tool_name</name>
         </tool_use>
         """
-        # Pattern with optional arguments section
-        pattern = r'<tool_use>\s*<name>(.*?)</name>(?:\s*<arguments>(.*?)</arguments>)?\s*</tool_use>'
-        match = re.search(pattern, message, re.DOTALL | re.IGNORECASE)
-
-        if not match:
-            return None
-
-        tool_name = match.group(1).strip()
-        arguments_str = match.group(2)  # This will be None if no arguments section
-
-        # Handle empty or missing arguments
-        if arguments_str is None or not arguments_str.strip():
-            arguments = {}
-        else:
-            try:
-                arguments = json.loads(arguments_str.strip())
-            except json.JSONDecodeError as e:
-                # Log the error for debugging
-                print(f"Failed to parse tool arguments as JSON: {e}")
-                print(f"Raw arguments: {arguments_str}")
-                return None
-
-        return ToolUse(
-            api_name=tool_name,
-            params=arguments
-        )
+        tool_uses = self.parse(message).tool_uses
+        return tool_uses[0] if tool_uses else None
+
+    def extract_tool_uses(self, message: str) -> list[ToolUse]:
+        """
+        Parse LLM response to extract all tool uses, in the order they appear.
+
+        Same format as `extract_tool_use`, but the message may contain several <tool_use> blocks.
+        Blocks whose arguments are not valid JSON are skipped.
+        """
+        return self.parse(message).tool_uses
 
     def extract_title(self, message: str) -> Optional[str]:
         """
@@ -66,17 +78,9 @@ class MessageHandler:
         Expected format:
         <title>Your Title Here</title>
         """
-        pattern = r'<title>(.*?)</title>'
-        match = re.search(pattern, message, re.DOTALL | re.IGNORECASE)
-
-        if not match:
-            return None
+        return self.parse(message).title
 
-        title = match.group(1).strip()
-        return title if title else None
-
-
-    def handle_message(self, message_str: str) -> Optional[ToolUse]:
+    def handle_message(self, message_str: str, allow_multiple: bool = False) -> list[ToolUse]:
         """Parse the message string and extract tool use information.
 
         An example message string:
@@ -89,5 +93,10 @@ class MessageHandler:
         <results>
         ...
         </results>
+
+        Returns the parsed tool uses.  Unless `allow_multiple` is set, only the first tool use is returned.
         """
-        return self.extract_tool_use(message_str)
+        if allow_multiple:
+            return self.extract_tool_uses(message_str)
+        tool_use = self.extract_tool_use(message_str)
+        return [tool_use] if tool_use is not None else []
@@ -0,0 +1,224 @@
+import json
+from typing import Optional
+
+from gensee_agent.controller.dataclass.parser_event import ParserEvent
+from gensee_agent.controller.dataclass.tool_use import ToolUse
+from gensee_agent.utils.logging import configure_logger
+
+logger = configure_logger(__name__)
+
+class StreamingMessageParser:
+    """Incremental parser for the <title> and <tool_use> tags of an LLM message.
+
+    The message is fed chunk by chunk with `feed()`, and every character is examined once: only a
+    possible partial tag at the end of a chunk (at most the length of the longest tag) is carried
+    over to the next chunk, so the accumulated message is never rescanned.  Events are emitted as
+    soon as the corresponding tag closes, which allows dispatching a tool before the LLM finishes
+    its output.
+
+    Tags are matched case-insensitively.  The accepted format is the same as the one described in
+    `MessageHandler.extract_tool_use`:
+    <tool_use>
+    <name>tool_name</name>
+    <arguments>
+    {"param": "value"}
+    </arguments>
+    </tool_use>
+
+    Like the regular expression of `extract_tool_use`, </arguments> only closes the arguments when </tool_use>
+    follows, so the arguments may contain "</arguments>", e.g., in a JSON string.  When </tool_use> is a stop
+    sequence, it never comes while the message streams, so </arguments> closes the arguments as soon as they are
+    valid JSON instead.
+    """
+
+    # Parser states
+    _OUTSIDE = 0  # Outside any tag of interest.
+    _TITLE = 1  # Inside <title>, collecting the title.
+    _TOOL_USE = 2  # Inside <tool_use>, before <name>.
+    _NAME = 3  # Inside <name>, collecting the API name.
+    _AFTER_NAME = 4  # After </name>, expecting <arguments> or </tool_use>.
+    _ARGUMENTS = 5  # Inside <arguments>, collecting the JSON arguments.
+    _AFTER_ARGUMENTS = 6  # After </arguments>, expecting </tool_use>, or more arguments if it does not follow.
+
+    # Tags (and the state they lead to) recognized in each state.
+    _TRANSITIONS: dict[int, dict[str, int]] = {
+        _OUTSIDE: {"<title>": _TITLE, "<tool_use>": _TOOL_USE},
+        _TITLE: {"</title>": _OUTSIDE},
+        _TOOL_USE: {"<name>": _NAME},
+        _NAME: {"</name>": _AFTER_NAME},
+        _AFTER_NAME: {"<arguments>": _ARGUMENTS, "</tool_use>": _OUTSIDE},
+        _ARGUMENTS: {"</arguments>": _AFTER_ARGUMENTS},
+        _AFTER_ARGUMENTS: {"</tool_use>": _OUTSIDE},
+    }
+    # States whose content is collected until the closing tag.
+    _CONTENT_STATES = {_TITLE, _NAME, _ARGUMENTS}
+    # States in which only whitespace is allowed between tags.
+    _STRICT_STATES = {_TOOL_USE, _AFTER_NAME, _AFTER_ARGUMENTS}
+
+    def __init__(self, stop_sequences: Optional[list[str]] = None):
+        self.state = self._OUTSIDE
+        # Whether the message is cut before </tool_use>, so that tool uses are complete at </arguments>.
+        self.stops_at_tool_use = any(sequence.lower() == "</tool_use>" for sequence in stop_sequences or [])
+        self.title: Optional[str] = None
+        self.title_found = False
+        self.tool_uses: list[ToolUse] = []
+        self._tool_use_count = 0  # Number of <tool_use> blocks seen, including invalid ones.
+        self._tool_use_index = 0  # Index of the current <tool_use> block.
+        self._pending = ""  # Possible partial tag at the end of the previous chunk.
+        self._content: list[str] = []  # Content of the current content state.
+        self._tool_name: Optional[str] = None
+        self._closing: list[str] = []  # Text since </arguments>, given back to the arguments if </tool_use> does not follow.
+        self._finished = False  # Whether the current tool use was already emitted at </arguments>.
+        self._events: list[ParserEvent] = []
+
+    def feed(self, chunk: str) -> list[ParserEvent]:
+        """Consume the next chunk of the message and return the events it completed."""
+        if self._pending:
+            text = self._pending + chunk
+            self._pending = ""
+        else:
+            text = chunk
+        new_events_start = len(self._events)
+        position = 0
+        length = len(text)
+        while position < length:
+            if self.state in self._STRICT_STATES:
+                # Skip whitespace between tags.
+                whitespace_start = position
+                while position < length and text[position].isspace():
+                    position += 1
+                if self.state == self._AFTER_ARGUMENTS:
+                    self._closing.append(text[whitespace_start:position])
+                if position >= length:
+                    break
+                if text[position] != "<":
+                    # Not a tool use in the expected format, so ignore this block.
+                    self._abandon_tool_use()
+                    continue
+                tag_start = position
+            else:
+                tag_start = text.find("<", position)
+                if tag_start < 0:
+                    if self.state in self._CONTENT_STATES:
+                        self._content.append(text[position:])
+                    break
+                if self.state in self._CONTENT_STATES and tag_start > position:
+                    self._content.append(text[position:tag_start])
+
+            tag, is_prefix = self._match_tag(text, tag_start)
+            if is_prefix:
+                # The tag may continue in the next chunk.
+                self._pending = text[tag_start:]
+                break
+            if tag is None:
+                if self.state in self._STRICT_STATES:
+                    self._abandon_tool_use()
+                    position = tag_start
+                else:
+                    if self.state in self._CONTENT_STATES:
+                        self._content.append("<")
+                    position = tag_start + 1
+                continue
+            position = tag_start + len(tag)
+            self._transition(tag, text[tag_start:position])
+        return self._events[new_events_start:]
+
+    def close(self):
+        """Signal the end of the message.  Unterminated tags are dropped."""
+        if self.state == self._AFTER_ARGUMENTS:
+            # The message ends right after </arguments>, e.g., </tool_use> was cut as a stop sequence.
+            if not self._finished:
+                self._finish_tool_use("".join(self._content))
+            self._finished = False
+            self.state = self._OUTSIDE
+        self._pending = ""
+        self._content = []
+
+    def pop_events(self) -> list[ParserEvent]:
+        """Return and clear all events emitted so far."""
+        events = self._events
+        self._events = []
+        return events
+
+    def _match_tag(self, text: str, tag_start: int) -> tuple[Optional[str], bool]:
+        """Match the tags allowed in the current state at `tag_start`.
+
+        Returns the matched tag, or whether the rest of the text is a prefix of an allowed tag.
+        """
+        candidate = text[tag_start:tag_start + 12].lower()  # 12 is the length of the longest tag.
+        is_prefix = False
+        for tag in self._TRANSITIONS[self.state]:
+            if self.state == self._OUTSIDE and tag == "<title>" and self.title_found:
+                continue
+            if candidate.startswith(tag):
+                return tag, False
+            if len(candidate) < len(tag) and tag.startswith(candidate):
+                is_prefix = True
+        return None, is_prefix
+
+    def _transition(self, tag: str, tag_text: str):
+        new_state = self._TRANSITIONS[self.state][tag]
+        if tag == "</title>":
+            title = "".join(self._content).strip()
+            self.title_found = True
+            if title:
+                self.title = title
+                self._events.append(ParserEvent(type="title", title=title))
+        elif tag == "<tool_use>":
+            self._tool_name = None
+            self._tool_use_index = self._tool_use_count
+            self._tool_use_count += 1
+        elif tag == "</name>":
+            self._tool_name = "".join(self._content).strip()
+            self._events.append(ParserEvent(type="tool_name", tool_name=self._tool_name, index=self._tool_use_index))
+        elif tag == "</arguments>":
+            # The arguments are kept until </tool_use> confirms that they are complete, unless it is a stop sequence.
+            self._closing = [tag_text]
+            self.state = new_state
+            if self.stops_at_tool_use:
+                self._finished = self._finish_tool_use("".join(self._content), log_errors=False)
+            return
+        elif tag == "</tool_use>" and self.state == self._AFTER_ARGUMENTS:
+            if not self._finished:
+                self._finish_tool_use("".join(self._content))
+            self._finished = False
+        elif tag == "</tool_use>" and self.state == self._AFTER_NAME:
+            # No arguments section.
+            self._finish_tool_use(None)
+        self._content = []
+        self.state = new_state
+
+    def _finish_tool_use(self, arguments_str: Optional[str], log_errors: bool = True) -> bool:
+        """Emit the tool use, and return whether its arguments were valid."""
+        assert self._tool_name is not None
+        if arguments_str is None or not arguments_str.strip():
+            arguments = {}
+        else:
+            try:
+                arguments = json.loads(arguments_str.strip())
+            except json.JSONDecodeError as e:
+                if log_errors:
+                    logger.warning(f"Failed to parse tool arguments as JSON: {e}. Raw arguments: {arguments_str}")
+                return False
+        tool_use = ToolUse(api_name=self._tool_name, params=arguments)
+        self.tool_uses.append(tool_use)
+        self._events.append(ParserEvent(type="tool_use", tool_name=self._tool_name, tool_use=tool_use, index=self._tool_use_index))
+        return True
+
+    def _abandon_tool_use(self):
+        if self.state == self._AFTER_ARGUMENTS and self._finished:
+            # Text after a tool use already emitted: it is complete, whatever follows.
+            self._finished = False
+            self._closing = []
+            self._content = []
+            self.state = self._OUTSIDE
+            return
+        if self.state == self._AFTER_ARGUMENTS:
+            # </tool_use> does not follow, so the </arguments> was part of the arguments.
+            self._content.extend(self._closing)
+            self._closing = []
+            self.state = self._ARGUMENTS
+            return
+        self._content = []
+        self._tool_name = None
+        self.state = self._OUTSIDE
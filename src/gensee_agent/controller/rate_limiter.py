@@ -0,0 +1,151 @@
+import asyncio
+from dataclasses import field
+import heapq
+import itertools
+import time
+from typing import Optional
+
+from gensee_agent.controller.dataclass.llm_response import LLMUsage
+from gensee_agent.utils.configs import BaseConfig, register_configs
+from gensee_agent.utils.logging import configure_logger
+from gensee_agent.utils.tokens import estimate_tokens
+
+logger = configure_logger(__name__)
+
+class TokenBucket:
+    """Refills at `rate` per second up to `capacity`.  May go negative when a request costs more than expected."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` is available, after `refill()`.  Requests larger than the bucket wait for a full bucket."""
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+class ModelRateLimit:
+    """Requests-per-minute and tokens-per-minute budgets of one model, with the requests waiting for them by priority."""
+
+    def __init__(self, model_name: str, rpm: Optional[float], tpm: Optional[float], burst_seconds: float):
+        self.model_name = model_name
+        # The buckets hold `burst_seconds` of budget, so bursts are spread instead of hitting the per-minute limit at once.
+        self.requests = TokenBucket(rpm / 60, max(1.0, rpm / 60 * burst_seconds)) if rpm else None
+        self.tokens = TokenBucket(tpm / 60, max(1.0, tpm / 60 * burst_seconds)) if tpm else None
+        self.waiters: list[tuple[int, int, float, asyncio.Future]] = []  # Heap of (priority, arrival, tokens, future).
+        self.arrivals = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.drain_task: Optional[asyncio.Task] = None
+        self.limit_stats = {
+            "requests": 0,
+            "queued_requests": 0,  # Requests that had to wait.
+            "wait_seconds": 0.0,  # Total waiting time.
+            "max_wait_seconds": 0.0,
+            "max_queue_depth": 0,
+        }
+
+    def _wait_time(self, tokens: float) -> float:
+        now = time.monotonic()
+        wait = 0.0
+        for bucket, amount in ((self.requests, 1.0), (self.tokens, tokens)):
+            if bucket is not None:
+                bucket.refill(now)
+                wait = max(wait, bucket.wait_time(amount))
+        return wait
+
+    def _take(self, tokens: float):
+        if self.requests is not None:
+            self.requests.level -= 1
+        if self.tokens is not None:
+            self.tokens.level -= tokens
+
+    async def acquire(self, tokens: float, priority: int):
+        self.limit_stats["requests"] += 1
+        if not self.waiters and self._wait_time(tokens) == 0:
+            self._take(tokens)
+            return
+        start = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.arrivals), tokens, future))
+        self.limit_stats["queued_requests"] += 1
+        self.limit_stats["max_queue_depth"] = max(self.limit_stats["max_queue_depth"], len(self.waiters))
+        self.wakeup.set()
+        if self.drain_task is None or self.drain_task.done():
+            self.drain_task = asyncio.create_task(self._drain())
+        await future
+        wait = time.monotonic() - start
+        self.limit_stats["wait_seconds"] += wait
+        self.limit_stats["max_wait_seconds"] = max(self.limit_stats["max_wait_seconds"], wait)
+
+    async def _drain(self):
+        # Serve the waiting requests in order of priority, then arrival, as the budgets refill.
+        while self.waiters:
+            _, _, tokens, future = self.waiters[0]
+            if future.done():
+                # The caller was cancelled.
+                heapq.heappop(self.waiters)
+                continue
+            wait = self._wait_time(tokens)
+            if wait > 0:
+                # Wake up early if a request of a higher priority arrives.
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self.waiters)
+            self._take(tokens)
+            future.set_result(None)
+
+    def settle(self, reserved_tokens: float, used_tokens: float):
+        """Charge the difference between the tokens reserved for a request and the tokens it used."""
+        if self.tokens is not None:
+            self.tokens.level -= used_tokens - reserved_tokens
+
+    def stats(self) -> dict:
+        return {**self.limit_stats, "queue_depth": len(self.waiters)}
+
+class RateLimiter:
+    """Client-side RPM and TPM budgets per model, so that bursts of requests wait instead of failing with 429s.
+
+    A request reserves its estimated prompt tokens plus `output_tokens_estimate`, and the estimate is corrected
+    with the usage reported by the provider.  Requests waiting for budget are served by priority (lower first),
+    then in arrival order.
+    """
+
+    @register_configs("rate_limiter")
+    class Config(BaseConfig):
+        limits: dict[str, dict[str, float]] = field(default_factory=dict)  # By model name, e.g., {"openai.gpt-5": {"rpm": 500, "tpm": 500000}}.
+        burst_seconds: float = 10.0  # How many seconds of budget can be spent at once.
+        output_tokens_estimate: int = 1000  # Output tokens reserved per request until the usage is known.
+
+    def __init__(self, config: dict):
+        self.config = self.Config.from_dict(config)
+        self.model_limits = {
+            model_name: ModelRateLimit(model_name, limit.get("rpm"), limit.get("tpm"), self.config.burst_seconds)
+            for model_name, limit in self.config.limits.items()
+        }
+
+    def estimate_tokens(self, prompts: list[dict]) -> int:
+        return sum(estimate_tokens(prompt["content"]) for prompt in prompts) + self.config.output_tokens_estimate
+
+    async def acquire(self, model_name: str, tokens: int, priority: int = 0):
+        """Wait until `model_name` has the budget for a request of `tokens` tokens."""
+        model_limit = self.model_limits.get(model_name)
+        if model_limit is not None:
+            await model_limit.acquire(tokens, priority)
+
+    def settle(self, model_name: str, reserved_tokens: int, usage: Optional[LLMUsage]):
+        model_limit = self.model_limits.get(model_name)
+        if model_limit is not None and usage is not None and usage.prompt_tokens:
+            model_limit.settle(reserved_tokens, usage.prompt_tokens + usage.output_tokens)
+
+    def stats(self) -> dict:
+        return {model_name: model_limit.stats() for model_name, model_limit in self.model_limits.items()}
@@ -0,0 +1,140 @@
+import asyncio
+from dataclasses import asdict
+import hashlib
+from typing import Any, Optional
+
+import aiofiles
+import orjson
+
+from gensee_agent.controller.dataclass.llm_response import LLMResponses, LLMUsage
+from gensee_agent.utils.configs import BaseConfig, register_configs
+from gensee_agent.utils.logging import configure_logger
+
+logger = configure_logger(__name__)
+
+# Recordings are loaded once per process, and shared by the replay models and tools.
+_RECORDINGS: dict[tuple[str, float], "Recording"] = {}
+
+def _hash(value: Any) -> str:
+    return hashlib.sha256(orjson.dumps(value, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+def llm_keys(prompts: list[dict], stop: Optional[list[str]]) -> tuple[str, str]:
+    """Keys of an LLM call: the hash of its exact prompts, and the hash of its turn in the conversation.
+
+    Prompts of a replayed session are usually not exactly the recorded ones: the system prompt has the current time,
+    and tool call ids are random.  The turn key (the first user message, i.e., the task, and the number of assistant
+    messages so far) still finds the recorded call.
+    """
+    task = next((prompt["content"] for prompt in prompts if prompt["role"] == "user"), None)
+    turn = sum(1 for prompt in prompts if prompt["role"] == "assistant")
+    return _hash({"prompts": prompts, "stop": stop}), _hash({"task": task, "turn": turn})
+
+def tool_key(api_name: str, params: dict) -> str:
+    return _hash({"api_name": api_name, "params": params})
+
+class Recorder:
+    """Record the LLM calls and tool calls of the controller, with their timings, to a JSONL file.
+
+    The recording can be played back offline with the "replay.recorded" model and the replay tools (see `Recording`).
+    """
+
+    @register_configs("recorder")
+    class Config(BaseConfig):
+        record_path: Optional[str] = None  # JSONL file the calls are appended to.  None to not record.
+        include_prompts: bool = False  # Whether to also record the prompts of the LLM calls, e.g., to inspect them.  Only their hashes are needed to replay.
+
+    def __init__(self, config: dict):
+        self.config = self.Config.from_dict(config)
+        self.lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.record_path is not None
+
+    async def record_llm(self, prompts: list[dict], stop: Optional[list[str]], model_name: str, responses: LLMResponses,
+                         usage: Optional[LLMUsage]):
+        prompts_key, turn_key = llm_keys(prompts, stop)
+        record = {
+            "kind": "llm",
+            "prompts_key": prompts_key,
+            "turn_key": turn_key,
+            "model_name": model_name,
+            "responses": [{**asdict(response), "usage": None} for response in responses],
+            "usage": asdict(usage) if usage is not None else None,
+        }
+        if self.config.include_prompts:
+            record["prompts"] = prompts
+        await self._write(record)
+
+    async def record_tool(self, api_name: str, params: dict, result: Any, latency_seconds: float, error: Optional[Exception] = None):
+        record: dict[str, Any] = {
+            "kind": "tool",
+            "key": tool_key(api_name, params),
+            "api_name": api_name,
+            "params": params,
+            "latency_seconds": latency_seconds,
+        }
+        if error is not None:
+            record["error"] = {"type": type(error).__name__, "message": getattr(error, "message", str(error)),
+                               "retryable": getattr(error, "retryable", False)}
+        else:
+            record["result"] = result
+        await self._write(record)
+
+    async def _write(self, record: dict):
+        assert self.config.record_path is not None
+        line = orjson.dumps(record, default=str, option=orjson.OPT_APPEND_NEWLINE)
+        async with self.lock:
+            async with aiofiles.open(self.config.record_path, "ab") as f:
+                await f.write(line)
+
+class Recording:
+    """Calls recorded by `Recorder`, indexed to be played back.
+
+    Calls are matched by their keys, and the first recorded match is replayed, so a recording can be replayed by
+    any number of sessions.  Recorded latencies are multiplied by `latency_scale`: 1 for real time, 0 to measure
+    the overhead of the framework alone.
+    """
+
+    @register_configs("replay")
+    class Config(BaseConfig):
+        recording_path: Optional[str] = None  # JSONL file written by Recorder.  If set, tools are replaced by their replay.
+        latency_scale: float = 1.0  # Factor applied to the recorded latencies.  0 to replay without waiting.
+
+    def __init__(self, config: dict):
+        self.config = self.Config.from_dict(config)
+        assert self.config.recording_path is not None, "replay.recording_path is not set."
+        self.llm_calls: dict[str, dict] = {}  # By prompts key and by turn key.
+        self.tool_calls: dict[str, dict] = {}  # By tool key.
+        with open(self.config.recording_path, "rb") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = orjson.loads(line)
+                if record["kind"] == "llm":
+                    self.llm_calls.setdefault(record["prompts_key"], record)
+                    self.llm_calls.setdefault(record["turn_key"], record)
+                elif record["kind"] == "tool":
+                    self.tool_calls.setdefault(record["key"], record)
+        logger.info(f"Loaded recording {self.config.recording_path} with {len(self.llm_calls)} LLM keys and {len(self.tool_calls)} tool calls")
+
+    @classmethod
+    def get(cls, config: dict) -> "Recording":
+        """Return the recording of the process, loading it on first use."""
+        replay_config = cls.Config.from_dict(config)
+        assert replay_config.recording_path is not None, "replay.recording_path is not set."
+        key = (replay_config.recording_path, replay_config.latency_scale)
+        if key not in _RECORDINGS:
+            _RECORDINGS[key] = cls(config)
+        return _RECORDINGS[key]
+
+    def find_llm(self, prompts: list[dict], stop: Optional[list[str]]) -> Optional[dict]:
+        prompts_key, turn_key = llm_keys(prompts, stop)
+        return self.llm_calls.get(prompts_key) or self.llm_calls.get(turn_key)
+
+    def find_tool(self, api_name: str, params: dict) -> Optional[dict]:
+        return self.tool_calls.get(tool_key(api_name, params))
+
+    async def wait(self, seconds: Optional[float]):
+        if seconds and self.config.latency_scale > 0:
+            await asyncio.sleep(seconds * self.config.latency_scale)
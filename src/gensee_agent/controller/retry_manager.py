@@ -0,0 +1,90 @@
+from collections import deque
+import random
+import time
+from typing import Literal, Optional
+
+from gensee_agent.utils.configs import BaseConfig, register_configs
+from gensee_agent.utils.logging import configure_logger
+
+logger = configure_logger(__name__)
+
+RetryKind = Literal["llm", "tool"]
+
+# Timestamps of the retries of all tasks in this process, for the process-wide budget.
+_PROCESS_RETRIES: deque[float] = deque()
+
+class RetryManager:
+    """Decide whether and when a failed step is retried.
+
+    A step is only retried if it raised a retryable `GenseeError`.  The delay grows exponentially with the
+    number of attempts of the same step, with random jitter so that concurrent tasks don't retry in lockstep.
+    Retries are limited per step (separately for LLM calls and tool calls), per task, and per process within
+    a sliding time window, so that an outage does not turn into a retry storm.
+    """
+
+    @register_configs("retry_manager")
+    class Config(BaseConfig):
+        enabled: bool = True  # Whether to retry steps that failed with a retryable error.
+        llm_max_retries: int = 3  # Max retries of one LLM call.
+        llm_base_delay_seconds: float = 1.0  # Delay before the first retry of an LLM call.
+        llm_max_delay_seconds: float = 30.0  # Upper bound of the delay between retries of an LLM call.
+        tool_max_retries: int = 2  # Max retries of one tool call step.
+        tool_base_delay_seconds: float = 0.5  # Delay before the first retry of a tool call step.
+        tool_max_delay_seconds: float = 10.0  # Upper bound of the delay between retries of a tool call step.
+        backoff_multiplier: float = 2.0  # Factor applied to the delay after each attempt.
+        jitter: float = 0.5  # Relative random variation of the delay, between 0 (none) and 1.
+        task_retry_budget: int = 10  # Max retries over the whole task, all steps included.
+        process_retry_budget: int = 100  # Max retries of all tasks in this process within the window below.
+        process_retry_window_seconds: float = 60.0  # Sliding window of the process retry budget.
+
+        def __post_init__(self):
+            if not 0 <= self.jitter <= 1:
+                raise ValueError(f"jitter must be between 0 and 1, got {self.jitter}.")
+            if self.backoff_multiplier < 1:
+                raise ValueError(f"backoff_multiplier must be at least 1, got {self.backoff_multiplier}.")
+
+    def __init__(self, config: dict):
+        self.config = self.Config.from_dict(config)
+        self.retry_stats = {
+            "llm_retries": 0,
+            "tool_retries": 0,
+            "exhausted_step_retries": 0,  # Failures after the max retries of a step.
+            "exhausted_task_budget": 0,  # Failures because the task used up its budget.
+            "exhausted_process_budget": 0,  # Failures because all tasks used up the process budget.
+        }
+
+    def max_retries(self, kind: RetryKind) -> int:
+        return self.config.llm_max_retries if kind == "llm" else self.config.tool_max_retries
+
+    def next_delay(self, kind: RetryKind, attempt: int, task_retries: int) -> Optional[float]:
+        """Return the delay in seconds before retry number `attempt` (starting at 1) of a step, or None to give up.
+
+        `task_retries` is the number of retries already done by the task.  A returned delay counts against the budgets.
+        """
+        if not self.config.enabled:
+            return None
+        if attempt > self.max_retries(kind):
+            self.retry_stats["exhausted_step_retries"] += 1
+            return None
+        if task_retries >= self.config.task_retry_budget:
+            self.retry_stats["exhausted_task_budget"] += 1
+            return None
+        now = time.monotonic()
+        while _PROCESS_RETRIES and _PROCESS_RETRIES[0] < now - self.config.process_retry_window_seconds:
+            _PROCESS_RETRIES.popleft()
+        if len(_PROCESS_RETRIES) >= self.config.process_retry_budget:
+            self.retry_stats["exhausted_process_budget"] += 1
+            return None
+        _PROCESS_RETRIES.append(now)
+        self.retry_stats[f"{kind}_retries"] += 1
+
+        if kind == "llm":
+            base_delay, max_delay = self.config.llm_base_delay_seconds, self.config.llm_max_delay_seconds
+        else:
+            base_delay, max_delay = self.config.tool_base_delay_seconds, self.config.tool_max_delay_seconds
+        delay = base_delay * self.config.backoff_multiplier ** (attempt - 1)
+        delay *= random.uniform(1 - self.config.jitter, 1 + self.config.jitter)
+        return min(delay, max_delay)
+
+    def stats(self) -> dict:
+        return {"retries": dict(self.retry_stats)}
@@ -0,0 +1,125 @@
+import asyncio
+import mmap
+import os
+import re
+import time
+import uuid
+from typing import Any
+
+from gensee_agent.settings import Settings
+from gensee_agent.utils.configs import BaseConfig, register_configs
+from gensee_agent.utils.logging import configure_logger
+
+logger = configure_logger(__name__)
+
+_HANDLE_PATTERN = re.compile(r"[0-9a-f]{16}")
+
+class SpillStore:
+    """Local store of oversized tool results, so that they do not fill the prompts, the memory and the history.
+
+    A result longer than `max_inline_chars` is written to a file under `directory`, and the LLM gets a preview of
+    it with a handle instead.  The "system.spilled_results" tool reads and greps the stored result by handle, a
+    bounded page at a time, through a memory map of the file.  Files expire after `ttl_seconds`.
+    """
+
+    @register_configs("spill_store")
+    class Config(BaseConfig):
+        enabled: bool = False  # Whether to spill oversized tool results.
+        max_inline_chars: int = 20000  # Results longer than this are spilled.  Also the max size of a page read back.
+        preview_chars: int = 2000  # Size of the preview of a spilled result given to the LLM.
+        directory: str = ".tool_spill"  # Directory of the spilled results.
+        ttl_seconds: float = 86400  # How long spilled results are kept.
+        max_grep_bytes: int = 16 * 1024 * 1024  # Max number of bytes a grep scans, from its offset, since the pattern comes from the LLM.
+
+    def __init__(self, config: dict):
+        self.config = self.Config.from_dict(config)
+        self.cleaned_at = 0.0
+        self.spill_stats = {
+            "spilled": 0,
+            "spilled_chars": 0,
+        }
+        if self.config.enabled:
+            os.makedirs(self.config.directory, exist_ok=True)
+            self.cleanup()
+
+    async def maybe_spill(self, api_name: str, result: Any) -> Any:
+        """Return `result`, or the preview of it with its handle if it is too long."""
+        if not self.config.enabled or not isinstance(result, str) or len(result) <= self.config.max_inline_chars:
+            return result
+        handle = uuid.uuid4().hex[:16]
+        # Encoding and writing megabytes would block the event loop.
+        size = await asyncio.to_thread(self._write, handle, result)
+        self.spill_stats["spilled"] += 1
+        self.spill_stats["spilled_chars"] += len(result)
+        logger.info(f"Spilled the result of {api_name} ({len(result)} characters) as {handle}")
+        if time.time() - self.cleaned_at > 60:
+            self.cleaned_at = time.time()
+            await asyncio.to_thread(self.cleanup)
+        tool_name = f"system{Settings.SEPARATOR}spilled_results"
+        return (f"[The result is too long to show: {len(result)} characters ({size} bytes), stored with handle \"{handle}\". "
+                f"Only the first {self.config.preview_chars} characters are shown. Use {tool_name}{Settings.SEPARATOR}read or "
+                f"{tool_name}{Settings.SEPARATOR}grep with this handle to see the rest.]\n"
+                f"{result[:self.config.preview_chars]}")
+
+    def read(self, handle: str, offset: int, length: int) -> str:
+        """Up to `length` bytes of a spilled result, from byte `offset`."""
+        length = max(0, min(length, self.config.max_inline_chars))
+        with self._map(handle) as data:
+            # Characters cut at the boundaries of the page are dropped.
+            return data[max(0, offset):max(0, offset) + length].decode("utf-8", errors="ignore")
+
+    def grep(self, handle: str, pattern: str, max_matches: int, context_bytes: int, offset: int = 0) -> dict:
+        """Matches of the regular expression `pattern` in a spilled result, with their byte offset and context.
+
+        At most `max_grep_bytes` are scanned from byte `offset`.  `next_offset` tells where to continue, if the scan
+        stopped before the end of the result.
+        """
+        try:
+            regex = re.compile(pattern.encode("utf-8"))
+        except re.error as e:
+            raise ValueError(f"Invalid pattern {pattern}: {e}")
+        matches: list[dict] = []
+        budget = self.config.max_inline_chars
+        offset = max(0, offset)
+        with self._map(handle) as data:
+            end = min(len(data), offset + self.config.max_grep_bytes)
+            next_offset = end if end < len(data) else None
+            for match in regex.finditer(data, offset, end):  # type: ignore[call-overload]
+                context = data[max(0, match.start() - context_bytes):match.end() + context_bytes].decode("utf-8", errors="ignore")
+                budget -= len(context)
+                if len(matches) >= max_matches or budget < 0:
+                    next_offset = match.start()
+                    break
+                matches.append({"offset": match.start(), "text": context})
+        return {"matches": matches, "next_offset": next_offset}
+
+    def cleanup(self):
+        """Remove the expired spilled results."""
+        self.cleaned_at = time.time()
+        expired_before = self.cleaned_at - self.config.ttl_seconds
+        for entry in os.scandir(self.config.directory):
+            try:
+                if entry.name.endswith(".txt") and entry.stat().st_mtime < expired_before:
+                    os.remove(entry.path)
+            except OSError as e:
+                logger.warning(f"Failed to remove spilled result {entry.path}: {e}")
+
+    def _write(self, handle: str, result: str) -> int:
+        with open(self._path(handle), "w", encoding="utf-8") as f:
+            f.write(result)
+        return os.path.getsize(self._path(handle))
+
+    def _path(self, handle: str) -> str:
+        return os.path.join(self.config.directory, f"{handle}.txt")
+
+    def _map(self, handle: str) -> mmap.mmap:
+        if not _HANDLE_PATTERN.fullmatch(handle):
+            raise ValueError(f"Invalid handle {handle}.")
+        path = self._path(handle)
+        if not os.path.exists(path):
+            raise ValueError(f"No spilled result with handle {handle}.  It may have expired.")
+        with open(path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def stats(self) -> dict:
+        return dict(self.spill_stats)
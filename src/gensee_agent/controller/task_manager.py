@@ -1,17 +1,22 @@
+import asyncio
 from enum import Enum
-from typing import AsyncIterator, Optional, cast
+from typing import Any, AsyncIterator, Optional, cast
 import uuid
 
+from gensee_agent.controller.context_manager import ContextManager
 from gensee_agent.controller.dataclass.llm_response import LLMResponses
 from gensee_agent.controller.dataclass.llm_use import LLMUse
-from gensee_agent.controller.dataclass.tool_use import ToolUse
+from gensee_agent.controller.dataclass.tool_use import ToolUse, ToolUses
 from gensee_agent.controller.history_manager import HistoryManager
 from gensee_agent.controller.llm_manager import LLMManager
 from gensee_agent.controller.message_handler import MessageHandler
+from gensee_agent.controller.message_parser import StreamingMessageParser
 from gensee_agent.controller.prompt_manager import PromptManager
+from gensee_agent.controller.llm_cache import CacheMode
+from gensee_agent.controller.retry_manager import RetryKind, RetryManager
 from gensee_agent.controller.tool_manager import ToolManager
 from gensee_agent.exceptions.gensee_exceptions import GenseeError, ShouldStop
-from gensee_agent.utils.streaming_data import StreamingData
+from gensee_agent.utils.streaming_data import StreamingData, new_conversation
 from gensee_agent.utils.logging import configure_logger
 
 logger = configure_logger(__name__)
@@ -48,7 +53,13 @@ class TaskManager:
     def __init__(self, *,
                  llm_manager: LLMManager, tool_manager: ToolManager, prompt_manager: PromptManager, message_handler: MessageHandler,
                  allow_interaction: bool,
-                 streaming: bool):
+                 streaming: bool,
+                 parallel_tool_use: bool = False,
+                 max_parallel_tool_calls: int = 4,
+                 retry_manager: Optional[RetryManager] = None,
+                 context_manager: Optional[ContextManager] = None,
+                 llm_cache: CacheMode = "use",
+                 priority: int = 0):
         self.task_id = uuid.uuid4().hex
         self.task_state = TaskState(TaskState.IDLE)
         self.llm_manager = llm_manager
@@ -57,12 +68,33 @@ class TaskManager:
         self.message_handler = message_handler
         self.next_action = Action.NONE
         self.allow_interaction = allow_interaction
-        self.streaming = streaming  # Not used yet
+        self.streaming = streaming  # Whether to stream LLM output token by token
+        self.parallel_tool_use = parallel_tool_use  # Whether the LLM may request several tools in one message
+        self.max_parallel_tool_calls = max_parallel_tool_calls  # Max number of tool calls running concurrently
+        self.tool_semaphore = asyncio.Semaphore(max(1, max_parallel_tool_calls))
+        # Tool uses dispatched while the LLM response was still streaming, and their running executions by call_id.
+        self.dispatched_tool_uses: ToolUses = []
+        self.dispatched_executions: dict[str, asyncio.Task] = {}
+        self.stop_sequences: Optional[list[str]] = None
+        self.tools: Optional[list[dict]] = None  # Tools declared to the provider, in native tool calling mode.
+        self.retry_manager = retry_manager
+        self.context_manager = context_manager
+        self.llm_cache = llm_cache  # Whether LLM calls of this task use the completion cache.
+        self.priority = priority  # Priority of the LLM calls of this task under rate limits, lower first.
+        self.retry_count = 0  # Number of retries done by this task, all steps included.
+        self.step_attempts = 0  # Number of retries of the current step.
+        # Results of the tool calls that succeeded, so that retrying a step with several tool calls only reruns the failed ones.
+        self.completed_tool_results: dict[str, Any] = {}
 
     async def create_task(self, title: str, prompt: str, history_manager: HistoryManager, *, model_name: Optional[str] = None, use_tool: bool = True, additional_context: Optional[str] = None):
         # TODO: Haven't used history yet.
         self.history_manager = history_manager
         await self.history_manager.read_history()
+        native_tool_calls = self.llm_manager.config.native_tool_calls
+        self.stop_sequences = self.llm_manager.default_stop_sequences(use_tool=use_tool, parallel_tool_use=self.parallel_tool_use,
+                                                                      native_tool_calls=native_tool_calls)
+        if use_tool and native_tool_calls:
+            self.tools = self.tool_manager.tool_specs
 
         if history_manager.entry_count() == 0:
             # New task, so we need to generate the initial prompt.
@@ -70,6 +102,8 @@ class TaskManager:
                 user_objective=prompt,
                 tool_descriptions=self.tool_manager.tool_descriptions,
                 allow_interaction=self.allow_interaction,
+                parallel_tool_use=self.parallel_tool_use,
+                native_tool_calls=native_tool_calls,
                 use_tool=use_tool,
                 additional_context=additional_context,
             )
@@ -103,7 +137,26 @@ class TaskManager:
                         session_id=self.task_id,
                         message=self.history_manager.get_last_entry_title(),
                     ).to_streaming_output()
-                next_action = await self.step()
+                if next_action == Action.LLM_USE and self.streaming:
+                    # All deltas of one LLM response share the same conversation_id.
+                    conversation_id = new_conversation()
+                    yield StreamingData.start(session_id=self.task_id, conversation_id=conversation_id).to_streaming_output()
+                    try:
+                        async for delta in self.step_stream():
+                            yield StreamingData.assistant(
+                                session_id=self.task_id,
+                                message=delta,
+                                conversation_id=conversation_id,
+                            ).to_streaming_output()
+                    except GenseeError:
+                        # Close the interrupted response before reporting the retry or the error.
+                        yield StreamingData.end(session_id=self.task_id, conversation_id=conversation_id).to_streaming_output()
+                        raise
+                    yield StreamingData.end(session_id=self.task_id, conversation_id=conversation_id).to_streaming_output()
+                    next_action = self.next_action
+                else:
+                    next_action = await self.step()
+                self.step_attempts = 0
             except ShouldStop as e:
                 self.task_state.set(TaskState.COMPLETED)
                 # logger.info(f"Task paused for user interaction: {e}"))
@@ -111,15 +164,25 @@ class TaskManager:
                     session_id=self.task_id,
                     message=f"Task paused for user interaction: {e}"
                 ).to_streaming_output()
+                yield self._usage_metadata()
                 return
             except GenseeError as e:
+                retry = await self._prepare_retry(next_action, e)
+                if retry is not None:
+                    yield StreamingData.status(
+                        session_id=self.task_id,
+                        message=retry,
+                        obj_type="retry",
+                    ).to_streaming_output()
+                    await asyncio.sleep(retry["delay_seconds"])
+                    continue
                 self.task_state.set(TaskState.ERROR)
-                # TODO: Check whether the error is retryable, and if so, maybe retry a few times?
                 logger.error(f"Task encountered an error: {e}")
                 yield StreamingData.error(
                     session_id=self.task_id,
                     message=f"Task encountered an error: {e}"
                 ).to_streaming_output()
+                yield self._usage_metadata()
                 return
         result = self.history_manager.get_last_entry_of_type("llm_response")
         if result is None:
@@ -139,6 +202,15 @@ class TaskManager:
                     session_id=self.task_id,
                     message=result[-1].content
                 ).to_streaming_output()
+        yield self._usage_metadata()
+
+    def _usage_metadata(self) -> str:
+        """Token, latency and cost totals of the LLM calls of the task, sent as the last frame."""
+        return StreamingData.metadata(
+            session_id=self.task_id,
+            metadata=self.history_manager.usage_summary(),
+            obj_type="usage",
+        ).to_streaming_output()
 
     async def step(self) -> Action:
         if self.task_state.get() == TaskState.ERROR:
@@ -147,11 +219,9 @@ class TaskManager:
             raise ValueError("Task is not running or initialized.")
         if self.next_action == Action.LLM_USE:
             self.task_state.set(TaskState.RUNNING_LLM)
-            last_llm_use = self.history_manager.get_last_entry_of_type("llm_use")
-            if last_llm_use is None:
-                raise ValueError("No previous LLM use found in history.")
-            last_llm_use = cast(LLMUse, last_llm_use)
-            result = await self.llm_manager.completion(last_llm_use)
+            last_llm_use = await self._prepare_llm_use()
+            result = await self.llm_manager.completion(last_llm_use, stop=self.stop_sequences, cache=self.llm_cache, priority=self.priority,
+                                                        tools=self.tools, parallel_tool_calls=self.parallel_tool_use)
             await self.history_manager.add_entry("llm_response", result[-1].title, result)
             # logger.info(f"LLM response: {result}")
             self.next_action = Action.PARSE_LLM
@@ -171,15 +241,24 @@ class TaskManager:
             new_llm_use = last_llm_use.copy()
             if last_response[-1].content is not None:
                 new_llm_use.append_assistant_prompt(last_response[-1].content)
+                provider_state = last_response[-1].provider_state
+                if provider_state is not None and provider_state["length"] == len(new_llm_use):
+                    # The provider has the conversation up to this response, so the next call only sends what follows.
+                    # Not when compacting the prompts (see ContextManager) changed their number, since the offsets would differ.
+                    new_llm_use.provider_state = provider_state
             await self.history_manager.add_entry("llm_use", title=last_response[-1].title, entry=new_llm_use)
 
-            if last_response and last_response[-1].content is not None:
-                tool_use = self.message_handler.handle_message(last_response[-1].content)
+            if self.dispatched_tool_uses:
+                # Already parsed (and dispatched) while streaming.
+                tool_uses = self.dispatched_tool_uses
+                self.dispatched_tool_uses = []
+            elif last_response and last_response[-1].content is not None:
+                tool_uses = self.message_handler.handle_message(last_response[-1].content, allow_multiple=self.parallel_tool_use)
             else:
-                tool_use = None
-            if tool_use is not None:
-                await self.history_manager.add_entry("tool_use", title=f"Prepare to call {tool_use.title()}", entry=tool_use)
-                logger.info(f"Parsed tool use: {tool_use}")
+                tool_uses = []
+            if tool_uses:
+                await self.history_manager.add_entry("tool_use", title=f"Prepare to call {self._tool_uses_title(tool_uses)}", entry=tool_uses)
+                logger.info(f"Parsed tool uses: {tool_uses}")
                 self.next_action = Action.TOOL_USE
             else:
                 # Looks to be finished.
@@ -187,13 +266,14 @@ class TaskManager:
 
         elif self.next_action == Action.TOOL_USE:
             self.task_state.set(TaskState.RUNNING_TOOL)
-            last_tool_use = self.history_manager.get_last_entry_of_type("tool_use")
-            if last_tool_use is None:
+            last_tool_uses = self.history_manager.get_last_entry_of_type("tool_use")
+            if last_tool_uses is None:
                 raise ValueError("No previous tool use found in history.")
-            last_tool_use = cast(ToolUse, last_tool_use)
-            result = await self.tool_manager.execute(last_tool_use)
-            await self.history_manager.add_entry("tool_response", title=f"Getting result of {last_tool_use.title()}", entry=result)
-            logger.info(f"Tool response: {result}")
+            last_tool_uses = cast(ToolUses, last_tool_uses)
+            results = await self.execute_tool_uses(last_tool_uses)
+            self.completed_tool_results = {}
+            await self.history_manager.add_entry("tool_response", title=f"Getting result of {self._tool_uses_title(last_tool_uses)}", entry=results)
+            logger.info(f"Tool responses: {results}")
             self.next_action = Action.PARSE_TOOL
 
         elif self.next_action == Action.PARSE_TOOL:
@@ -212,15 +292,21 @@ class TaskManager:
                 raise ValueError("No previous LLM use found in history.")
             last_llm_use = cast(LLMUse, last_llm_use)
             # ---
-            tool_use = self.history_manager.get_last_entry_of_type("tool_use")
-            if tool_use is None:
+            tool_uses = self.history_manager.get_last_entry_of_type("tool_use")
+            if tool_uses is None:
                 raise ValueError("No previous tool use found in history.")
-            tool_use = cast(ToolUse, tool_use)
+            tool_uses = cast(ToolUses, tool_uses)
+            tool_response = cast(list, tool_response)
             new_llm_use = last_llm_use.copy()
             # if llm_response[-1].content is not None:
             #     new_llm_use.append_assistant_prompt(llm_response[-1].content)
-            title = f"Result of {tool_use.title()}"
-            new_llm_use.append_user_prompt(self.tool_manager.tool_response_to_string(tool_use, tool_response), title=title)
+            title = f"Result of {self._tool_uses_title(tool_uses)}"
+            # All results of the same message go back to the LLM in one combined user message.
+            combined_response = "\n".join(
+                self.tool_manager.tool_response_to_string(tool_use, response, include_arguments=len(tool_uses) > 1)
+                for tool_use, response in zip(tool_uses, tool_response)
+            )
+            new_llm_use.append_user_prompt(combined_response, title=title)
             await self.history_manager.add_entry("llm_use", title=title, entry=new_llm_use)
             self.next_action = Action.LLM_USE
 
@@ -229,3 +315,140 @@ class TaskManager:
             logger.info("Task completed.")
 
         return self.next_action
+
+    async def step_stream(self) -> AsyncIterator[str]:
+        """Streaming version of the LLM_USE step: yields the content deltas as the LLM produces them.
+
+        The complete response is recorded in history once the stream finishes, same as `step()`.
+        """
+        if self.next_action != Action.LLM_USE:
+            raise ValueError("step_stream() only supports the LLM_USE action.")
+        self.task_state.set(TaskState.RUNNING_LLM)
+        last_llm_use = await self._prepare_llm_use()
+        result: Optional[LLMResponses] = None
+        parser = self.message_handler.create_parser(self.stop_sequences)
+        try:
+            async for responses in self.llm_manager.completion_stream(last_llm_use, parser=parser, stop=self.stop_sequences,
+                                                                    cache=self.llm_cache, priority=self.priority, tools=self.tools,
+                                                                    parallel_tool_calls=self.parallel_tool_use):
+                self._dispatch_parsed_tool_uses(parser)
+                if responses and responses[-1].partial:
+                    if responses[-1].content:
+                        yield responses[-1].content
+                else:
+                    result = responses
+        except BaseException:
+            self._cancel_dispatched_executions()
+            raise
+        if result is None:
+            self._cancel_dispatched_executions()
+            raise ValueError("LLM stream finished without a complete response.")
+        await self.history_manager.add_entry("llm_response", result[-1].title, result)
+        self.next_action = Action.PARSE_LLM
+
+    def _dispatch_parsed_tool_uses(self, parser: StreamingMessageParser):
+        """Start executing the tool uses whose arguments have closed, without waiting for the rest of the LLM output."""
+        for event in parser.pop_events():
+            if event.type != "tool_use" or event.tool_use is None:
+                continue
+            if self.dispatched_tool_uses and not self.parallel_tool_use:
+                # Only the first tool use is executed when parallel tool use is disabled.
+                continue
+            tool_use = event.tool_use
+            logger.info(f"Dispatching tool use before the LLM response completes: {tool_use}")
+            self.dispatched_tool_uses.append(tool_use)
+            self.dispatched_executions[tool_use.call_id] = asyncio.create_task(self._execute_tool_use(tool_use))
+
+    def _cancel_dispatched_executions(self):
+        for execution in self.dispatched_executions.values():
+            execution.cancel()
+        self.dispatched_executions = {}
+        self.dispatched_tool_uses = []
+
+    async def _prepare_retry(self, action: Action, error: GenseeError) -> Optional[dict]:
+        """Check whether the step that raised `error` can be retried, and if so, record the retry in history.
+
+        Returns the retry information (also sent as a status frame), or None if the task should fail.
+        """
+        if self.retry_manager is None or not error.retryable:
+            return None
+        kind: RetryKind
+        if action == Action.LLM_USE:
+            kind = "llm"
+        elif action == Action.TOOL_USE:
+            kind = "tool"
+        else:
+            return None
+        attempt = self.step_attempts + 1
+        delay = self.retry_manager.next_delay(kind, attempt, self.retry_count)
+        if delay is None:
+            return None
+        self.step_attempts = attempt
+        self.retry_count += 1
+        retry = {
+            "action": action.name.lower(),
+            "attempt": attempt,
+            "max_retries": self.retry_manager.max_retries(kind),
+            "task_retries": self.retry_count,
+            "delay_seconds": round(delay, 3),
+            "error": error.message,
+        }
+        logger.warning(f"Retrying {retry['action']} in {retry['delay_seconds']}s (attempt {attempt}/{retry['max_retries']}) after error: {error}")
+        await self.history_manager.add_entry(
+            "retry", title=f"Retrying {'LLM call' if kind == 'llm' else 'tool call'} (attempt {attempt}/{retry['max_retries']})", entry=retry)
+        return retry
+
+    async def _prepare_llm_use(self) -> LLMUse:
+        """The last llm_use, fitted to the context budget if there is one.  The compaction is recorded in history."""
+        last_llm_use = self._get_last_llm_use()
+        if self.context_manager is None or self.context_manager.config.max_context_tokens is None:
+            return last_llm_use
+        llm_use, report, summary_responses = await self.context_manager.prepare(last_llm_use)
+        for responses in summary_responses:
+            # Recorded so that their usage counts in the totals of the task.
+            await self.history_manager.add_entry("summary", title="Summary of an earlier tool result", entry=responses)
+        await self.history_manager.add_entry(
+            "context", title=f"Context of {report['tokens_after']}/{report['budget']} tokens", entry=report)
+        return llm_use
+
+    def _get_last_llm_use(self) -> LLMUse:
+        last_llm_use = self.history_manager.get_last_entry_of_type("llm_use")
+        if last_llm_use is None:
+            raise ValueError("No previous LLM use found in history.")
+        return cast(LLMUse, last_llm_use)
+
+    async def execute_tool_uses(self, tool_uses: ToolUses) -> list[Any]:
+        """Execute the tool uses concurrently, with at most `max_parallel_tool_calls` running at the same time.
+
+        Tool uses already dispatched while the LLM response was streaming are awaited instead of executed again,
+        and so are tool uses which already succeeded before the step was retried.
+        Results are returned in the same order as `tool_uses`.  If a tool use fails, the others still run to the end
+        and their results are kept for the retry, before the first error is raised.
+        """
+        executions = [
+            self._completed_tool_result(tool_use.call_id) if tool_use.call_id in self.completed_tool_results
+            else self.dispatched_executions.pop(tool_use.call_id, None) or self._execute_tool_use(tool_use)
+            for tool_use in tool_uses
+        ]
+        if len(executions) == 1:
+            return [await executions[0]]
+        results = await asyncio.gather(*executions, return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return list(results)
+
+    async def _execute_tool_use(self, tool_use: ToolUse) -> Any:
+        async with self.tool_semaphore:
+            # Session scoped results are reused by the later runs of the session, which have other task ids.
+            result = await self.tool_manager.execute(tool_use, session_id=self.history_manager.session_id or self.task_id)
+        self.completed_tool_results[tool_use.call_id] = result
+        return result
+
+    async def _completed_tool_result(self, call_id: str) -> Any:
+        return self.completed_tool_results[call_id]
+
+    def _tool_uses_title(self, tool_uses: ToolUses) -> str:
+        if len(tool_uses) == 1:
+            return tool_uses[0].title()
+        return f"{len(tool_uses)} tools ({', '.join(tool_use.title() for tool_use in tool_uses)})"
@@ -0,0 +1,149 @@
+import asyncio
+from collections import OrderedDict
+from dataclasses import field
+import hashlib
+import time
+from typing import Any, Awaitable, Callable, Literal, Optional
+
+import orjson
+from redis.asyncio import Redis
+
+from gensee_agent.tools.base import ToolCachePolicy
+from gensee_agent.utils.configs import BaseConfig, register_configs
+from gensee_agent.utils.logging import configure_logger
+
+logger = configure_logger(__name__)
+
+class ToolCache:
+    """Cache of tool results, for the public APIs declared cacheable with `@public_api(cache_ttl=...)`.
+
+    Entries live in an in-memory LRU, and optionally in Redis, shared between processes.  Concurrent identical
+    calls are coalesced: the tool runs once and all the callers get its result.  Failed calls are not cached.
+    Results of "session" scoped APIs are only reused within the same session.
+    """
+
+    @register_configs("tool_cache")
+    class Config(BaseConfig):
+        enabled: bool = False  # Whether to cache the results of the cacheable tool APIs.
+        max_entries: int = 1024  # Max number of entries of the in-memory tier.
+        api_ttl_seconds: dict[str, float] = field(default_factory=dict)  # TTL by API name, e.g., "gensee.search.search", overriding the declared one.  0 to not cache an API.
+        tier: Optional[Literal["redis"]] = None  # Second tier, shared between processes.  None for memory only.
+        redis_url: str = "redis://localhost:6379/0"  # Server of the Redis tier.
+        redis_key_prefix: str = "gensee:tool_cache"  # Prefix of the keys of the Redis tier.
+
+    def __init__(self, config: dict):
+        self.config = self.Config.from_dict(config)
+        self.entries: OrderedDict[str, tuple[float, float, Any]] = OrderedDict()  # (stored_at, expires_at, result) by key.
+        self.in_flight: dict[str, asyncio.Task] = {}  # Calls running, by key.
+        self.redis_client: Optional[Redis] = None
+        if self.config.enabled and self.config.tier == "redis":
+            self.redis_client = Redis.from_url(self.config.redis_url)
+        self.cache_stats = {
+            "hits": 0,
+            "memory_hits": 0,
+            "tier_hits": 0,
+            "coalesced": 0,  # Calls that waited for an identical call running at the same time.
+            "misses": 0,
+            "stores": 0,
+        }
+
+    def policy(self, api_name: str, declared: Optional[ToolCachePolicy]) -> Optional[ToolCachePolicy]:
+        """Cache policy of an API, or None if its results are not cached."""
+        if not self.config.enabled:
+            return None
+        ttl = self.config.api_ttl_seconds.get(api_name)
+        if ttl is None:
+            return declared
+        if ttl == 0:
+            return None
+        # Results of APIs made cacheable by the config, e.g., MCP tools, are only shared within a session.
+        return ToolCachePolicy(ttl_seconds=ttl, key_params=declared.key_params, scope=declared.scope) if declared else ToolCachePolicy(ttl_seconds=ttl, scope="session")
+
+    def key(self, api_name: str, params: dict, policy: ToolCachePolicy, session_id: Optional[str]) -> str:
+        if policy.key_params is not None:
+            params = {name: value for name, value in params.items() if name in policy.key_params}
+        request = {"api_name": api_name, "params": params}
+        if policy.scope == "session":
+            request["session_id"] = session_id
+        data = orjson.dumps(request, option=orjson.OPT_SORT_KEYS, default=str)
+        return hashlib.sha256(data).hexdigest()
+
+    async def run(self, key: str, policy: ToolCachePolicy, call: Callable[[], Awaitable[Any]]) -> tuple[Any, Optional[float]]:
+        """Return the result of `call`, from the cache if possible, with its age in seconds if it was cached."""
+        cached = await self._get(key)
+        if cached is not None:
+            stored_at, result = cached
+            return result, time.time() - stored_at
+        task = self.in_flight.get(key)
+        if task is not None:
+            self.cache_stats["coalesced"] += 1
+        else:
+            self.cache_stats["misses"] += 1
+            task = asyncio.create_task(self._call_and_store(key, policy, call))
+            self.in_flight[key] = task
+            task.add_done_callback(lambda task: self._forget(key, task))
+        # Shielded, so that a cancelled caller does not cancel the call the others are waiting for.
+        return await asyncio.shield(task), None
+
+    async def _call_and_store(self, key: str, policy: ToolCachePolicy, call: Callable[[], Awaitable[Any]]) -> Any:
+        result = await call()
+        stored_at = time.time()
+        expires_at = stored_at + policy.ttl_seconds
+        self._memory_set(key, stored_at, expires_at, result)
+        self.cache_stats["stores"] += 1
+        if self.redis_client is not None:
+            try:
+                await self.redis_client.set(f"{self.config.redis_key_prefix}:{key}", orjson.dumps({"stored_at": stored_at, "expires_at": expires_at, "result": result}, default=str),
+                                            ex=max(1, int(policy.ttl_seconds)))
+            except Exception as e:
+                # The cache is an optimization, so failing to fill the second tier is not an error of the call.
+                logger.warning(f"Failed to store tool result in the redis cache: {e}")
+        return result
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self.in_flight.get(key) is task:
+            del self.in_flight[key]
+        if not task.cancelled():
+            task.exception()  # Retrieved here too, in case all the callers were cancelled.
+
+    async def _get(self, key: str) -> Optional[tuple[float, Any]]:
+        entry = self.entries.get(key)
+        if entry is not None:
+            stored_at, expires_at, result = entry
+            if expires_at > time.time():
+                self.entries.move_to_end(key)
+                self.cache_stats["hits"] += 1
+                self.cache_stats["memory_hits"] += 1
+                return stored_at, result
+            del self.entries[key]
+        if self.redis_client is None:
+            return None
+        try:
+            data = await self.redis_client.get(f"{self.config.redis_key_prefix}:{key}")
+        except Exception as e:
+            logger.warning(f"Failed to read tool result from the redis cache: {e}")
+            return None
+        if data is None:
+            return None
+        stored = orjson.loads(data)
+        if stored["expires_at"] <= time.time():
+            return None
+        self._memory_set(key, stored["stored_at"], stored["expires_at"], stored["result"])
+        self.cache_stats["hits"] += 1
+        self.cache_stats["tier_hits"] += 1
+        return stored["stored_at"], stored["result"]
+
+    def _memory_set(self, key: str, stored_at: float, expires_at: float, result: Any):
+        self.entries[key] = (stored_at, expires_at, result)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.config.max_entries:
+            self.entries.popitem(last=False)
+
+    async def aclose(self):
+        if self.redis_client is not None:
+            await self.redis_client.aclose()
+
+    def stats(self) -> dict:
+        lookups = self.cache_stats["hits"] + self.cache_stats["misses"] + self.cache_stats["coalesced"]
+        return {**self.cache_stats, "hit_ratio": self.cache_stats["hits"] / lookups if lookups else 0.0,
+                "entries": len(self.entries), "in_flight": len(self.in_flight)}
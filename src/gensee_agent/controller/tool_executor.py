@@ -0,0 +1,142 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import field
+import hashlib
+import json
+import multiprocessing
+import pickle
+import time
+from typing import Any, Callable, Literal, Optional
+
+import orjson
+
+from gensee_agent.exceptions.gensee_exceptions import ToolExecutionError
+from gensee_agent.tools.base import _TOOL_REGISTRY, BaseTool
+from gensee_agent.utils.configs import BaseConfig, register_configs
+from gensee_agent.utils.logging import configure_logger
+
+logger = configure_logger(__name__)
+
+ExecutionMode = Literal["inline", "thread", "process"]
+
+# Executors shared by all the tool managers of the process: one thread pool per size, and one process pool per
+# size and tool config, since the workers create their own tools from the config.
+_EXECUTORS: dict[tuple, Executor] = {}
+
+# Tools created in a worker process, by tool name.
+_WORKER_CONFIG: dict = {}
+_WORKER_TOOLS: dict[str, BaseTool] = {}
+
+def _init_worker(config: dict, user_tool_paths: list[str]):
+    import gensee_agent.tools  # noqa: F401  Registers the built-in tools.
+    from gensee_agent.controller.tool_manager import load_user_tools
+    load_user_tools(user_tool_paths)
+    _WORKER_CONFIG.update(config)
+
+def _run_in_worker(tool_name: str, func_name: str, params: dict) -> Any:
+    if tool_name not in _WORKER_TOOLS:
+        _WORKER_TOOLS[tool_name] = _TOOL_REGISTRY[tool_name](tool_name, _WORKER_CONFIG)
+    tool = _WORKER_TOOLS[tool_name]
+    result = tool._public_api_metadata[func_name]["function"](tool, **params)
+    if isinstance(result, dict) or isinstance(result, list):
+        # Sent back as JSON, which ToolManager would produce anyway, rather than as pickled objects.
+        result = json.dumps(result)
+    try:
+        pickle.dumps(result)
+    except Exception as e:
+        raise ToolExecutionError(f"Result of {tool_name}.{func_name} cannot be sent back from the worker process: {e}", retryable=False)
+    return result
+
+class ToolExecutor:
+    """Run the synchronous functions of the tools, so that a slow or CPU-heavy tool does not block the event loop
+    and every other session with it.
+
+    - "inline": on the event loop, for functions that are known to be fast.
+    - "thread": in a thread pool, for blocking I/O and code that releases the GIL.
+    - "process": in a process pool, for CPU-heavy code.  The worker processes create their own instances of the
+      tools, so the arguments and the result must be picklable, and the tools must be registered ones (built-in,
+      or loaded from `user_tool_paths`).
+
+    The mode of an API is, in order: `api_execution` of the config, `@public_api(execution=...)`, `default_execution`.
+    Functions run inline unless they opt in, since the other modes run them concurrently, and only the tool knows
+    whether it is thread-safe.  Coroutine functions always run on the event loop.
+    """
+
+    @register_configs("tool_executor")
+    class Config(BaseConfig):
+        default_execution: ExecutionMode = "inline"  # How synchronous tool functions run, unless declared otherwise.
+        api_execution: dict[str, ExecutionMode] = field(default_factory=dict)  # Mode by API name, e.g., {"gensee.letter_counter.count_letters": "thread"}.
+        max_threads: int = 8  # Size of the thread pool shared by the tools.
+        max_processes: int = 2  # Size of the process pool shared by the tools.
+
+    def __init__(self, config: dict, user_tool_paths: list[str]):
+        self.config = self.Config.from_dict(config)
+        self.raw_config = config
+        self.config_hash = hashlib.sha256(orjson.dumps(config, option=orjson.OPT_SORT_KEYS, default=str)).hexdigest()
+        self.user_tool_paths = user_tool_paths
+        self.execution_stats = {
+            "inline_calls": 0,
+            "thread_calls": 0,
+            "process_calls": 0,
+            "loop_seconds": 0.0,  # Time the event loop was blocked by inline calls.
+            "max_loop_seconds": 0.0,  # Longest inline call.
+            "thread_seconds": 0.0,
+            "process_seconds": 0.0,
+        }
+
+    def mode(self, api_name: str, declared: Optional[ExecutionMode]) -> ExecutionMode:
+        return self.config.api_execution.get(api_name) or declared or self.config.default_execution
+
+    async def run(self, mode: ExecutionMode, tool_name: str, tool: BaseTool, func: Callable, func_name: str, params: dict) -> Any:
+        """Run `func(tool, **params)`, a synchronous public API of `tool`, in `mode`."""
+        start = time.perf_counter()
+        try:
+            if mode == "inline":
+                return func(tool, **params)
+            if mode == "thread":
+                future = self._thread_pool().submit(func, tool, **params)
+            else:
+                # The arguments are validated JSON values, so they can always be pickled.
+                future = self._process_pool().submit(_run_in_worker, tool_name, func_name, params)
+            try:
+                return await asyncio.shield(asyncio.wrap_future(future))
+            except asyncio.CancelledError:
+                if not future.cancel():
+                    # A running thread or process cannot be interrupted, so the call is only over when it returns,
+                    # e.g., for the concurrency slot of ToolGuard.
+                    await asyncio.wait([asyncio.wrap_future(future)])
+                raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.execution_stats[f"{mode}_calls"] += 1
+            if mode == "inline":
+                self.execution_stats["loop_seconds"] += elapsed
+                self.execution_stats["max_loop_seconds"] = max(self.execution_stats["max_loop_seconds"], elapsed)
+            else:
+                self.execution_stats[f"{mode}_seconds"] += elapsed
+
+    def _thread_pool(self) -> Executor:
+        key = ("thread", self.config.max_threads)
+        if key not in _EXECUTORS:
+            _EXECUTORS[key] = ThreadPoolExecutor(max_workers=self.config.max_threads, thread_name_prefix="gensee-tool")
+        return _EXECUTORS[key]
+
+    def _process_pool(self) -> Executor:
+        key = ("process", self.config.max_processes, self.config_hash)
+        if key not in _EXECUTORS:
+            logger.info(f"Starting {self.config.max_processes} tool worker processes")
+            # Spawned rather than forked, since the parent runs an event loop and other threads.
+            _EXECUTORS[key] = ProcessPoolExecutor(max_workers=self.config.max_processes, mp_context=multiprocessing.get_context("spawn"),
+                                                  initializer=_init_worker, initargs=(self.raw_config, self.user_tool_paths))
+        return _EXECUTORS[key]
+
+    def stats(self) -> dict:
+        return dict(self.execution_stats)
+
+async def close_tool_executors():
+    """Shut down the executors created in this process, waiting for the running tool calls."""
+    executors = list(_EXECUTORS.values())
+    _EXECUTORS.clear()
+    for executor in executors:
+        # Off the event loop, since it waits for the running calls.
+        await asyncio.to_thread(executor.shutdown, wait=True)
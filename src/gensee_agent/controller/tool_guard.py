@@ -0,0 +1,162 @@
+import asyncio
+from dataclasses import field
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from gensee_agent.exceptions.gensee_exceptions import GenseeError, ToolExecutionError
+from gensee_agent.utils.configs import BaseConfig, register_configs
+from gensee_agent.utils.logging import configure_logger
+
+logger = configure_logger(__name__)
+
+class GuardState:
+    """Concurrency slots, timeout and circuit breaker of one tool or API, shared by all the sessions."""
+
+    def __init__(self, name: str, max_concurrency: Optional[int], timeout_seconds: Optional[float], failure_threshold: Optional[int],
+                 reset_seconds: float):
+        self.name = name
+        self.semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self.timeout_seconds = timeout_seconds
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None  # When the breaker opened, None while it is closed.
+        self.probing = False  # Whether the trial call of a half-open breaker is running.
+        self.waiting = 0
+        self.running = 0
+        self.guard_stats = {
+            "calls": 0,
+            "failures": 0,
+            "timeouts": 0,
+            "rejected": 0,  # Calls failed fast by the open breaker.
+            "opened": 0,  # Times the breaker opened.
+            "max_queue_depth": 0,
+        }
+
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_seconds else "open"
+
+    async def run(self, call: Callable[[], Awaitable[Any]]) -> Any:
+        self._admit()
+        probe = self.opened_at is not None
+        try:
+            if self.semaphore is not None:
+                self.waiting += 1
+                self.guard_stats["max_queue_depth"] = max(self.guard_stats["max_queue_depth"], self.waiting)
+                try:
+                    await self.semaphore.acquire()
+                finally:
+                    self.waiting -= 1
+            return await self._timed(call)
+        finally:
+            if probe:
+                self.probing = False
+
+    def _admit(self):
+        """Fail fast while the breaker is open.  Once `reset_seconds` have passed, one trial call goes through."""
+        state = self.state()
+        if state == "closed":
+            return
+        if state == "half_open" and not self.probing:
+            self.probing = True
+            return
+        self.guard_stats["rejected"] += 1
+        assert self.opened_at is not None
+        retry_in = max(0.0, self.opened_at + self.reset_seconds - time.monotonic())
+        raise ToolExecutionError(f"{self.name} is unavailable after {self.consecutive_failures} consecutive failures, retry in {retry_in:.1f}s.",
+                                 retryable=True)
+
+    async def _timed(self, call: Callable[[], Awaitable[Any]]) -> Any:
+        self.guard_stats["calls"] += 1
+        self.running += 1
+        task = asyncio.ensure_future(call())
+        # The slot is released when the call is over, not when the caller gives up on it: a timed out call running
+        # in a thread or process cannot be interrupted (see ToolExecutor), and still loads the backend until it returns.
+        task.add_done_callback(self._call_done)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(task), timeout=self.timeout_seconds)
+        except asyncio.TimeoutError:
+            task.cancel()
+            self.guard_stats["timeouts"] += 1
+            self._failed()
+            raise ToolExecutionError(f"{self.name} timed out after {self.timeout_seconds}s.", retryable=True)
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        except GenseeError as e:
+            # Non-retryable errors, e.g., a channel that does not exist, are errors of the call rather than of the backend.
+            if e.retryable:
+                self._failed()
+            raise
+        except Exception:
+            self._failed()
+            raise
+        self.consecutive_failures = 0
+        self.opened_at = None
+        return result
+
+    def _call_done(self, task: asyncio.Future):
+        self.running -= 1
+        if self.semaphore is not None:
+            self.semaphore.release()
+        if not task.cancelled():
+            task.exception()  # Retrieved here too, for the calls the caller gave up on.
+
+    def _failed(self):
+        self.guard_stats["failures"] += 1
+        self.consecutive_failures += 1
+        if self.failure_threshold and (self.consecutive_failures >= self.failure_threshold or self.opened_at is not None):
+            if self.opened_at is None:
+                self.guard_stats["opened"] += 1
+                logger.warning(f"Opening the circuit breaker of {self.name} after {self.consecutive_failures} consecutive failures")
+            # A failed trial call keeps the breaker open for another `reset_seconds`.
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {**self.guard_stats, "state": self.state(), "consecutive_failures": self.consecutive_failures,
+                "running": self.running, "queue_depth": self.waiting}
+
+class ToolGuard:
+    """Per-tool and per-API concurrency limits, timeouts and circuit breakers, so that a slow or failing backend
+    neither blocks the tasks forever nor gets hammered by all the sessions at once.
+
+    Settings apply per tool (e.g., "gensee.search", or "system.mcp.<server>"), or per API when the API has its own
+    entry in `overrides` (e.g., "slack_tool.fetch_channel_history").  Calls over `max_concurrency` wait for a slot.
+    Calls running longer than `timeout_seconds` fail with a retryable error.  A timed out call running in a thread or
+    process cannot be stopped, so it keeps its slot until it returns.  After `failure_threshold` consecutive
+    failures (non-retryable errors excluded), the breaker opens and calls fail fast with a retryable error for
+    `reset_seconds`, then one trial call decides whether it closes again.
+    """
+
+    @register_configs("tool_guard")
+    class Config(BaseConfig):
+        max_concurrency: Optional[int] = None  # Default max number of calls running at once per tool.  None for no limit.
+        timeout_seconds: Optional[float] = None  # Default timeout of a call.  None for no timeout.
+        failure_threshold: Optional[int] = None  # Default number of consecutive failures that opens the breaker.  None to disable it.
+        reset_seconds: float = 30.0  # Default time the breaker stays open before a trial call.
+        overrides: dict[str, dict[str, float]] = field(default_factory=dict)  # Settings by tool or API name, e.g., {"gensee.search": {"max_concurrency": 4, "timeout_seconds": 30}}.
+
+    def __init__(self, config: dict):
+        self.config = self.Config.from_dict(config)
+        self.states: dict[str, GuardState] = {}  # By tool or API name.
+
+    async def run(self, api_name: str, tool_name: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Run `call`, a call of `api_name`, within the limits of the API or of its tool."""
+        name = api_name if api_name in self.config.overrides else tool_name
+        if name not in self.states:
+            settings = self.config.overrides.get(name, {})
+            max_concurrency = settings.get("max_concurrency", self.config.max_concurrency)
+            failure_threshold = settings.get("failure_threshold", self.config.failure_threshold)
+            self.states[name] = GuardState(
+                name,
+                max_concurrency=int(max_concurrency) if max_concurrency else None,
+                timeout_seconds=settings.get("timeout_seconds", self.config.timeout_seconds),
+                failure_threshold=int(failure_threshold) if failure_threshold else None,
+                reset_seconds=settings.get("reset_seconds", self.config.reset_seconds),
+            )
+        return await self.states[name].run(call)
+
+    def stats(self) -> dict:
+        return {name: state.stats() for name, state in self.states.items()}
@@ -4,20 +4,45 @@ import importlib.util
 import json
 import os
 from pathlib import Path
+import time
 from typing import Any, Awaitable, Callable, Optional
 
+from pydantic import ValidationError
+
 from gensee_agent.utils.configs import BaseConfig, register_configs
 from gensee_agent.controller.dataclass.tool_use import ToolUse
 from gensee_agent.controller.mcp_hub import McpHub
+from gensee_agent.controller.recording import Recorder, Recording
+from gensee_agent.controller.spill_store import SpillStore
+from gensee_agent.controller.tool_cache import ToolCache
+from gensee_agent.controller.tool_guard import ToolGuard
+from gensee_agent.controller.tool_executor import ToolExecutor, close_tool_executors
 from gensee_agent.exceptions.gensee_exceptions import ToolExecutionError
 from gensee_agent.tools.base import _TOOL_REGISTRY
 from gensee_agent.tools.system_tools.mcp_tool import McpTool
+from gensee_agent.tools.system_tools.replay_tool import ReplayTool
+from gensee_agent.tools.system_tools.spill_tool import SpilledResults
 from gensee_agent.tools.system_tools.user_interaction_tool import UserInteraction
 from gensee_agent.settings import Settings
 from gensee_agent.utils.logging import configure_logger
 
 logger = configure_logger(__name__)
 
+def load_user_tools(paths: list[str]):
+    """Load the user-defined tools of the scripts in `paths`, which register them in the tool registry."""
+    for path in paths:
+        logger.info(f"Checking user-defined tools from path: {path}")
+        # Dynamically load user-defined tools from the specified paths
+        for file_path in Path(path).glob("*.py"):
+            module_name = os.path.splitext(os.path.basename(file_path))[0]
+            spec = importlib.util.spec_from_file_location(module_name, file_path)
+            if spec and spec.loader:
+                logger.info(f"Loading user-defined tool module: {file_path}")
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+            else:
+                raise ImportError(f"Could not load module from path: {path}")
+
 class ToolManager:
     @register_configs("tool_manager")
     class Config(BaseConfig):
@@ -25,33 +50,33 @@ class ToolManager:
         use_mcp: bool = False  # Whether to use MCP for tool execution.
         user_tool_paths: list[str] = field(default_factory=list)  # List of paths to user-defined tool scripts.
 
-    def __init__(self, config: dict, token: str, use_interaction: bool, interactive_callback: Optional[Callable[[str], Awaitable[str]]] = None):
+    def __init__(self, config: dict, token: str, use_interaction: bool, interactive_callback: Optional[Callable[[str], Awaitable[str]]] = None,
+                 recorder: Optional[Recorder] = None):
         assert token == "secret_token", "This class should be initialized with create() method, not directly."
         self.config = self.Config.from_dict(config)
         self.use_interaction = use_interaction
-        if self.config.user_tool_paths:
-            for path in self.config.user_tool_paths:
-                logger.info(f"Checking user-defined tools from path: {path}")
-                # Dynamically load user-defined tools from the specified paths
-                for file_path in Path(path).glob("*.py"):
-                    module_name = os.path.splitext(os.path.basename(file_path))[0]
-                    spec = importlib.util.spec_from_file_location(module_name, file_path)
-                    if spec and spec.loader:
-                        logger.info(f"Loading user-defined tool module: {file_path}")
-                        module = importlib.util.module_from_spec(spec)
-                        spec.loader.exec_module(module)
-                    else:
-                        raise ImportError(f"Could not load module from path: {path}")
+        self.recorder = recorder if recorder is not None and recorder.enabled else None
+        self.cache = ToolCache(config)
+        self.guard = ToolGuard(config)
+        self.executor = ToolExecutor(config, self.config.user_tool_paths)
+        load_user_tools(self.config.user_tool_paths)
 
         # Check tools are available
         for tool_name in self.config.available_tools:
             if tool_name not in _TOOL_REGISTRY:
                 raise ValueError(f"Tool {tool_name} is not registered in the tool registry.  Available tools: {list(_TOOL_REGISTRY.keys())}")
 
-        self.tools = {
-            tool_name: _TOOL_REGISTRY[tool_name](tool_name, config)
-            for tool_name in self.config.available_tools
-        }
+        if Recording.Config.from_dict(config).recording_path is not None:
+            # Offline replay of a recorded run.
+            self.tools = {
+                tool_name: ReplayTool(tool_name, config, _TOOL_REGISTRY[tool_name])
+                for tool_name in self.config.available_tools
+            }
+        else:
+            self.tools = {
+                tool_name: _TOOL_REGISTRY[tool_name](tool_name, config)
+                for tool_name in self.config.available_tools
+            }
         if self.use_interaction:
             tool_name = f"system{Settings.SEPARATOR}user_interaction"
             interaction_tool = UserInteraction(tool_name, config, callback=interactive_callback)
@@ -64,9 +89,17 @@ class ToolManager:
             self.tools[tool_name] = interaction_tool
             self.config.available_tools.append(tool_name)
 
+        self.spill_store = SpillStore(config)
+        if self.spill_store.config.enabled:
+            # Lets the LLM read the results too long to be shown in full.
+            tool_name = f"system{Settings.SEPARATOR}spilled_results"
+            self.tools[tool_name] = SpilledResults(tool_name, config, self.spill_store)
+            self.config.available_tools.append(tool_name)
+
     @classmethod
-    async def create(cls, config: dict, use_interaction: bool, interactive_callback: Optional[Callable[[str], Awaitable[str]]] = None) -> "ToolManager":
-        self = cls(config, token="secret_token", use_interaction=use_interaction, interactive_callback=interactive_callback)
+    async def create(cls, config: dict, use_interaction: bool, interactive_callback: Optional[Callable[[str], Awaitable[str]]] = None,
+                     recorder: Optional[Recorder] = None) -> "ToolManager":
+        self = cls(config, token="secret_token", use_interaction=use_interaction, interactive_callback=interactive_callback, recorder=recorder)
         await self.init_mcp(config)
         return self
 
@@ -80,6 +113,7 @@ class ToolManager:
                 print(f"Connected to MCP {mcp_name} with tools:", [tool.name for tool in mcp_meta.get("tools", [])])
 
         self.tool_descriptions = self.get_tool_descriptions()
+        self.tool_specs = self.get_tool_specs()
 
     def get_tool_descriptions(self) -> str:
         descriptions = []
@@ -99,7 +133,27 @@ class ToolManager:
                                     f"{tool_parameters_str if tool_parameters_str else 'None'}\n")
         return "\n".join(descriptions)
 
-    async def execute(self, tool_use: ToolUse) -> Any:
+    def get_tool_specs(self) -> list[dict]:
+        """Name, description and JSON schema of the parameters of each tool API, to declare the tools to the LLM
+        provider in native tool calling mode (see the `native_tool_calls` config of LLMManager)."""
+        specs = []
+        for tool_name, tool_func in self.tools.items():
+            for api_name, api_metadata in tool_func._public_api_metadata.items():
+                # From the validator compiled from the signature, or the input schema of MCP tools.
+                parameters = api_metadata["validator"].json_schema()
+                properties = {
+                    param_name: {"description": api_metadata.get("parameters", {}).get(param_name, {}).get("description", "") or "", **param_schema}
+                    for param_name, param_schema in parameters.get("properties", {}).items()
+                }
+                specs.append({
+                    "name": f"{tool_name}{Settings.SEPARATOR}{api_name}",
+                    "description": (api_metadata.get("description", "") or "").strip(),
+                    "parameters": {**parameters, "properties": properties},
+                })
+        return specs
+
+    async def execute(self, tool_use: ToolUse, session_id: Optional[str] = None) -> Any:
+        """Run a tool use and return its result.  `session_id` scopes the cached results of session scoped APIs."""
 
         tool_name = tool_use.tool_name()
         func_name = tool_use.func_name()
@@ -111,44 +165,75 @@ class ToolManager:
             raise ToolExecutionError(f"Function {func_name} is not a public API of tool {tool_name}. Available functions: {list(tool._public_api_metadata.keys())}", retryable=False)
         func = tool._public_api_metadata[func_name]["function"]
 
-        # Handle and parsing parameters
-        for (param_name, param_value) in tool_use.params.items():
-            if tool._public_api_metadata[func_name]["parameters"][param_name]["required"] is False:
-                if param_value is not None and isinstance(param_value, str) and (param_value.lower() == "none" or param_value.lower() == "null"):
-                    tool_use.params[param_name] = None
-                    continue
-            if tool._public_api_metadata[func_name]["parameters"][param_name]["type"] == "<class 'int'>" and isinstance(param_value, str):
-                try:
-                    tool_use.params[param_name] = int(param_value)
-                except ValueError:
-                    raise ToolExecutionError(f"Parameter {param_name} should be an integer, got {param_value}", retryable=False)
-            # type == number is from MCP.
-            if isinstance(param_value, str) and (tool._public_api_metadata[func_name]["parameters"][param_name]["type"] == "<class 'float'>" or tool._public_api_metadata[func_name]["parameters"][param_name]["type"] == "number"):
-                try:
-                    tool_use.params[param_name] = float(param_value)
-                except ValueError:
-                    raise ToolExecutionError(f"Parameter {param_name} should be a float, got {param_value}", retryable=False)
-            if isinstance(param_value, str) and tool._public_api_metadata[func_name]["parameters"][param_name]["type"] == "<class 'bool'>":
-                if param_value.lower() in ["true", "1", "yes"]:
-                    tool_use.params[param_name] = True
-                elif param_value.lower() in ["false", "0", "no"]:
-                    tool_use.params[param_name] = False
-                else:
-                    raise ToolExecutionError(f"Parameter {param_name} should be a boolean, got {param_value}", retryable=False)
-
-        if callable(func):
-            if asyncio.iscoroutinefunction(func):
-                result = await func(tool, **tool_use.params)
-            else:
-                result = func(tool, **tool_use.params)
-        else:
+        try:
+            # Coerced copy of the arguments, e.g., "3" to 3 for an int parameter.
+            params = tool._public_api_metadata[func_name]["validator"].validate(tool_use.params)
+        except ValidationError as e:
+            # Returned to the LLM as the result of the tool, so that it can fix its call instead of failing the task.
+            logger.warning(f"Invalid arguments for {tool_use.api_name}: {e}")
+            return json.dumps({
+                "error": f"Invalid arguments for {tool_use.api_name}.",
+                "details": [
+                    {"parameter": ".".join(str(part) for part in error["loc"]), "error": error["msg"]}
+                    for error in e.errors(include_url=False)
+                ],
+            })
+
+        if not callable(func):
             raise ValueError(f"{func_name} is not callable.")
 
-        if isinstance(result, dict) or isinstance(result, list):
-            return json.dumps(result)
+        async def call() -> Any:
+            start = time.perf_counter()
+            try:
+                if asyncio.iscoroutinefunction(func):
+                    result = await func(tool, **params)
+                else:
+                    mode = self.executor.mode(tool_use.api_name, tool._public_api_metadata[func_name].get("execution"))
+                    result = await self.executor.run(mode, tool_name, tool, func, func_name, params)
+            except Exception as e:
+                if self.recorder is not None:
+                    await self.recorder.record_tool(tool_use.api_name, params, None, time.perf_counter() - start, error=e)
+                raise
+
+            if isinstance(result, dict) or isinstance(result, list):
+                result = json.dumps(result)
+            if self.recorder is not None:
+                await self.recorder.record_tool(tool_use.api_name, params, result, time.perf_counter() - start)
+            if isinstance(tool, SpilledResults):
+                # Pages of spilled results are already bounded.
+                return result
+            # Spilled before caching, so that the cache only holds the preview.
+            return await self.spill_store.maybe_spill(tool_use.api_name, result)
+
+        async def guarded_call() -> Any:
+            if isinstance(tool, UserInteraction):
+                # Waits for a human, so neither a timeout nor a concurrency limit applies.
+                return await call()
+            return await self.guard.run(tool_use.api_name, tool_name, call)
+
+        cache_policy = self.cache.policy(tool_use.api_name, tool._public_api_metadata[func_name].get("cache"))
+        if cache_policy is None:
+            return await guarded_call()
+        key = self.cache.key(tool_use.api_name, params, cache_policy, session_id)
+        result, age = await self.cache.run(key, cache_policy, guarded_call)
+        if age is not None:
+            logger.info(f"Reused the cached result of {tool_use.api_name} from {age:.0f}s ago")
+            # Tells the LLM that the result may not be fresh, e.g., to call again with other arguments if needed.
+            result = f"(Cached result from {age:.0f}s ago)\n{result}"
+        return result
+
+    def stats(self) -> dict:
+        return {"cache": self.cache.stats(), "executor": self.executor.stats(), "spill_store": self.spill_store.stats(),
+                "guard": self.guard.stats()}
+
+    async def aclose(self):
+        await self.cache.aclose()
+        await close_tool_executors()
+
+    def tool_response_to_string(self, tool_use: ToolUse, tool_response: Any, include_arguments: bool = False) -> str:
+        if include_arguments:
+            # Needed to tell apart the results of several calls to the same tool in one message.
+            result = f"[{tool_use.api_name}] Arguments: {json.dumps(tool_use.params)}\nResult:\n{tool_response}\n"
         else:
-            return result
-
-    def tool_response_to_string(self, tool_use: ToolUse, tool_response: Any) -> str:
-        result = f"[{tool_use.api_name}] Result:\n{tool_response}\n"
+            result = f"[{tool_use.api_name}] Result:\n{tool_response}\n"
         return result
\ No newline at end of file
@@ -8,9 +8,16 @@ class GenseeError(Exception):
     def __str__(self):
         return f"{self.message} (Retryable: {self.retryable})"
 
+    def __reduce__(self):
+        # Pickled with both arguments, e.g., to be raised across processes by tools running in worker processes.
+        return (type(self), (self.message, self.retryable))
+
 class ImplementationError(GenseeError):
     """Custom exception for errors in implementation."""
 
+class LLMError(GenseeError):
+    """Custom exception for errors returned by LLM providers."""
+
 class ToolExecutionError(GenseeError):
     """Custom exception for errors during tool execution."""
 
@@ -0,0 +1,3 @@
+# Import all history backends to register them
+import gensee_agent.history_backends.redis_backend  # noqa: F401
+import gensee_agent.history_backends.sqlite_backend  # noqa: F401
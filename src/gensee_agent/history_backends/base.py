@@ -0,0 +1,73 @@
+from abc import ABC
+from typing import Optional
+
+from gensee_agent.controller.dataclass.llm_use import LLMUse
+
+_HISTORY_BACKEND_REGISTRY: dict[str, type["BaseHistoryBackend"]] = {}
+# Backends are shared by all the sessions of the process, so that they share their connections.
+_HISTORY_BACKEND_INSTANCES: dict[str, "BaseHistoryBackend"] = {}
+
+SessionSave = tuple["BaseSessionStore", str, LLMUse]  # (store, title, llm_use) of a queued save.
+
+class BaseSessionStore(ABC):
+    """Persist the latest `llm_use` of one session, so the session can be continued later.
+
+    Stores are expected to write only the prompts they have not stored yet, so that the cost of a save
+    does not grow with the length of the session.
+    """
+
+    async def load(self) -> Optional[tuple[str, LLMUse]]:
+        """Return the title and the latest `llm_use` of the session, or None if the session is not stored."""
+        raise NotImplementedError("This method should be overridden by subclasses.")
+
+    async def save(self, title: str, llm_use: LLMUse):
+        """Store `llm_use` as the latest `llm_use` of the session."""
+        raise NotImplementedError("This method should be overridden by subclasses.")
+
+    async def delete(self):
+        raise NotImplementedError("This method should be overridden by subclasses.")
+
+    def invalidate(self):
+        """Forget what is stored, e.g., after a failed write, so the next save rewrites the whole session."""
+        raise NotImplementedError("This method should be overridden by subclasses.")
+
+    @classmethod
+    async def save_many(cls, saves: list[SessionSave]):
+        """Save several sessions of this store class, e.g., from the write-behind queue.  Override to batch the writes."""
+        for session_store, title, llm_use in saves:
+            await session_store.save(title, llm_use)
+
+class BaseHistoryBackend(ABC):
+    """A storage for sessions, created once per process with `get_history_backend()`."""
+
+    def __init__(self, config: dict):
+        pass
+
+    def session_store(self, session_id: str, ttl_seconds: Optional[int] = None) -> BaseSessionStore:
+        """Return the store of a session.  The session expires after `ttl_seconds` without update, if set."""
+        raise NotImplementedError("This method should be overridden by subclasses.")
+
+    async def aclose(self):
+        """Release the connections and stop the background tasks of the backend."""
+        pass
+
+def register_history_backend(backend_name: str, backend_class: type[BaseHistoryBackend]):
+    assert backend_name is not None and backend_name != "", "backend_name should not be empty."
+    assert backend_name not in _HISTORY_BACKEND_REGISTRY, f"backend_name {backend_name} already registered."
+    assert issubclass(backend_class, BaseHistoryBackend), "backend_class should be a subclass of BaseHistoryBackend."
+    _HISTORY_BACKEND_REGISTRY[backend_name] = backend_class
+
+def get_history_backend(backend_name: str, config: dict) -> BaseHistoryBackend:
+    """Return the backend of the process, creating it with `config` on first use."""
+    if backend_name not in _HISTORY_BACKEND_INSTANCES:
+        if backend_name not in _HISTORY_BACKEND_REGISTRY:
+            raise ValueError(f"History backend {backend_name} is not registered.  Available backends: {list(_HISTORY_BACKEND_REGISTRY.keys())}")
+        _HISTORY_BACKEND_INSTANCES[backend_name] = _HISTORY_BACKEND_REGISTRY[backend_name](config)
+    return _HISTORY_BACKEND_INSTANCES[backend_name]
+
+async def close_history_backends():
+    """Close all the backends created in this process."""
+    backends = list(_HISTORY_BACKEND_INSTANCES.values())
+    _HISTORY_BACKEND_INSTANCES.clear()
+    for backend in backends:
+        await backend.aclose()
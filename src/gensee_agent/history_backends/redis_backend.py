@@ -0,0 +1,139 @@
+from typing import Optional, cast
+
+import orjson
+from redis.asyncio import Redis, RedisCluster
+from redis.asyncio.client import Pipeline
+from redis.asyncio.cluster import ClusterPipeline
+
+from gensee_agent.controller.dataclass.llm_use import LLMUse
+from gensee_agent.history_backends.base import BaseHistoryBackend, BaseSessionStore, SessionSave, register_history_backend
+from gensee_agent.utils.configs import BaseConfig, register_configs
+from gensee_agent.utils.logging import configure_logger
+
+logger = configure_logger(__name__)
+
+class RedisSessionStore(BaseSessionStore):
+    """Persist the latest `llm_use` of a session in Redis, so the session can be continued later.
+
+    Keys (the session ID is a hash tag, so both keys live in the same cluster slot):
+    - `{prefix}:{session_id}:messages`: list of the prompts, one JSON message per element.
+    - `{prefix}:{session_id}:meta`: hash with the model name, the provider state and the title of the latest `llm_use`.
+
+    Only the prompts not stored yet are pushed: consecutive `llm_use` entries usually only append prompts,
+    so the bytes written per step don't grow with the session.  If earlier prompts changed (e.g., an updated
+    system prompt), the list is trimmed to the unchanged prefix first.  All writes of an entry are sent in
+    one pipeline, and a session is loaded in one round trip.
+    """
+
+    def __init__(self, redis_client: Redis | RedisCluster, session_id: str, *, key_prefix: str = "gensee", ttl_seconds: Optional[int] = None):
+        self.redis_client = redis_client
+        self.session_id = session_id
+        self.messages_key = f"{key_prefix}:{{{session_id}}}:messages"
+        self.meta_key = f"{key_prefix}:{{{session_id}}}:meta"
+        self.ttl_seconds = ttl_seconds
+        self._stored_llm_use: Optional[LLMUse] = None  # Snapshot of the latest stored llm_use.
+
+    async def load(self) -> Optional[tuple[str, LLMUse]]:
+        """Return the title and the latest `llm_use` of the session, or None if the session is not stored."""
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.lrange(self.messages_key, 0, -1)
+            pipe.hgetall(self.meta_key)
+            messages, meta = await pipe.execute()
+        if not meta:
+            return None
+        meta = {self._decode(key): self._decode(value) for key, value in meta.items()}
+        llm_use = LLMUse(prompts=[orjson.loads(message) for message in messages], model_name=orjson.loads(meta["model_name"]),
+                         provider_state=orjson.loads(meta.get("provider_state", "null")))
+        self._stored_llm_use = llm_use.copy()
+        logger.info(f"Loaded session {self.session_id} with {len(llm_use)} prompts")
+        return meta["title"], llm_use
+
+    async def save(self, title: str, llm_use: LLMUse):
+        """Store `llm_use` as the latest `llm_use` of the session."""
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            self.queue_save(pipe, title, llm_use)
+            try:
+                await pipe.execute()
+            except Exception:
+                self.invalidate()
+                raise
+
+    def queue_save(self, pipe: Pipeline | ClusterPipeline, title: str, llm_use: LLMUse):
+        """Add the commands storing `llm_use` to `pipe`, e.g., to batch the writes of several sessions.
+
+        The stored state is updated right away, so the pipeline must be executed before the next save.
+        """
+        keep = llm_use.common_prefix_length(self._stored_llm_use)
+        stored_length = len(self._stored_llm_use) if self._stored_llm_use is not None else None
+        new_prompts = llm_use.prompts[keep:]
+        if stored_length is None or keep == 0:
+            # Nothing known to be stored, so also clear any previous content.
+            pipe.delete(self.messages_key)
+        elif keep < stored_length:
+            pipe.ltrim(self.messages_key, 0, keep - 1)
+        if new_prompts:
+            pipe.rpush(self.messages_key, *[orjson.dumps(prompt) for prompt in new_prompts])
+        pipe.hset(self.meta_key, mapping={"model_name": orjson.dumps(llm_use.model_name), "provider_state": orjson.dumps(llm_use.provider_state),
+                                          "title": title})
+        if self.ttl_seconds is not None:
+            pipe.expire(self.messages_key, self.ttl_seconds)
+            pipe.expire(self.meta_key, self.ttl_seconds)
+        self._stored_llm_use = llm_use.copy()
+
+    def invalidate(self):
+        self._stored_llm_use = None
+
+    @classmethod
+    async def save_many(cls, saves: list[SessionSave]):
+        """Save several sessions with one pipeline per Redis client."""
+        groups: dict[int, list[SessionSave]] = {}
+        for save in saves:
+            groups.setdefault(id(cast(RedisSessionStore, save[0]).redis_client), []).append(save)
+        for group in groups.values():
+            redis_client = cast(RedisSessionStore, group[0][0]).redis_client
+            # Not a transaction, since the sessions may be in different cluster slots.
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for session_store, title, llm_use in group:
+                    cast(RedisSessionStore, session_store).queue_save(pipe, title, llm_use)
+                try:
+                    await pipe.execute()
+                except Exception:
+                    for session_store, _, _ in group:
+                        session_store.invalidate()
+                    raise
+
+    async def delete(self):
+        await self.redis_client.delete(self.messages_key, self.meta_key)
+        self._stored_llm_use = None
+
+    def _decode(self, value: bytes | str) -> str:
+        return value.decode() if isinstance(value, bytes) else value
+
+class RedisHistoryBackend(BaseHistoryBackend):
+    """Sessions in Redis, with a client created from the configured URL.
+
+    To use an existing client instead (e.g., shared with the application), pass it as `redis_client` to
+    `Controller.run()` / `Controller.append_context()`.
+    """
+
+    @register_configs("redis_history_backend")
+    class Config(BaseConfig):
+        url: str = "redis://localhost:6379/0"  # URL of the Redis server.
+        cluster: bool = False  # Whether the server is a Redis Cluster.
+        key_prefix: str = "gensee"  # Prefix of the keys of the sessions.
+        max_connections: int = 64  # Size of the connection pool of the process.
+
+    def __init__(self, config: dict):
+        self.config = self.Config.from_dict(config)
+        if self.config.cluster:
+            self.redis_client: Redis | RedisCluster = RedisCluster.from_url(self.config.url, max_connections=self.config.max_connections)
+        else:
+            self.redis_client = Redis.from_url(self.config.url, max_connections=self.config.max_connections)
+
+    def session_store(self, session_id: str, ttl_seconds: Optional[int] = None) -> RedisSessionStore:
+        return RedisSessionStore(self.redis_client, session_id, key_prefix=self.config.key_prefix, ttl_seconds=ttl_seconds)
+
+    async def aclose(self):
+        await self.redis_client.aclose()
+
+register_history_backend("redis", RedisHistoryBackend)
@@ -0,0 +1,228 @@
+import asyncio
+import os
+import sqlite3
+import time
+from typing import Callable, Optional, TypeVar, cast
+
+import orjson
+
+from gensee_agent.controller.dataclass.llm_use import LLMUse
+from gensee_agent.history_backends.base import BaseHistoryBackend, BaseSessionStore, SessionSave, register_history_backend
+from gensee_agent.utils.configs import BaseConfig, register_configs
+from gensee_agent.utils.logging import configure_logger
+
+logger = configure_logger(__name__)
+
+T = TypeVar("T")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    model_name TEXT,
+    provider_state TEXT,
+    length INTEGER NOT NULL,
+    expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at) WHERE expires_at IS NOT NULL;
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+"""
+
+class SqliteConnectionPool:
+    """A fixed set of SQLite connections, used from worker threads so queries don't block the event loop."""
+
+    def __init__(self, path: str, size: int, busy_timeout_ms: int):
+        self.path = path
+        self.size = size
+        self.busy_timeout_ms = busy_timeout_ms
+        self.connections: asyncio.Queue[sqlite3.Connection] = asyncio.Queue()
+        self.all_connections: list[sqlite3.Connection] = []
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(f"PRAGMA busy_timeout={self.busy_timeout_ms}")
+        return connection
+
+    def open(self):
+        connection = self._connect()
+        connection.executescript(_SCHEMA)
+        self.all_connections.append(connection)
+        self.connections.put_nowait(connection)
+        for _ in range(self.size - 1):
+            connection = self._connect()
+            self.all_connections.append(connection)
+            self.connections.put_nowait(connection)
+
+    async def run(self, func: Callable[[sqlite3.Connection], T]) -> T:
+        connection = await self.connections.get()
+        thread = asyncio.ensure_future(asyncio.to_thread(func, connection))
+
+        def release(thread: asyncio.Future):
+            # Only once the thread is done with the connection, even if the caller was cancelled while it ran:
+            # e.g., another caller must not begin a transaction on it while this one is still open.
+            self.connections.put_nowait(connection)
+            if not thread.cancelled():
+                thread.exception()  # Retrieved here too, in case the caller was cancelled.
+        thread.add_done_callback(release)
+        return await asyncio.shield(thread)
+
+    async def run_in_transaction(self, func: Callable[[sqlite3.Connection], T]) -> T:
+        """Like `run()`, in a write transaction."""
+        def transaction(connection: sqlite3.Connection) -> T:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(connection)
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+            return result
+        return await self.run(transaction)
+
+    def close(self):
+        for connection in self.all_connections:
+            connection.close()
+        self.all_connections = []
+
+class SqliteSessionStore(BaseSessionStore):
+    """Store a session in the tables of SqliteHistoryBackend.
+
+    Messages are indexed by (session_id, seq), and the sessions table keeps the number of messages of the latest
+    `llm_use`, so a session loads with one range query.  Only the messages not stored yet are inserted.
+    """
+
+    def __init__(self, backend: "SqliteHistoryBackend", session_id: str, ttl_seconds: Optional[int] = None):
+        self.backend = backend
+        self.session_id = session_id
+        self.ttl_seconds = ttl_seconds
+        self._stored_llm_use: Optional[LLMUse] = None  # Snapshot of the latest stored llm_use.
+
+    async def load(self) -> Optional[tuple[str, LLMUse]]:
+        def query(connection: sqlite3.Connection) -> list[tuple]:
+            return connection.execute(
+                "SELECT s.title, s.model_name, s.provider_state, m.role, m.content FROM sessions s "
+                "LEFT JOIN messages m ON m.session_id = s.session_id AND m.seq < s.length "
+                "WHERE s.session_id = ? AND (s.expires_at IS NULL OR s.expires_at > ?) ORDER BY m.seq",
+                (self.session_id, time.time())).fetchall()
+        rows = await self.backend.pool.run(query)
+        if not rows:
+            return None
+        title, model_name, provider_state = rows[0][0], rows[0][1], rows[0][2]
+        prompts = [{"role": role, "content": content} for _, _, _, role, content in rows if role is not None]
+        llm_use = LLMUse(prompts=prompts, model_name=model_name, provider_state=orjson.loads(provider_state) if provider_state else None)
+        self._stored_llm_use = llm_use.copy()
+        logger.info(f"Loaded session {self.session_id} with {len(llm_use)} prompts")
+        return title, llm_use
+
+    async def save(self, title: str, llm_use: LLMUse):
+        await self.save_many([(self, title, llm_use)])
+
+    @classmethod
+    async def save_many(cls, saves: list[SessionSave]):
+        """Save several sessions in one transaction."""
+        writes = [cast(SqliteSessionStore, session_store)._prepare_write(title, llm_use) for session_store, title, llm_use in saves]
+        backend = cast(SqliteSessionStore, saves[0][0]).backend
+
+        def write(connection: sqlite3.Connection):
+            for session_id, title, model_name, provider_state, keep, new_messages, length, expires_at in writes:
+                connection.execute("DELETE FROM messages WHERE session_id = ? AND seq >= ?", (session_id, keep))
+                connection.executemany(
+                    "INSERT INTO messages (session_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                    [(session_id, keep + index, message["role"], message["content"]) for index, message in enumerate(new_messages)])
+                connection.execute(
+                    "INSERT INTO sessions (session_id, title, model_name, provider_state, length, expires_at) VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (session_id) DO UPDATE SET title = excluded.title, model_name = excluded.model_name, "
+                    "provider_state = excluded.provider_state, length = excluded.length, expires_at = excluded.expires_at",
+                    (session_id, title, model_name, provider_state, length, expires_at))
+        try:
+            await backend.pool.run_in_transaction(write)
+        except Exception:
+            for session_store, _, _ in saves:
+                session_store.invalidate()
+            raise
+
+    def _prepare_write(self, title: str, llm_use: LLMUse) -> tuple:
+        # Deleting from `keep` also removes messages left by a previous longer version of the session.
+        keep = llm_use.common_prefix_length(self._stored_llm_use)
+        expires_at = time.time() + self.ttl_seconds if self.ttl_seconds is not None else None
+        provider_state = orjson.dumps(llm_use.provider_state).decode() if llm_use.provider_state is not None else None
+        write = (self.session_id, title, llm_use.model_name, provider_state, keep, llm_use.prompts[keep:], len(llm_use), expires_at)
+        self._stored_llm_use = llm_use.copy()
+        return write
+
+    async def delete(self):
+        def delete(connection: sqlite3.Connection):
+            connection.execute("DELETE FROM messages WHERE session_id = ?", (self.session_id,))
+            connection.execute("DELETE FROM sessions WHERE session_id = ?", (self.session_id,))
+        await self.backend.pool.run_in_transaction(delete)
+        self._stored_llm_use = None
+
+    def invalidate(self):
+        self._stored_llm_use = None
+
+class SqliteHistoryBackend(BaseHistoryBackend):
+    """Sessions in a local SQLite database in WAL mode, for single-node deployments without Redis.
+
+    All sessions of the process share one connection pool.  Expired sessions (see `session_ttl_seconds` of
+    `history_manager`) are not loaded anymore, and are deleted by a background task.
+    """
+
+    @register_configs("sqlite_history_backend")
+    class Config(BaseConfig):
+        path: str = "gensee_history.db"  # Path of the database file.
+        pool_size: int = 4  # Number of connections of the process.
+        busy_timeout_ms: int = 5000  # How long a write waits for another connection's write to finish.
+        eviction_interval_seconds: float = 60.0  # How often expired sessions are deleted.
+
+    def __init__(self, config: dict):
+        self.config = self.Config.from_dict(config)
+        directory = os.path.dirname(os.path.abspath(self.config.path))
+        os.makedirs(directory, exist_ok=True)
+        self.pool = SqliteConnectionPool(self.config.path, max(1, self.config.pool_size), self.config.busy_timeout_ms)
+        self.pool.open()
+        self.eviction_task: Optional[asyncio.Task] = None
+
+    def session_store(self, session_id: str, ttl_seconds: Optional[int] = None) -> SqliteSessionStore:
+        if self.eviction_task is None:
+            self.eviction_task = asyncio.create_task(self._evict_loop())
+        return SqliteSessionStore(self, session_id, ttl_seconds=ttl_seconds)
+
+    async def evict_expired_sessions(self) -> int:
+        """Delete the expired sessions and return how many were deleted."""
+        def evict(connection: sqlite3.Connection) -> int:
+            now = time.time()
+            connection.execute(
+                "DELETE FROM messages WHERE session_id IN "
+                "(SELECT session_id FROM sessions WHERE expires_at IS NOT NULL AND expires_at <= ?)", (now,))
+            return connection.execute("DELETE FROM sessions WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)).rowcount
+        return await self.pool.run_in_transaction(evict)
+
+    async def _evict_loop(self):
+        while True:
+            await asyncio.sleep(self.config.eviction_interval_seconds)
+            try:
+                evicted = await self.evict_expired_sessions()
+                if evicted:
+                    logger.info(f"Evicted {evicted} expired sessions")
+            except sqlite3.Error as e:
+                logger.error(f"Failed to evict expired sessions: {e}")
+
+    async def aclose(self):
+        if self.eviction_task is not None:
+            self.eviction_task.cancel()
+            try:
+                await self.eviction_task
+            except asyncio.CancelledError:
+                pass
+            self.eviction_task = None
+        self.pool.close()
+
+register_history_backend("sqlite", SqliteHistoryBackend)
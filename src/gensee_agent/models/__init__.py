@@ -1,3 +1,4 @@
 # Import all models to register them
 import gensee_agent.models.openai  # noqa: F401
-import gensee_agent.models.gemini  # noqa: F401
\ No newline at end of file
+import gensee_agent.models.gemini  # noqa: F401
+import gensee_agent.models.replay  # noqa: F401
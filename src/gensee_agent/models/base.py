@@ -1,24 +1,70 @@
 from abc import ABC
-from typing import Any, AsyncGenerator
+from typing import Any, AsyncGenerator, Optional
 
-from gensee_agent.controller.dataclass.llm_response import LLMResponses
+from gensee_agent.controller.dataclass.llm_response import LLMResponses, LLMUsage
+from gensee_agent.settings import Settings
 
 _MODEL_REGISTRY: dict[str, type["BaseModel"]] = {}
 
 class BaseModel(ABC):
+    supports_stop_sequences: bool = True  # Whether the provider accepts stop sequences.  If not, LLMManager cuts the output itself.
+    supports_native_tool_calls: bool = False  # Whether `completion` and `completion_stream` accept `tools`.
 
     def __init__(self, model_name: str, config: dict):
-        pass
+        # API names of the tools by their native name, to translate the tool calls of the responses back.
+        self.tool_api_names: dict[str, str] = {}
+
+    async def completion(self, messages: list, stop: Optional[list[str]] = None, tools: Optional[list[dict]] = None,
+                         parallel_tool_calls: bool = True, provider_state: Optional[dict] = None) -> Any:
+        """Complete `messages`.  `tools` are the specs of `ToolManager.get_tool_specs()`, declared to the provider if given.
+        Without `parallel_tool_calls`, the provider is asked for at most one tool call, if it supports that.
+
+        Tool calls of the response are rendered as <tool_use> blocks at the end of the content, so that they are
+        recorded and parsed the same way as tool uses written by the LLM.
 
-    async def completion(self, messages: list) -> Any:
+        `provider_state` is the state returned by `to_provider_state()` for an earlier response of the conversation,
+        if any.  The provider already has its first `provider_state["length"]` messages.
+        """
         raise NotImplementedError("This method should be overridden by subclasses.")
 
-    async def completion_stream(self, messages: list) -> AsyncGenerator[Any, None]:
+    async def completion_stream(self, messages: list, stop: Optional[list[str]] = None, tools: Optional[list[dict]] = None,
+                                parallel_tool_calls: bool = True, provider_state: Optional[dict] = None) -> AsyncGenerator[Any, None]:
         raise NotImplementedError("This method should be overridden by subclasses.")
 
     def to_llm_responses(self, response: Any) -> LLMResponses:
         raise NotImplementedError("This method should be overridden by subclasses.")
 
+    def to_partial_llm_responses(self, chunk: Any) -> LLMResponses:
+        """Convert one chunk from `completion_stream` into partial responses, carrying only the new content."""
+        raise NotImplementedError("This method should be overridden by subclasses.")
+
+    @property
+    def client_key(self) -> Optional[tuple[str, Optional[str]]]:
+        """Key of the client shared with the other models in ProviderClients, or None if the model has no client."""
+        return None
+
+    async def prewarm(self):
+        """Open a connection to the provider ahead of the first request, e.g., with a request that costs no tokens."""
+        pass
+
+    def to_llm_usage(self, response: Any) -> Optional[LLMUsage]:
+        """Token counts of a response or stream chunk, if the provider reports them.  Timing is set by LLMManager."""
+        return None
+
+    def to_provider_state(self, response: Any) -> Optional[dict]:
+        """State of the conversation kept by the provider after a response or the last chunk of a stream, e.g., the id
+        of the response to continue from.  None if the provider keeps no state."""
+        return None
+
+    def native_tool_name(self, api_name: str) -> str:
+        """Name of a tool as declared to the provider, which only accepts letters, digits, "_" and "-"."""
+        native_name = api_name.replace(Settings.SEPARATOR, "__")
+        self.tool_api_names[native_name] = api_name
+        return native_name
+
+    def tool_api_name(self, native_name: str) -> str:
+        return self.tool_api_names.get(native_name, native_name)
+
 def register_model_provider(model_name: str, model_class: type[BaseModel]):
     assert model_name is not None and model_name != "", "model_name should not be empty."
     assert model_name not in _MODEL_REGISTRY, f"model_name {model_name} already registered."
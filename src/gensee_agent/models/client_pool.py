@@ -0,0 +1,59 @@
+from typing import Any, Awaitable, Callable, Optional
+
+import httpx
+
+from gensee_agent.utils.configs import BaseConfig, register_configs
+from gensee_agent.utils.logging import configure_logger
+
+logger = configure_logger(__name__)
+
+# Clients shared by all the models of the process, by (provider, API key), so that models of the same provider
+# share one HTTP connection pool.
+_PROVIDER_CLIENTS: dict[tuple[str, Optional[str]], Any] = {}
+_CLIENT_CLOSERS: dict[tuple[str, Optional[str]], Callable[[], Awaitable[Any]]] = {}
+
+class ProviderClients:
+    """HTTP clients of the LLM providers, shared by all the models of the process.
+
+    There is one client per provider and API key, created on first use, so that e.g. "openai.gpt-5" and
+    "openai.gpt-5-mini" share one connection pool.
+    """
+
+    @register_configs("provider_clients")
+    class Config(BaseConfig):
+        max_connections: int = 100  # Max number of connections per provider client.
+        max_keepalive_connections: int = 20  # Max number of idle connections kept open per provider client.
+        keepalive_expiry_seconds: float = 60.0  # How long an idle connection is kept open.
+        timeout_seconds: float = 600.0  # Timeout of the requests.
+        prewarm_connections: int = 0  # Connections opened per provider client when the controller is created.  0 to open them on first use.
+
+    @staticmethod
+    def http_limits(config: "ProviderClients.Config") -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive_connections,
+            keepalive_expiry=config.keepalive_expiry_seconds,
+        )
+
+    @staticmethod
+    def get(provider: str, api_key: Optional[str], create: Callable[[], tuple[Any, Callable[[], Awaitable[Any]]]]) -> Any:
+        """Return the client of `provider` for `api_key`, creating it on first use.
+
+        `create` returns the client and an async function closing it.
+        """
+        key = (provider, api_key)
+        if key not in _PROVIDER_CLIENTS:
+            logger.info(f"Creating {provider} client")
+            _PROVIDER_CLIENTS[key], _CLIENT_CLOSERS[key] = create()
+        return _PROVIDER_CLIENTS[key]
+
+async def close_provider_clients():
+    """Close all the provider clients created in this process."""
+    closers = list(_CLIENT_CLOSERS.values())
+    _PROVIDER_CLIENTS.clear()
+    _CLIENT_CLOSERS.clear()
+    for close in closers:
+        try:
+            await close()
+        except Exception as e:
+            logger.warning(f"Failed to close a provider client: {e}")
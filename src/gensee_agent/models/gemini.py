@@ -1,76 +1,276 @@
+import asyncio
+from collections import OrderedDict
+import hashlib
+import json
 import os
-from typing import AsyncGenerator, Sequence
+import time
+from typing import Any, AsyncGenerator, AsyncIterator, Awaitable, Callable, Optional, Sequence
 
+import httpx
 from google import genai
-from google.genai.types import Content, ContentListUnion, ContentUnion, GenerateContentResponse, Part
+from google.genai import errors
+from google.genai.types import (Content, ContentListUnion, ContentUnion, CreateCachedContentConfig, FunctionDeclaration, GenerateContentConfig,
+                               GenerateContentResponse, HttpOptions, Part, Tool)
+import orjson
 
-from gensee_agent.controller.dataclass.llm_response import LLMResponses, SingleLLMResponse
+from gensee_agent.controller.dataclass.llm_response import LLMResponses, LLMUsage, SingleLLMResponse
 from gensee_agent.controller.message_handler import MessageHandler
+from gensee_agent.exceptions.gensee_exceptions import LLMError
 from gensee_agent.models.base import BaseModel, register_model_provider
+from gensee_agent.models.client_pool import ProviderClients
 from gensee_agent.settings import Settings
+from gensee_agent.utils.configs import BaseConfig, register_configs
 from gensee_agent.utils.logging import configure_logger
+from gensee_agent.utils.tokens import estimate_tokens
 
 logger = configure_logger(__name__)
 
+_ROLES = {
+    "user": "user",
+    "assistant": "model",
+}
+
+# A cached system prompt is replaced when it expires within this many seconds, so that no request uses an expired one.
+_SYSTEM_CACHE_EXPIRY_MARGIN_SECONDS = 60
+
 class GeminiModel(BaseModel):
+    supports_native_tool_calls = True
+
+    @register_configs("gemini")
+    class Config(BaseConfig):
+        conversion_cache_size: int = 4096  # Max number of converted messages kept, so that each step only converts its new messages.
+        cache_system_prompt: bool = False  # Whether to store the system prompt (and the native tools) as cached content on the provider.
+        system_cache_ttl_seconds: int = 3600  # Time to live of the cached system prompts.
+        min_system_cache_tokens: int = 1024  # Shorter system prompts are sent with each request: the provider does not cache them.
+
     def __init__(self, model_name: str, config: dict):
         super().__init__(model_name, config)
         self.api_key = os.environ.get("GEMINI_API_KEY")
-        self.client = genai.Client(api_key=self.api_key)
+        self.client_config = ProviderClients.Config.from_dict(config)
+        self.config = self.Config.from_dict(config)
         self.model_name = model_name.split(Settings.SEPARATOR, maxsplit=1)[-1]
         self.message_handler = MessageHandler(config={})
+        # Converted messages by id of the message, with the message itself, which keeps the id from being reused.
+        # Messages of LLMUse are never modified, so a message converted at one step is the same at the next steps.
+        self.converted_messages: OrderedDict[int, tuple[dict, Content]] = OrderedDict()
+        self.system_caches: dict[str, tuple[str, float]] = {}  # Name and expiry time of the cached content, by hash of the system prompt and tools.
+        self.system_cache_lock = asyncio.Lock()
+
+    @property
+    def client_key(self) -> tuple[str, Optional[str]]:
+        return "gemini", self.api_key
+
+    @property
+    def client(self) -> genai.Client:
+        """Client shared by the Gemini models with the same API key."""
+        return ProviderClients.get(*self.client_key, self._create_client)
+
+    def _create_client(self) -> tuple[genai.Client, Callable[[], Awaitable[None]]]:
+        http_client = httpx.AsyncClient(
+            limits=ProviderClients.http_limits(self.client_config),
+            timeout=self.client_config.timeout_seconds)
+        client = genai.Client(api_key=self.api_key, http_options=HttpOptions(httpx_async_client=http_client))
+
+        async def close():
+            await client.aio.aclose()
+            await http_client.aclose()
+            client.close()
+        return client, close
 
+    async def prewarm(self):
+        # Getting the model costs no tokens, and opens an authenticated connection.
+        try:
+            await self.client.aio.models.get(model=self.model_name)
+        except (errors.APIError, httpx.TransportError) as e:
+            raise self._to_llm_error(e) from e
 
-    def _convert_llm_use(self, messages: list[dict]) -> list[Content]:
+
+    def _convert_llm_use(self, messages: list[dict]) -> tuple[Optional[str], list[Content]]:
         """
         Input messages is a list of dict with "role" and "content" keys.
-        Output messages are converted to the format expected by Gemini API:
+        Returns the system instruction (the system messages), and the other messages converted to the format
+        expected by Gemini API:
         [
             {
-                "role": "user" | "assistant" | "system",
+                "role": "user" | "model",
                 "parts": [{"text": "message"}]}
             },
             ...
         ]
         """
-        role_mapping = {
-            "user": "user",
-            "assistant": "model",
-            "system": "user",  # Gemini doesn't have a system role, treat as user
-        }
-        converted_messages = [
-            Content(
-                role=role_mapping.get(message["role"], "user"),
-                parts=[Part(text=message["content"])]
-            )
-            for message in messages
-        ]
-        return converted_messages
-
-    async def completion(self, messages: list) -> GenerateContentResponse:
-        # Need to convert the messages to the format expected by Gemini API
-        converted_messages = self._convert_llm_use(messages)
-        response = await self.client.aio.models.generate_content(
-            model=self.model_name,
-            contents=converted_messages # pyright: ignore[reportArgumentType]
-        )
+        system_messages = [message["content"] for message in messages if message["role"] == "system"]
+        converted_messages = [self._convert_message(message) for message in messages if message["role"] != "system"]
+        return "\n\n".join(system_messages) if system_messages else None, converted_messages
+
+    def _convert_message(self, message: dict) -> Content:
+        key = id(message)
+        entry = self.converted_messages.get(key)
+        if entry is not None and entry[0] is message:
+            self.converted_messages.move_to_end(key)
+            return entry[1]
+        content = Content(role=_ROLES.get(message["role"], "user"), parts=[Part(text=message["content"])])
+        self.converted_messages[key] = (message, content)
+        while len(self.converted_messages) > self.config.conversion_cache_size:
+            self.converted_messages.popitem(last=False)
+        return content
+
+    def _tools(self, tools: Optional[list[dict]]) -> Optional[list[Tool]]:
+        if not tools:
+            return None
+        return [Tool(function_declarations=[
+            FunctionDeclaration(name=self.native_tool_name(tool["name"]), description=tool["description"], parameters_json_schema=tool["parameters"])
+            for tool in tools])]
+
+    def _generate_config(self, system_instruction: Optional[str], stop: Optional[list[str]], tools: Optional[list[dict]],
+                         cached_content: Optional[str] = None) -> Optional[GenerateContentConfig]:
+        if not system_instruction and not stop and not tools:
+            return None
+        if cached_content is not None:
+            # The system instruction and tools are part of the cached content, and may not be sent again.
+            return GenerateContentConfig(stop_sequences=stop or None, cached_content=cached_content)
+        return GenerateContentConfig(system_instruction=system_instruction or None, stop_sequences=stop or None, tools=self._tools(tools))
+
+    async def _system_cache(self, system_instruction: Optional[str], tools: Optional[list[dict]]) -> Optional[str]:
+        """Name of the cached content holding the system instruction and tools, created on first use.  None to send them."""
+        if not self.config.cache_system_prompt or not system_instruction or estimate_tokens(system_instruction) < self.config.min_system_cache_tokens:
+            return None
+        key = hashlib.sha256(orjson.dumps({"system_instruction": system_instruction, "tools": tools}, option=orjson.OPT_SORT_KEYS)).hexdigest()
+        async with self.system_cache_lock:
+            entry = self.system_caches.get(key)
+            if entry is not None and entry[1] > time.time() + _SYSTEM_CACHE_EXPIRY_MARGIN_SECONDS:
+                return entry[0]
+            try:
+                cached_content = await self.client.aio.caches.create(
+                    model=self.model_name,
+                    config=CreateCachedContentConfig(
+                        system_instruction=system_instruction,
+                        tools=self._tools(tools),
+                        ttl=f"{self.config.system_cache_ttl_seconds}s",
+                    ),
+                )
+            except (errors.APIError, httpx.TransportError) as e:
+                # Caching is an optimization: send the system instruction with the request instead.
+                logger.warning(f"Failed to cache the system prompt of Gemini {self.model_name}: {e}")
+                return None
+            assert cached_content.name is not None
+            self.system_caches[key] = (cached_content.name, time.time() + self.config.system_cache_ttl_seconds)
+            logger.info(f"Cached the system prompt of Gemini {self.model_name} as {cached_content.name}")
+            return cached_content.name
+
+    def _forget_system_cache(self, name: str):
+        self.system_caches = {key: entry for key, entry in self.system_caches.items() if entry[0] != name}
+
+    async def _request(self, generate: Callable[[list[Content], Optional[GenerateContentConfig]], Awaitable[Any]], messages: list[dict],
+                       stop: Optional[list[str]], tools: Optional[list[dict]]) -> Any:
+        """Send a request with `generate(config)`, using the cached system prompt if any.
+
+        If the cached content is rejected, e.g., because it expired early, the request is sent again with the system
+        instruction.
+        """
+        system_instruction, converted_messages = self._convert_llm_use(messages)
+        cached_content = await self._system_cache(system_instruction, tools)
+        if cached_content is not None:
+            try:
+                return await generate(converted_messages, self._generate_config(system_instruction, stop, tools, cached_content))
+            except errors.ClientError as e:
+                if e.code not in (400, 403, 404):
+                    raise
+                logger.warning(f"Cached system prompt {cached_content} of Gemini {self.model_name} was rejected, sending it instead: {e}")
+                self._forget_system_cache(cached_content)
+        return await generate(converted_messages, self._generate_config(system_instruction, stop, tools))
+
+    # Gemini has no option to limit the function calls of a response, so `parallel_tool_calls` is ignored, and
+    # TaskManager only runs the first tool use when parallel tool use is off.
+    async def completion(self, messages: list, stop: Optional[list[str]] = None, tools: Optional[list[dict]] = None,
+                         parallel_tool_calls: bool = True) -> GenerateContentResponse:
+        try:
+            response = await self._request(
+                lambda contents, config: self.client.aio.models.generate_content(model=self.model_name, contents=contents, config=config),
+                messages, stop, tools)
+        except (errors.APIError, httpx.TransportError) as e:
+            raise self._to_llm_error(e) from e
         return response
 
+    async def completion_stream(self, messages: list, stop: Optional[list[str]] = None, tools: Optional[list[dict]] = None,
+                                parallel_tool_calls: bool = True) -> AsyncGenerator[GenerateContentResponse, None]:
+        try:
+            first_chunks, stream = await self._request(self._open_stream, messages, stop, tools)
+            for chunk in first_chunks:
+                yield chunk
+            async for chunk in stream:
+                yield chunk
+        except (errors.APIError, httpx.TransportError) as e:
+            raise self._to_llm_error(e) from e
+
+    async def _open_stream(self, contents: list[Content], config: Optional[GenerateContentConfig]) -> tuple[list[GenerateContentResponse], AsyncIterator[GenerateContentResponse]]:
+        """Open a stream and read its first chunk, since the request is only sent then, e.g., to find out that the cached content was rejected."""
+        stream = await self.client.aio.models.generate_content_stream(model=self.model_name, contents=contents, config=config)
+        try:
+            return [await anext(stream)], stream
+        except StopAsyncIteration:
+            return [], stream
+
+    def _to_llm_error(self, e: errors.APIError | httpx.TransportError) -> LLMError:
+        # Network errors, rate limits and server errors are transient.
+        if isinstance(e, errors.APIError):
+            retryable = isinstance(e, errors.ServerError) or e.code in (408, 429)
+        else:
+            retryable = True
+        return LLMError(f"Gemini {self.model_name} request failed: {e}", retryable=retryable)
+
     def to_llm_responses(self, response: GenerateContentResponse) -> LLMResponses:
         if not isinstance(response, GenerateContentResponse):
             raise ValueError("Response is not of type GenerateContentResponse.")
 
         # logger.info(f"Received response from Gemini: {response}")
 
-        title = self.message_handler.extract_title(response.text or "")
+        content = self._content(response)
+        title = self.message_handler.extract_title(content)
         return [
             SingleLLMResponse(
                 title=title or "[No Title]",
-                content=response.text or "",
+                content=content,
                 finish_reason=response.candidates[0].finish_reason.name if response.candidates and response.candidates[0].finish_reason else "unknown",
                 partial=False
             )
         ]
 
+    def _content(self, response: GenerateContentResponse) -> str:
+        """Text of the first candidate, with its function calls rendered as <tool_use> blocks.  Thoughts are skipped, as in `response.text`."""
+        candidate = response.candidates[0] if response.candidates else None
+        if candidate is None or candidate.content is None or not candidate.content.parts:
+            return ""
+        content = []
+        for part in candidate.content.parts:
+            if part.function_call is not None and part.function_call.name:
+                content.append(self.message_handler.format_tool_use(
+                    self.tool_api_name(part.function_call.name), json.dumps(part.function_call.args or {})))
+            elif part.text and not part.thought:
+                content.append(part.text)
+        return "".join(content)
+
+    def to_llm_usage(self, response: GenerateContentResponse) -> Optional[LLMUsage]:
+        # Stream chunks carry the usage so far, so the last chunk has the usage of the whole stream.
+        usage_metadata = response.usage_metadata
+        if usage_metadata is None or usage_metadata.prompt_token_count is None:
+            return None
+        return LLMUsage(
+            prompt_tokens=usage_metadata.prompt_token_count,
+            cached_prompt_tokens=usage_metadata.cached_content_token_count or 0,
+            # Thinking tokens are billed as output.
+            output_tokens=(usage_metadata.candidates_token_count or 0) + (usage_metadata.thoughts_token_count or 0))
+
+    def to_partial_llm_responses(self, chunk: GenerateContentResponse) -> LLMResponses:
+        if not isinstance(chunk, GenerateContentResponse):
+            raise ValueError("Chunk is not of type GenerateContentResponse.")
+        return [
+            SingleLLMResponse(
+                title="",
+                content=self._content(chunk),
+                finish_reason=chunk.candidates[0].finish_reason.name if chunk.candidates and chunk.candidates[0].finish_reason else "",
+                partial=True
+            )
+        ]
+
 register_model_provider(f"gemini{Settings.SEPARATOR}gemini-2.5-flash", GeminiModel)
 register_model_provider(f"gemini{Settings.SEPARATOR}gemini-2.5-pro", GeminiModel)
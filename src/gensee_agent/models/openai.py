@@ -1,48 +1,290 @@
 import os
-from typing import AsyncGenerator
+from typing import Any, AsyncGenerator, Awaitable, Callable, Optional
 
+import openai
 from openai import AsyncOpenAI
-from openai.types.chat import ChatCompletion, ChatCompletionChunk
+from openai.types.chat import ChatCompletion, ChatCompletionChunk, ChatCompletionMessage, ChatCompletionMessageFunctionToolCall
+from openai.types.chat.chat_completion_chunk import Choice as ChunkChoice
+from openai.types.responses import (Response, ResponseCompletedEvent, ResponseErrorEvent, ResponseFailedEvent, ResponseFunctionCallArgumentsDeltaEvent,
+                                    ResponseIncompleteEvent, ResponseOutputItemAddedEvent, ResponseOutputItemDoneEvent, ResponseStreamEvent,
+                                    ResponseTextDeltaEvent)
 
-from gensee_agent.controller.dataclass.llm_response import LLMResponses, SingleLLMResponse
+from gensee_agent.controller.dataclass.llm_response import LLMResponses, LLMUsage, SingleLLMResponse
 from gensee_agent.controller.message_handler import MessageHandler
+from gensee_agent.exceptions.gensee_exceptions import LLMError
 from gensee_agent.models.base import BaseModel, register_model_provider
+from gensee_agent.models.client_pool import ProviderClients
 from gensee_agent.settings import Settings
+from gensee_agent.utils.configs import BaseConfig, register_configs
+from gensee_agent.utils.logging import configure_logger
+
+logger = configure_logger(__name__)
+
+# Output of the other function calls of the previous response, in Responses API mode.  TaskManager sends the results
+# of all the tool uses of a message together, as the output of the first call.
+_OTHER_FUNCTION_CALL_OUTPUT = "The results of all the calls are in the output of call {call_id}."
 
 class OpenAIModel(BaseModel):
+    """OpenAI models, with the Chat Completions API or the Responses API.
+
+    With the Responses API, responses are stored by OpenAI and each request continues from the previous response
+    of the conversation (see `provider_state` of LLMUse), so it only sends the messages added since.  If there is
+    no previous response, or it expired, the whole conversation is sent.
+    """
+
+    supports_native_tool_calls = True
+
+    @register_configs("openai")
+    class Config(BaseConfig):
+        base_url: Optional[str] = None  # Base URL of the API, e.g., of a local mock server.  None for the OpenAI API.
+        responses_api: bool = False  # Whether to use the Responses API, which keeps the conversation on the server.
+
     def __init__(self, model_name: str, config: dict):
         super().__init__(model_name, config)
         self.api_key = os.environ.get("OPENAI_API_KEY")
-        self.client = AsyncOpenAI(api_key=self.api_key)
+        self.client_config = ProviderClients.Config.from_dict(config)
+        self.config = self.Config.from_dict(config)
         self.model_name = model_name.split(Settings.SEPARATOR, maxsplit=1)[-1]
         self.message_handler = MessageHandler(config={})
+        # Reasoning models reject the `stop` parameter, and the Responses API has none.
+        self.supports_stop_sequences = not self.config.responses_api and not self.model_name.startswith(("gpt-5", "o1", "o3", "o4"))
+
+    @property
+    def client_key(self) -> tuple[str, Optional[str]]:
+        provider = "openai" if self.config.base_url is None else f"openai@{self.config.base_url}"
+        return provider, self.api_key
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        """Client shared by the OpenAI models with the same API key and base URL."""
+        return ProviderClients.get(*self.client_key, self._create_client)
+
+    def _create_client(self) -> tuple[AsyncOpenAI, Callable[[], Awaitable[None]]]:
+        client = AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=self.config.base_url,
+            http_client=openai.DefaultAsyncHttpxClient(
+                limits=ProviderClients.http_limits(self.client_config),
+                timeout=self.client_config.timeout_seconds))
+        return client, client.close
+
+    async def prewarm(self):
+        # Retrieving the model costs no tokens, and opens an authenticated connection.
+        try:
+            await self.client.with_options(max_retries=0).models.retrieve(self.model_name)
+        except openai.OpenAIError as e:
+            raise self._to_llm_error(e) from e
+
+    def _tools(self, tools: Optional[list[dict]], parallel_tool_calls: bool) -> dict:
+        """Arguments declaring `tools` as functions, if any."""
+        if not tools:
+            return {}
+        return {"tools": [
+            {"type": "function", "function": {"name": self.native_tool_name(tool["name"]), "description": tool["description"], "parameters": tool["parameters"]}}
+            for tool in tools], **({} if parallel_tool_calls else {"parallel_tool_calls": False})}
+
+    async def completion(self, messages: list, stop: Optional[list[str]] = None, tools: Optional[list[dict]] = None,
+                         parallel_tool_calls: bool = True, provider_state: Optional[dict] = None) -> ChatCompletion | Response:
+        if self.config.responses_api:
+            try:
+                return await self._create_response(messages, tools, parallel_tool_calls, provider_state, stream=False)
+            except openai.OpenAIError as e:
+                raise self._to_llm_error(e) from e
+        try:
+            chat_completion = self.client.chat.completions.create(
+                messages=messages,
+                model=self.model_name,
+                **({"stop": stop} if stop else {}),
+                **self._tools(tools, parallel_tool_calls))
+            return await chat_completion # type: ignore
+        except openai.OpenAIError as e:
+            raise self._to_llm_error(e) from e
+
+    async def completion_stream(self, messages: list, stop: Optional[list[str]] = None, tools: Optional[list[dict]] = None,
+                                parallel_tool_calls: bool = True, provider_state: Optional[dict] = None) -> AsyncGenerator[ChatCompletionChunk | ResponseStreamEvent, None]:
+        if self.config.responses_api:
+            try:
+                events = await self._create_response(messages, tools, parallel_tool_calls, provider_state, stream=True)
+                async for event in events:
+                    if isinstance(event, (ResponseErrorEvent, ResponseFailedEvent)):
+                        message = event.message if isinstance(event, ResponseErrorEvent) else event.response.error
+                        raise LLMError(f"OpenAI {self.model_name} response failed: {message}", retryable=True)
+                    yield event
+            except openai.OpenAIError as e:
+                raise self._to_llm_error(e) from e
+            return
+        try:
+            stream = await self.client.chat.completions.create(
+                messages=messages,
+                model=self.model_name,
+                stream=True,
+                stream_options={"include_usage": True},  # The last chunk carries the usage of the whole stream.
+                **({"stop": stop} if stop else {}),
+                **self._tools(tools, parallel_tool_calls))
+            async for chunk in stream:
+                yield chunk
+        except openai.OpenAIError as e:
+            raise self._to_llm_error(e) from e
+
+    async def _create_response(self, messages: list[dict], tools: Optional[list[dict]], parallel_tool_calls: bool,
+                               provider_state: Optional[dict], stream: bool) -> Any:
+        """Create a response with the Responses API, continuing from the previous response of the conversation if possible."""
+        request: dict[str, Any] = {"model": self.model_name, "store": True, "stream": stream}
+        if tools:
+            request["tools"] = [
+                {"type": "function", "name": self.native_tool_name(tool["name"]), "description": tool["description"],
+                 "parameters": tool["parameters"], "strict": False}
+                for tool in tools]
+            if not parallel_tool_calls:
+                request["parallel_tool_calls"] = False
+        if provider_state is not None and provider_state["length"] <= len(messages):
+            try:
+                return await self.client.responses.create(
+                    input=self._response_input(messages[provider_state["length"]:], provider_state.get("call_ids", [])),
+                    previous_response_id=provider_state["response_id"],
+                    **request)
+            except (openai.NotFoundError, openai.BadRequestError) as e:
+                if not isinstance(e, openai.NotFoundError) and e.code != "previous_response_not_found":
+                    raise
+                # The stored response expired or was deleted.
+                logger.warning(f"Previous response {provider_state['response_id']} of OpenAI {self.model_name} is not available, sending the whole conversation: {e}")
+        return await self.client.responses.create(input=self._response_input(messages, []), **request)
 
-    async def completion(self, messages: list) -> ChatCompletion:
-        # TODO: ignore streaming for now.
-        chat_completion = self.client.chat.completions.create(
-            messages=messages,
-            model=self.model_name)
-        return await chat_completion # type: ignore
-
-    async def completion_stream(self, messages: list) -> AsyncGenerator[ChatCompletionChunk, None]:
-        stream = await self.client.chat.completions.create(
-            messages=messages,
-            model=self.model_name,
-            stream=True)
-        async for chunk in stream:
-            yield chunk
-
-    def to_llm_responses(self, response: ChatCompletion | ChatCompletionChunk) -> LLMResponses:
+    def _response_input(self, messages: list[dict], call_ids: list[str]) -> list[dict]:
+        """Input items of `messages`, following a response with the function calls `call_ids`.
+
+        The calls expect their outputs first.  The message after the response is the user message with the results
+        of the tool uses, so it is sent as the output of the first call rather than as a message.
+        """
+        items: list[dict] = []
+        if call_ids and messages and messages[0]["role"] == "user":
+            items.append({"type": "function_call_output", "call_id": call_ids[0], "output": messages[0]["content"]})
+            items.extend({"type": "function_call_output", "call_id": call_id, "output": _OTHER_FUNCTION_CALL_OUTPUT.format(call_id=call_ids[0])}
+                         for call_id in call_ids[1:])
+            messages = messages[1:]
+        items.extend({"role": message["role"], "content": message["content"]} for message in messages)
+        return items
+
+    def _to_llm_error(self, e: openai.OpenAIError) -> LLMError:
+        # Connection errors (including timeouts), rate limits and server errors are transient.
+        retryable = isinstance(e, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError))
+        return LLMError(f"OpenAI {self.model_name} request failed: {e}", retryable=retryable)
+
+    def to_llm_responses(self, response: ChatCompletion | ChatCompletionChunk | Response) -> LLMResponses:
+        if isinstance(response, ChatCompletionChunk):
+            return self.to_partial_llm_responses(response)
+        if isinstance(response, Response):
+            content = self._response_content(response)
+            title = self.message_handler.extract_title(content)
+            return [SingleLLMResponse(title=title or "[No Title]", content=content, finish_reason=self._response_finish_reason(response), partial=False)]
         if not isinstance(response, ChatCompletion):
             raise ValueError("Response is not of type ChatCompletion.")
         title = self.message_handler.extract_title(response.choices[0].message.content or "")
         return [
             SingleLLMResponse(
                 title=title or "[No Title]",
-                content=resp.message.content,
+                content=self._content(resp.message),
                 finish_reason=resp.finish_reason,
                 partial=False)
             for resp in response.choices]
 
+    def _content(self, message: ChatCompletionMessage) -> Optional[str]:
+        """Content of the message, followed by its tool calls rendered as <tool_use> blocks."""
+        if not message.tool_calls:
+            return message.content
+        return (message.content or "") + "".join(
+            self.message_handler.format_tool_use(self.tool_api_name(tool_call.function.name), tool_call.function.arguments or "{}")
+            for tool_call in message.tool_calls if isinstance(tool_call, ChatCompletionMessageFunctionToolCall))
+
+    def _response_content(self, response: Response) -> str:
+        """Text of the response, followed by its function calls rendered as <tool_use> blocks."""
+        texts = []
+        tool_uses = []
+        for item in response.output:
+            if item.type == "message":
+                texts.extend(part.text for part in item.content if part.type == "output_text")
+            elif item.type == "function_call":
+                tool_uses.append(self.message_handler.format_tool_use(self.tool_api_name(item.name), item.arguments or "{}"))
+        return "".join(texts) + "".join(tool_uses)
+
+    def _response_finish_reason(self, response: Response) -> str:
+        if any(item.type == "function_call" for item in response.output):
+            return "tool_calls"
+        if response.incomplete_details is not None and response.incomplete_details.reason:
+            return response.incomplete_details.reason
+        return "stop"
+
+    def to_provider_state(self, response: Any) -> Optional[dict]:
+        if isinstance(response, ResponseCompletedEvent):
+            response = response.response
+        if not isinstance(response, Response) or response.status != "completed":
+            return None
+        # The outputs of the function calls are expected in the next request.
+        return {"response_id": response.id, "call_ids": [item.call_id for item in response.output if item.type == "function_call"]}
+
+    def to_llm_usage(self, response: ChatCompletion | ChatCompletionChunk | Response | ResponseStreamEvent) -> Optional[LLMUsage]:
+        if isinstance(response, (ResponseCompletedEvent, ResponseIncompleteEvent)):
+            response = response.response
+        if isinstance(response, Response):
+            if response.usage is None:
+                return None
+            return LLMUsage(
+                prompt_tokens=response.usage.input_tokens,
+                cached_prompt_tokens=response.usage.input_tokens_details.cached_tokens or 0,
+                output_tokens=response.usage.output_tokens)
+        if not isinstance(response, (ChatCompletion, ChatCompletionChunk)) or response.usage is None:
+            return None
+        details = response.usage.prompt_tokens_details
+        return LLMUsage(
+            prompt_tokens=response.usage.prompt_tokens,
+            cached_prompt_tokens=(details.cached_tokens or 0) if details is not None else 0,
+            output_tokens=response.usage.completion_tokens)
+
+    def to_partial_llm_responses(self, chunk: ChatCompletionChunk | ResponseStreamEvent) -> LLMResponses:
+        if not isinstance(chunk, ChatCompletionChunk):
+            if self.config.responses_api:
+                return [self._partial_response(chunk)]
+            raise ValueError("Chunk is not of type ChatCompletionChunk.")
+        return [
+            SingleLLMResponse(
+                title="",
+                content=self._delta_content(choice),
+                finish_reason=choice.finish_reason or "",
+                partial=True)
+            for choice in chunk.choices]
+
+    def _partial_response(self, event: ResponseStreamEvent) -> SingleLLMResponse:
+        """New content of a Responses API stream event.  Function calls are rendered as parts of <tool_use> blocks."""
+        content = ""
+        finish_reason = ""
+        if isinstance(event, (ResponseTextDeltaEvent, ResponseFunctionCallArgumentsDeltaEvent)):
+            content = event.delta
+        elif isinstance(event, ResponseOutputItemAddedEvent) and event.item.type == "function_call":
+            content = self.message_handler.tool_use_opening(self.tool_api_name(event.item.name))
+        elif isinstance(event, ResponseOutputItemDoneEvent) and event.item.type == "function_call":
+            content = self.message_handler.TOOL_USE_CLOSING
+        elif isinstance(event, (ResponseCompletedEvent, ResponseIncompleteEvent)):
+            finish_reason = self._response_finish_reason(event.response)
+        return SingleLLMResponse(title="", content=content, finish_reason=finish_reason, partial=True)
+
+    def _delta_content(self, choice: ChunkChoice) -> str:
+        """New content of a stream chunk.  Tool call deltas are rendered as parts of <tool_use> blocks.
+
+        A tool call starts with a delta carrying its name, and the deltas of its arguments follow.  It ends when the
+        next tool call starts, or when the response finishes.
+        """
+        content = choice.delta.content or ""
+        for tool_call in choice.delta.tool_calls or []:
+            if tool_call.function is None:
+                continue
+            if tool_call.function.name:
+                if tool_call.index > 0:
+                    content += self.message_handler.TOOL_USE_CLOSING
+                content += self.message_handler.tool_use_opening(self.tool_api_name(tool_call.function.name))
+            content += tool_call.function.arguments or ""
+        if choice.finish_reason == "tool_calls":
+            content += self.message_handler.TOOL_USE_CLOSING
+        return content
+
 register_model_provider(f"openai{Settings.SEPARATOR}gpt-5-mini", OpenAIModel)
-register_model_provider(f"openai{Settings.SEPARATOR}gpt-5", OpenAIModel)
\ No newline at end of file
+register_model_provider(f"openai{Settings.SEPARATOR}gpt-5", OpenAIModel)
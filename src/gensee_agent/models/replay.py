@@ -0,0 +1,65 @@
+from typing import AsyncGenerator, Optional
+
+from gensee_agent.controller.dataclass.llm_response import LLMResponses, LLMUsage, SingleLLMResponse
+from gensee_agent.controller.recording import Recording
+from gensee_agent.exceptions.gensee_exceptions import LLMError
+from gensee_agent.models.base import BaseModel, register_model_provider
+from gensee_agent.settings import Settings
+
+# Streams of recorded responses are replayed in chunks of this many characters.
+_CHUNK_CHARS = 16
+
+class ReplayModel(BaseModel):
+    """Play back the LLM calls recorded by `Recorder` (see the "replay" config), without network access.
+
+    Whichever model was recorded, use this model as the default model to replay.  The recorded usage is replayed
+    as well, so that token counts and costs are the same as in the recorded run.
+    """
+
+    # Native tool calls are recorded as <tool_use> blocks in the content, so declared tools are simply ignored.
+    supports_native_tool_calls = True
+
+    def __init__(self, model_name: str, config: dict):
+        super().__init__(model_name, config)
+        self.recording = Recording.get(config)
+
+    def _find(self, messages: list, stop: Optional[list[str]]) -> dict:
+        record = self.recording.find_llm(messages, stop)
+        if record is None:
+            raise LLMError(f"No recorded LLM call matches the {len(messages)} prompts.", retryable=False)
+        return record
+
+    async def completion(self, messages: list, stop: Optional[list[str]] = None, tools: Optional[list[dict]] = None) -> dict:
+        record = self._find(messages, stop)
+        await self.recording.wait((record["usage"] or {}).get("latency_seconds"))
+        return record
+
+    async def completion_stream(self, messages: list, stop: Optional[list[str]] = None, tools: Optional[list[dict]] = None) -> AsyncGenerator[dict, None]:
+        record = self._find(messages, stop)
+        usage = record["usage"] or {}
+        latency = usage.get("latency_seconds") or 0.0
+        first_token = usage.get("first_token_seconds") or 0.0
+        await self.recording.wait(first_token)
+        first_response = record["responses"][0] if record["responses"] else {"content": "", "finish_reason": "stop"}
+        content = first_response["content"] or ""
+        chunks = [content[i:i + _CHUNK_CHARS] for i in range(0, len(content), _CHUNK_CHARS)] or [""]
+        for chunk in chunks:
+            yield {"content": chunk}
+            # The rest of the recorded latency is spread over the chunks.
+            await self.recording.wait(max(0.0, latency - first_token) / len(chunks))
+        yield {"content": "", "finish_reason": first_response["finish_reason"], "usage": record["usage"]}
+
+    def to_llm_responses(self, response: dict) -> LLMResponses:
+        return [SingleLLMResponse(**response) for response in response["responses"]]
+
+    def to_partial_llm_responses(self, chunk: dict) -> LLMResponses:
+        return [SingleLLMResponse(title="", content=chunk["content"], finish_reason=chunk.get("finish_reason", ""), partial=True)]
+
+    def to_llm_usage(self, response: dict) -> Optional[LLMUsage]:
+        usage = response.get("usage")
+        if usage is None:
+            return None
+        # Timing is measured by LLMManager, as for other providers.
+        return LLMUsage(prompt_tokens=usage["prompt_tokens"], cached_prompt_tokens=usage["cached_prompt_tokens"], output_tokens=usage["output_tokens"])
+
+register_model_provider(f"replay{Settings.SEPARATOR}recorded", ReplayModel)
@@ -1,7 +1,19 @@
 TEMPLATE = """
 TOOL USE
+{% if native_tool_calls %}
+You have access to a set of tools that are executed upon the user's approval. The tools are provided to you as functions: call them with your function calling interface. {% if parallel_tool_use %}You can call multiple tools per message when they are independent of each other, and will receive the results of all of them together in the user's response.{% else %}You can call one tool per message, and will receive the result of that tool call in the user's response.{% endif %} You use tools step-by-step to accomplish a given task, with each tool call informed by the result of the previous tool call.
 
-You have access to a set of tools that are executed upon the user's approval. You can use one tool per message, and will receive the result of that tool use in the user's response. You use tools step-by-step to accomplish a given task, with each tool use informed by the result of the previous tool use.
+Your previous tool calls appear in the conversation as <tool_use> blocks, followed by their results in the user's response.
+
+# Tool Use Guidelines
+
+1. In <thinking> tags, assess what information you already have and what information you need to proceed with the task.
+2. Choose the most appropriate tool based on the task and the tool descriptions provided.
+3. If multiple actions are needed, {% if parallel_tool_use %}call the tools that do not depend on each other in the same message. Tool calls that depend on the result of another tool call must wait for a later message.{% else %}call one tool at a time per message, with each tool call being informed by the result of the previous tool call.{% endif %} Do not assume the outcome of any tool call.
+4. ALWAYS wait for the result of each tool call before proceeding. Never assume the success of a tool call without explicit confirmation of the result from the user.
+{% if allow_interaction %}5. If you need to initiate any user interactions (like asking questions or seeking clarifications), you need to explicitly call the user interaction tool, otherwise users will not be prompted for input.{% endif %}
+{% else %}
+You have access to a set of tools that are executed upon the user's approval. {% if parallel_tool_use %}You can use multiple tools per message when they are independent of each other, and will receive the results of all of them together in the user's response.{% else %}You can use one tool per message, and will receive the result of that tool use in the user's response.{% endif %} You use tools step-by-step to accomplish a given task, with each tool use informed by the result of the previous tool use.
 
 # Tool Use Formatting
 
@@ -106,12 +118,31 @@ Always adhere to this format for the tool use to ensure proper parsing and execu
 <tool_use>
 <name>get_current_time</name>
 </tool_use>
+{% if parallel_tool_use %}
+## Example 7: Running independent searches in the same message
 
+<tool_use>
+<name>search</name>
+<arguments>
+{
+  "query": "population of Paris"
+}
+</arguments>
+</tool_use>
+<tool_use>
+<name>search</name>
+<arguments>
+{
+  "query": "population of Berlin"
+}
+</arguments>
+</tool_use>
+{% endif %}
 # Tool Use Guidelines
 
 1. In <thinking> tags, assess what information you already have and what information you need to proceed with the task.
 2. Choose the most appropriate tool based on the task and the tool descriptions provided. Assess if you need additional information to proceed, and which of the available tools would be most effective for gathering this information. For example using the list_files tool is more effective than running a command like `ls` in the terminal. It's critical that you think about each available tool and use the one that best fits the current step in the task.
-3. If multiple actions are needed, use one tool at a time per message to accomplish the task iteratively, with each tool use being informed by the result of the previous tool use. Do not assume the outcome of any tool use. Each step must be informed by the previous step's result.
+3. If multiple actions are needed, {% if parallel_tool_use %}put tool uses that do not depend on each other (for example, several searches for different sub-queries) in the same message, each in its own <tool_use> block. Tool uses that depend on the result of another tool use must wait for a later message. Do not assume the outcome of any tool use.{% else %}use one tool at a time per message to accomplish the task iteratively, with each tool use being informed by the result of the previous tool use. Do not assume the outcome of any tool use. Each step must be informed by the previous step's result.{% endif %}
 4. Formulate your tool use using the XML format specified for each tool.
 5. After each tool use, the user will respond with the result of that tool use. This result will provide you with the necessary information to continue your task or make further decisions. This response may include:
   - Information about whether the tool succeeded or failed, along with any reasons for failure.
@@ -129,4 +160,5 @@ It is crucial to proceed step-by-step, waiting for the user's message after each
 
 By waiting for and carefully considering the user's response after each tool use, you can react accordingly and make informed decisions about how to proceed with the task. This iterative process helps ensure the overall success and accuracy of your work.
 
-"""
\ No newline at end of file
+{% endif %}
+"""
@@ -1,7 +1,12 @@
+from dataclasses import dataclass
 import inspect
-from typing import Awaitable, Callable
+import json
+import typing
+from typing import Any, Awaitable, Callable, Literal, Optional, Union
 
 from docstring_parser import parse
+from pydantic import ConfigDict, TypeAdapter
+from typing_extensions import NotRequired, TypedDict
 
 from gensee_agent.exceptions.gensee_exceptions import ImplementationError, ToolExecutionError
 from gensee_agent.utils.logging import configure_logger
@@ -9,15 +14,136 @@ from gensee_agent.utils.logging import configure_logger
 logger = configure_logger(__name__)
 
 _TOOL_REGISTRY : dict[str, type["BaseTool"]] = {}
+# Public API metadata by tool class, built once per process because compiling the validators is not free.
+_PUBLIC_API_METADATA: dict[type["BaseTool"], dict[str, dict]] = {}
+
+# Python types of the JSON schema types, for the arguments of MCP tools.
+_JSON_SCHEMA_TYPES: dict[str, Any] = {
+    "string": str,
+    "integer": int,
+    "number": float,
+    "boolean": bool,
+    "object": dict,
+    "null": type(None),
+}
+
+@dataclass
+class ToolCachePolicy:
+    """How the results of a public API may be cached by ToolManager, declared with `@public_api(cache_ttl=...)`."""
+    ttl_seconds: float  # How long a result is reused.
+    key_params: Optional[list[str]] = None  # Parameters that identify a call.  None for all of them.
+    scope: Literal["session", "global"] = "global"  # "session" for results that must not be shared between sessions.
+
+class ArgumentValidator:
+    """Validate and coerce the arguments of a public API in one pass, e.g., "3" to 3 for an int parameter.
+
+    Compiled once per API, from its signature or from a JSON schema.  Unknown and missing parameters are errors,
+    as are values of the wrong type, including in nested lists and dicts.  `validate` raises pydantic's
+    ValidationError, whose `errors()` tell what is wrong with each argument.
+    """
+
+    def __init__(self, name: str, parameters: dict[str, tuple[Any, bool]], schema: Optional[dict] = None):
+        """`parameters` has the type of each parameter, and whether it is required.  `schema` is the JSON schema they
+        come from, if any."""
+        fields = {
+            # Optional parameters also accept None, e.g., "null" from the LLM.
+            param_name: param_type if required else NotRequired[Optional[param_type]]  # type: ignore[valid-type]
+            for param_name, (param_type, required) in parameters.items()
+        }
+        arguments_type = TypedDict(f"{name}_arguments", fields)  # type: ignore[operator]
+        arguments_type.__pydantic_config__ = ConfigDict(extra="forbid")  # type: ignore[attr-defined]
+        self.adapter = TypeAdapter(arguments_type)
+        self.optional = {param_name for param_name, (_, required) in parameters.items() if not required}
+        # Parameters that the LLM may send JSON-encoded, e.g., a list as a string in the XML tool use format.
+        self.json_encoded = {param_name for param_name, (param_type, _) in parameters.items() if _is_container(param_type)}
+        self.schema = schema
+
+    @classmethod
+    def from_signature(cls, name: str, parameters: list[inspect.Parameter]) -> "ArgumentValidator":
+        return cls(name, {
+            param.name: (param.annotation if param.annotation != inspect.Parameter.empty else Any, param.default == inspect.Parameter.empty)
+            for param in parameters
+        })
+
+    @classmethod
+    def from_json_schema(cls, name: str, schema: dict) -> "ArgumentValidator":
+        required = set(schema.get("required", []))
+        return cls(name, {
+            param_name: (_python_type(param_schema), param_name in required)
+            for param_name, param_schema in schema.get("properties", {}).items()
+        }, schema=schema)
+
+    def json_schema(self) -> dict:
+        """JSON schema of the arguments, e.g., to declare the API as a native tool to the LLM provider."""
+        if self.schema is None:
+            self.schema = _without_titles(self.adapter.json_schema())
+        return self.schema
+
+    def validate(self, params: dict) -> dict:
+        """Return the validated and coerced arguments.  `params` is not modified."""
+        params = dict(params)
+        for param_name, value in params.items():
+            if not isinstance(value, str):
+                continue
+            if param_name in self.optional and value.lower() in ("none", "null"):
+                params[param_name] = None
+            elif param_name in self.json_encoded:
+                try:
+                    params[param_name] = json.loads(value)
+                except ValueError:
+                    pass  # Reported by the validation.
+        return self.adapter.validate_python(params)
+
+def _without_titles(schema: Any) -> Any:
+    """`schema` without the titles pydantic generates from the Python names, which only lengthen the prompts."""
+    if isinstance(schema, list):
+        return [_without_titles(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+    return {
+        # The keys of "properties" and "$defs" are names, e.g., of a parameter called "title", not keywords.
+        key: {name: _without_titles(value) for name, value in value.items()} if key in ("properties", "$defs") else _without_titles(value)
+        for key, value in schema.items() if key != "title"
+    }
+
+def _is_container(param_type: Any) -> bool:
+    origin = typing.get_origin(param_type) or param_type
+    if origin is Union:
+        return any(_is_container(arg) for arg in typing.get_args(param_type) if arg is not type(None))
+    return origin in (list, dict, tuple, set)
+
+def _python_type(schema: dict) -> Any:
+    """Python type of a JSON schema, for the validation of the arguments of MCP tools."""
+    json_type = schema.get("type")
+    if isinstance(json_type, list):
+        return Union[tuple(_python_type({**schema, "type": single_type}) for single_type in json_type)]  # type: ignore[return-value]
+    if json_type == "array":
+        return list[_python_type(schema.get("items", {}))]  # type: ignore[misc]
+    return _JSON_SCHEMA_TYPES.get(json_type, Any) if isinstance(json_type, str) else Any
 
 class BaseTool:
 
     def __init__(self, tool_name: str, config: dict):
-        self._public_api_metadata = {}
+        self._public_api_metadata = self.public_api_metadata()
         self._interaction_func = None
+        logger.info(f"All function metadata: {self._public_api_metadata}")
 
-        # Use self.__class__.__dict__ to get class methods, not instance attributes
-        for name, func in self.__class__.__dict__.items():
+    @classmethod
+    def public_api_metadata(cls) -> dict[str, dict]:
+        """Description, parameters and function of each `@public_api` method of the class, by method name.
+
+        Built from the signatures and docstrings, without creating the tool (which may need credentials).
+        Returns a copy, which tools may extend, e.g., with the tools of an MCP server.
+        """
+        if cls not in _PUBLIC_API_METADATA:
+            _PUBLIC_API_METADATA[cls] = cls._build_public_api_metadata()
+        return dict(_PUBLIC_API_METADATA[cls])
+
+    @classmethod
+    def _build_public_api_metadata(cls) -> dict[str, dict]:
+        metadata = {}
+        # Use cls.__dict__ to get the methods defined by the class itself
+        for name, func in cls.__dict__.items():
             if callable(func) and getattr(func, "_is_public_api", False):
                 signature = inspect.signature(func)
                 doc = parse(inspect.getdoc(func) or "")
@@ -33,12 +159,15 @@ class BaseTool:
                         "required": param.default == inspect.Parameter.empty,
                     }
 
-                self._public_api_metadata[name] = {
+                metadata[name] = {
                     "function": func,
                     "description": doc.short_description if doc else "",
                     "parameters": properties,
+                    "validator": ArgumentValidator.from_signature(f"{cls.__name__}_{name}", signature_params),
+                    "cache": getattr(func, "_cache_policy", None),
+                    "execution": getattr(func, "_execution", None),
                 }
-        logger.info(f"All function metadata: {self._public_api_metadata}")
+        return metadata
 
 
     def __repr__(self) -> str:
@@ -60,6 +189,18 @@ def register_tool(tool_name: str, tool_class: type[BaseTool]):
     assert issubclass(tool_class, BaseTool), "tool_class should be a subclass of BaseTool."
     _TOOL_REGISTRY[tool_name] = tool_class
 
-def public_api(func):
-    func._is_public_api = True
-    return func
+def public_api(func: Optional[Callable] = None, *, cache_ttl: Optional[float] = None, cache_key_params: Optional[list[str]] = None,
+               cache_scope: Literal["session", "global"] = "global", execution: Optional[Literal["inline", "thread", "process"]] = None):
+    """Mark a method as an API of the tool, callable by the LLM.
+
+    With `cache_ttl`, identical calls within `cache_ttl` seconds reuse the result when the tool cache is enabled
+    (see ToolCache), e.g., `@public_api(cache_ttl=600)`.  `execution` tells where a synchronous method runs (see
+    ToolExecutor), e.g., `@public_api(execution="process")` for CPU-heavy code.
+    """
+    def decorate(func: Callable) -> Callable:
+        func._is_public_api = True  # type: ignore[attr-defined]
+        func._execution = execution  # type: ignore[attr-defined]
+        if cache_ttl is not None:
+            func._cache_policy = ToolCachePolicy(ttl_seconds=cache_ttl, key_params=cache_key_params, scope=cache_scope)  # type: ignore[attr-defined]
+        return func
+    return decorate(func) if func is not None else decorate
@@ -15,7 +15,7 @@ class GenseeScrape(BaseTool):
         super().__init__(tool_name, config)
         self.config = self.Config.from_dict(config)
 
-    @public_api
+    @public_api(cache_ttl=3600)
     async def scrape(self, urls: list[str], query: str) -> list[dict]:
         """Perform a scrape using the Gensee scrape service.
 
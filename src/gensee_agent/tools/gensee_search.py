@@ -15,7 +15,7 @@ class GenseeSearch(BaseTool):
         super().__init__(tool_name, config)
         self.config = self.Config.from_dict(config)
 
-    @public_api
+    @public_api(cache_ttl=600)
     async def search(self, query: str, num_results: int = 5) -> str:
         """Perform a search using the Gensee search service.
 
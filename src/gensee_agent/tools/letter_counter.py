@@ -6,7 +6,7 @@ class LetterCounter(BaseTool):
     def __init__(self, tool_name: str, config: dict):
         super().__init__(tool_name, config)
 
-    @public_api
+    @public_api(execution="inline")
     def count_letters(self, letter: str, text: str) -> int:
         """Count occurrences of a specific letter in the given text.
 
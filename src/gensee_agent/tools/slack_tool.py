@@ -46,7 +46,7 @@ class SlackTool(BaseTool):
                     continue
                 raise ToolExecutionError(f"Slack API error: {e}", retryable=False)
 
-    @public_api
+    @public_api(cache_ttl=300, cache_scope="session")
     async def list_channels(self, channel_types: str = "public_channel,private_channel") -> list[dict[str, Any]]:
         """List all channels in the Slack workspace.
 
@@ -69,7 +69,7 @@ class SlackTool(BaseTool):
                 break
         return channels
 
-    @public_api
+    @public_api(cache_ttl=300, cache_scope="session")
     async def fetch_channel_history(
         self,
         channel_id: str,
@@ -123,7 +123,7 @@ class SlackTool(BaseTool):
 
         return all_msgs[:limit]
 
-    @public_api
+    @public_api(cache_ttl=300, cache_scope="session")
     async def fetch_thread_replies(self, channel_id: str, thread_ts: str) -> list[dict[str, Any]]:
         """Fetch all replies in a thread.
 
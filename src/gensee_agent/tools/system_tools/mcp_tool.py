@@ -5,7 +5,7 @@ from mcp import ClientSession, Tool
 
 from gensee_agent.utils.configs import BaseConfig, register_configs
 from gensee_agent.exceptions.gensee_exceptions import ToolExecutionError
-from gensee_agent.tools.base import BaseTool
+from gensee_agent.tools.base import ArgumentValidator, BaseTool
 
 class McpTool(BaseTool):
 
@@ -52,4 +52,5 @@ class McpTool(BaseTool):
                 "function": functools.partial(McpTool.tool_callback, api_name=api_name),  # Use unbounded version to keep the self argument.
                 "description": description,
                 "parameters": parameters,
+                "validator": ArgumentValidator.from_json_schema(api_name, tool.inputSchema),
             }
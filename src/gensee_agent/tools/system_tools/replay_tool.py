@@ -0,0 +1,33 @@
+import functools
+from typing import Any
+
+from gensee_agent.controller.recording import Recording
+from gensee_agent.exceptions.gensee_exceptions import ToolExecutionError
+from gensee_agent.settings import Settings
+from gensee_agent.tools.base import BaseTool
+
+class ReplayTool(BaseTool):
+    """Stand-in for a tool, playing back the calls recorded by `Recorder` (see the "replay" config).
+
+    It has the same APIs and descriptions as the tool it replaces, so the prompts are the same as in the recorded run.
+    """
+
+    async def replay_callback(self, api_name: str, **kwargs) -> Any:
+        full_api_name = f"{self.tool_name}{Settings.SEPARATOR}{api_name}"
+        record = self.recording.find_tool(full_api_name, kwargs)
+        if record is None:
+            raise ToolExecutionError(f"No recorded call of {full_api_name} matches the arguments {kwargs}", retryable=False)
+        await self.recording.wait(record["latency_seconds"])
+        if "error" in record:
+            raise ToolExecutionError(f"Replayed error of {full_api_name}: {record['error']['message']}", retryable=record["error"]["retryable"])
+        return record["result"]
+
+    def __init__(self, tool_name: str, config: dict, tool_class: type[BaseTool]):
+        super().__init__(tool_name, config)
+        self.tool_name = tool_name
+        self.recording = Recording.get(config)
+        for api_name, metadata in tool_class.public_api_metadata().items():
+            self._public_api_metadata[api_name] = {
+                **metadata,
+                "function": functools.partial(ReplayTool.replay_callback, api_name=api_name),  # Use unbounded version to keep the self argument.
+            }
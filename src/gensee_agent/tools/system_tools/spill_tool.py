@@ -0,0 +1,49 @@
+from typing import Any
+
+from gensee_agent.controller.spill_store import SpillStore
+from gensee_agent.tools.base import BaseTool, public_api
+
+class SpilledResults(BaseTool):
+    """Page through and search the tool results too long to be shown in full (see SpillStore)."""
+
+    def __init__(self, tool_name: str, config: dict, store: SpillStore):
+        super().__init__(tool_name, config)
+        self.store = store
+
+    # In threads, since the store only reads immutable files, and a grep may scan megabytes.
+    @public_api(execution="thread")
+    def read(self, handle: str, offset: int = 0, length: int = 4000) -> Any:
+        """Read a part of a tool result that was too long to be shown in full.
+
+        Args:
+            handle (str): The handle of the stored result, given with its preview.
+            offset (int): Position to start reading at, in bytes from the start of the result, default is 0.
+            length (int): Number of bytes to read, default is 4000.
+
+        Returns:
+            str: The part of the result.
+        """
+        try:
+            return self.store.read(handle, offset, length)
+        except ValueError as e:
+            return {"error": str(e)}
+
+    @public_api(execution="thread")
+    def grep(self, handle: str, pattern: str, max_matches: int = 20, context_bytes: int = 200, offset: int = 0) -> Any:
+        """Search a tool result that was too long to be shown in full with a regular expression.
+
+        Args:
+            handle (str): The handle of the stored result, given with its preview.
+            pattern (str): Python regular expression to search for, e.g., "error|failed".
+            max_matches (int): Max number of matches to return, default is 20.
+            context_bytes (int): Number of bytes shown before and after each match, default is 200.
+            offset (int): Position to start searching at, in bytes, e.g., the `next_offset` of a previous search, default is 0.
+
+        Returns:
+            dict: The matches, with their offset to read more around them with `read`, and the `next_offset` to continue
+                the search from if it did not reach the end of the result.
+        """
+        try:
+            return self.store.grep(handle, pattern, max_matches, context_bytes, offset)
+        except ValueError as e:
+            return {"error": str(e)}
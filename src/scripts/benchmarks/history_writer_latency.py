@@ -0,0 +1,92 @@
+"""Latency of HistoryManager.add_entry under load, with inline writes and with the write-behind HistoryWriter.
+
+Runs many concurrent sessions that each add llm_use entries (as TaskManager does at every step) to a Redis
+session store and a JSONL dump.  Redis is simulated with fakeredis plus a fixed delay per round trip, to stand
+for a remote server.  Requires `fakeredis`.
+
+Usage: python src/scripts/benchmarks/history_writer_latency.py [sessions] [steps] [redis_latency_ms]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import fakeredis
+from fakeredis.aioredis import FakeRedis
+
+from gensee_agent.controller.dataclass.llm_use import LLMUse
+from gensee_agent.controller.history_manager import HistoryManager
+from gensee_agent.controller.history_writer import HistoryWriter
+
+class SlowPipeline:
+    """Pipeline adding a fixed delay to each round trip."""
+    def __init__(self, pipeline, latency: float):
+        self.pipeline = pipeline
+        self.latency = latency
+
+    async def __aenter__(self):
+        await self.pipeline.__aenter__()
+        return self
+
+    async def __aexit__(self, *args):
+        return await self.pipeline.__aexit__(*args)
+
+    def __getattr__(self, name):
+        return getattr(self.pipeline, name)
+
+    async def execute(self):
+        await asyncio.sleep(self.latency)
+        return await self.pipeline.execute()
+
+class SlowRedis(FakeRedis):
+    latency = 0.0
+
+    def pipeline(self, transaction: bool = True, shard_hint=None):
+        return SlowPipeline(super().pipeline(transaction=transaction, shard_hint=shard_hint), self.latency)
+
+async def run_session(config: dict, session_index: int, steps: int, redis_client: SlowRedis, history_writer, latencies: list[float]):
+    history_manager = HistoryManager(config, session_id=f"bench-{session_index}", redis_client=redis_client, history_writer=history_writer)
+    llm_use = LLMUse([{"role": "system", "content": "system prompt " * 200}])
+    for step in range(steps):
+        llm_use = llm_use.copy()
+        llm_use.append_prompt("assistant" if step % 2 else "user", f"message {step} " + "x" * 500)
+        start = time.perf_counter()
+        await history_manager.add_entry("llm_use", f"step {step}", llm_use)
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0)  # The rest of the step.
+    await history_manager.flush()
+
+async def measure(sessions: int, steps: int, redis_latency: float, write_behind: bool) -> tuple[list[float], float]:
+    with tempfile.TemporaryDirectory() as directory:
+        config = {
+            "history_manager": {"history_dump_path": os.path.join(directory, "dump.jsonl")},
+            "history_writer": {"enabled": write_behind},
+        }
+        redis_client = SlowRedis(server=fakeredis.FakeServer())
+        redis_client.latency = redis_latency
+        history_writer = HistoryWriter(config) if write_behind else None
+        latencies: list[float] = []
+        start = time.perf_counter()
+        await asyncio.gather(*(run_session(config, index, steps, redis_client, history_writer, latencies) for index in range(sessions)))
+        if history_writer is not None:
+            await history_writer.shutdown()
+        return latencies, time.perf_counter() - start
+
+def percentile(values: list[float], fraction: float) -> float:
+    return sorted(values)[min(len(values) - 1, int(len(values) * fraction))]
+
+async def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    steps = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    redis_latency = (float(sys.argv[3]) if len(sys.argv) > 3 else 5.0) / 1000
+    print(f"{sessions} sessions x {steps} steps, {redis_latency * 1000:.1f} ms per Redis round trip")
+    print(f"{'mode':>12} {'add_entry p50 (ms)':>19} {'p99 (ms)':>9} {'total (s)':>10}")
+    for write_behind in (False, True):
+        latencies, total = await measure(sessions, steps, redis_latency, write_behind)
+        mode = "write-behind" if write_behind else "inline"
+        print(f"{mode:>12} {statistics.median(latencies) * 1000:>19.3f} {percentile(latencies, 0.99) * 1000:>9.3f} {total:>10.2f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,61 @@
+"""Memory held by the llm_use entries of a session's history, with and without structural sharing.
+
+Replays the history updates of TaskManager.step for a session of N tool-use steps: each step appends the
+assistant message (PARSE_LLM) and the tool result (PARSE_TOOL), each time as a new llm_use entry derived with
+copy().  "before" copies the prompt list on every copy(), as LLMUse did before the shared MessageLog.
+
+Usage: python src/scripts/benchmarks/llm_use_memory.py [steps ...]
+"""
+import gc
+import sys
+import tracemalloc
+from typing import Optional
+
+from gensee_agent.controller.dataclass.llm_use import LLMUse
+
+class ListCopyLLMUse:
+    """The previous LLMUse: every copy() owns a full copy of the prompt list."""
+    def __init__(self, prompts: list[dict], model_name: Optional[str] = None):
+        self.prompts = prompts
+        self.model_name = model_name
+
+    def append_prompt(self, role: str, content: str) -> None:
+        self.prompts.append({"role": role, "content": content})
+
+    def copy(self) -> "ListCopyLLMUse":
+        return ListCopyLLMUse(prompts=self.prompts.copy(), model_name=self.model_name)
+
+def run_session(llm_use_class: type, steps: int, contents: list[str]) -> list[dict]:
+    history = []
+    llm_use = llm_use_class([{"role": "system", "content": contents[0]}, {"role": "user", "content": contents[1]}])
+    history.append({"name": "llm_use", "title": "start", "entry": llm_use})
+    for step in range(steps):
+        llm_use = llm_use.copy()
+        llm_use.append_prompt("assistant", contents[2 * step + 2])
+        history.append({"name": "llm_use", "title": f"assistant {step}", "entry": llm_use})
+        llm_use = llm_use.copy()
+        llm_use.append_prompt("user", contents[2 * step + 3])
+        history.append({"name": "llm_use", "title": f"result {step}", "entry": llm_use})
+    return history
+
+def measure(llm_use_class: type, steps: int) -> int:
+    # Message contents are created beforehand, since both versions hold them once.
+    contents = [f"message {i} " + "x" * 500 for i in range(2 * steps + 2)]
+    gc.collect()
+    tracemalloc.start()
+    history = run_session(llm_use_class, steps, contents)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del history
+    return current
+
+def main():
+    steps_list = [int(arg) for arg in sys.argv[1:]] or [10, 100, 500]
+    print(f"{'steps':>6} {'before (KiB)':>14} {'after (KiB)':>13} {'ratio':>7}")
+    for steps in steps_list:
+        before = measure(ListCopyLLMUse, steps)
+        after = measure(LLMUse, steps)
+        print(f"{steps:>6} {before / 1024:>14.1f} {after / 1024:>13.1f} {before / after:>6.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Overhead of the agent loop alone, measured by replaying a recorded run with zero LLM and tool latency.
+
+Record a run first by adding `"recorder": {"record_path": "recording.jsonl"}` to its config.  This script then
+replays the same title and task from the recording in many concurrent sessions, with the "replay.recorded" model and the
+replay tools, so no network access is needed.
+
+Usage: python src/scripts/benchmarks/replay_overhead.py config.json recording.jsonl "title" "task" [sessions] [concurrency] [latency_scale]
+"""
+import asyncio
+import json
+import logging
+import statistics
+import sys
+import time
+
+from gensee_agent.controller.controller import Controller
+from gensee_agent.utils.streaming_data import StreamingData
+
+async def run_session(controller: Controller, title: str, task: str, semaphore: asyncio.Semaphore, durations: list[float], llm_calls: list[int]):
+    async with semaphore:
+        start = time.perf_counter()
+        usage = {}
+        async for chunk in controller.run(title, task):
+            message = StreamingData.from_streaming_output(chunk).message
+            if message is not None and message.obj_type == "usage":
+                usage = message.delta
+        durations.append(time.perf_counter() - start)
+        llm_calls.append(usage.get("llm_calls", 0) if isinstance(usage, dict) else 0)
+
+async def main():
+    config_path, recording_path, title, task = sys.argv[1:5]
+    sessions = int(sys.argv[5]) if len(sys.argv) > 5 else 1000
+    concurrency = int(sys.argv[6]) if len(sys.argv) > 6 else 100
+    latency_scale = float(sys.argv[7]) if len(sys.argv) > 7 else 0.0
+    logging.disable(logging.INFO)  # Logging of the prompts would dominate the measure.
+
+    config = json.load(open(config_path, "r"))
+    config.setdefault("llm_manager", {}).update({"available_models": ["replay.recorded"], "default_model": "replay.recorded"})
+    config["replay"] = {"recording_path": recording_path, "latency_scale": latency_scale}
+    config.pop("recorder", None)
+    controller = await Controller.create(config)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    durations: list[float] = []
+    llm_calls: list[int] = []
+    start = time.perf_counter()
+    await asyncio.gather(*(run_session(controller, title, task, semaphore, durations, llm_calls) for _ in range(sessions)))
+    total = time.perf_counter() - start
+    await controller.aclose()
+
+    steps = sum(llm_calls)
+    print(f"{sessions} sessions, {concurrency} concurrent, latency scale {latency_scale}")
+    print(f"total {total:.2f} s, {sessions / total:.1f} sessions/s, {steps} LLM steps")
+    print(f"session p50 {statistics.median(durations) * 1000:.2f} ms, max {max(durations) * 1000:.2f} ms")
+    if steps:
+        print(f"overhead per LLM step {total / steps * 1000:.3f} ms (wall time / steps)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+"""Time to check and coerce the arguments of a tool call, with the compiled validator and with the previous loop.
+
+"before" is the loop ToolManager.execute ran before the validators: for each argument, it looked up the parameter
+metadata and compared the string of its type with "<class 'int'>", "<class 'float'>", etc.  "after" is the
+ArgumentValidator compiled once per public API, which also checks nested lists and dicts and unknown parameters.
+
+Usage: python src/scripts/benchmarks/tool_argument_validation.py [calls]
+"""
+import sys
+import time
+from typing import Optional
+
+from gensee_agent.tools.base import BaseTool, public_api
+
+class BenchmarkTool(BaseTool):
+    @public_api
+    def search(self, query: str, limit: int, min_score: float, exact: bool, language: Optional[str] = None) -> list:
+        """Search documents.
+
+        Args:
+            query (str): The query.
+            limit (int): Max number of documents.
+            min_score (float): Min score of the documents.
+            exact (bool): Whether to only return exact matches.
+            language (Optional[str]): Language of the documents.
+        """
+        return []
+
+    @public_api
+    def tag(self, ids: list[int], tags: dict[str, list[str]]) -> list:
+        """Tag documents.
+
+        Args:
+            ids (list[int]): The documents.
+            tags (dict[str, list[str]]): Tags by category.
+        """
+        return []
+
+def coerce_before(metadata: dict, params: dict) -> dict:
+    """The previous loop of ToolManager.execute, on a copy of the arguments."""
+    params = dict(params)
+    for (param_name, param_value) in params.items():
+        if metadata["parameters"][param_name]["required"] is False:
+            if param_value is not None and isinstance(param_value, str) and (param_value.lower() == "none" or param_value.lower() == "null"):
+                params[param_name] = None
+                continue
+        if metadata["parameters"][param_name]["type"] == "<class 'int'>" and isinstance(param_value, str):
+            params[param_name] = int(param_value)
+        if isinstance(param_value, str) and (metadata["parameters"][param_name]["type"] == "<class 'float'>" or metadata["parameters"][param_name]["type"] == "number"):
+            params[param_name] = float(param_value)
+        if isinstance(param_value, str) and metadata["parameters"][param_name]["type"] == "<class 'bool'>":
+            params[param_name] = param_value.lower() in ["true", "1", "yes"]
+    return params
+
+def measure(coerce, metadata: dict, params: dict, calls: int) -> float:
+    """Microseconds per call."""
+    start = time.perf_counter()
+    for _ in range(calls):
+        coerce(metadata, params)
+    return (time.perf_counter() - start) / calls * 1e6
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    metadata = BenchmarkTool.public_api_metadata()
+    cases = {
+        "scalars": ("search", {"query": "gensee", "limit": "10", "min_score": "0.5", "exact": "true", "language": "null"}),
+        "nested": ("tag", {"ids": [1, 2, "3"], "tags": {"topic": ["agents", "tools"], "status": ["draft"]}}),
+    }
+    print(f"{'case':>8} {'before (us)':>12} {'after (us)':>11}")
+    for case, (api_name, params) in cases.items():
+        validator = metadata[api_name]["validator"]
+        before = measure(coerce_before, metadata[api_name], params, calls)
+        after = measure(lambda _, params: validator.validate(params), metadata[api_name], params, calls)
+        print(f"{case:>8} {before:>12.2f} {after:>11.2f}")
+    # Compiling happens once per public API, when the tool class is first loaded.
+    start = time.perf_counter()
+    BenchmarkTool._build_public_api_metadata()
+    print(f"Compiling the validators of 2 APIs: {(time.perf_counter() - start) * 1e3:.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import asyncio
+
+from gensee_agent.controller.context_manager import ContextManager
+from gensee_agent.controller.dataclass.llm_use import LLMUse
+from gensee_agent.controller.llm_manager import LLMManager
+
+def _context_manager(config: dict) -> ContextManager:
+    config = {"llm_manager": {"available_models": ["openai.gpt-5"], "default_model": "openai.gpt-5"}, "context_manager": config}
+    return ContextManager(config, LLMManager(config))
+
+def test_sliding_window_drops_whole_turns():
+    prompts = [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "Count the letters."}]
+    for step in range(6):
+        prompts.append({"role": "assistant", "content": f"<title>Step {step}</title>{'thinking ' * 200}<tool_use>...</tool_use>"})
+        prompts.append({"role": "user", "content": f"<title>Result of step {step}</title>\n[count_letters] Result:\n{step}\n"})
+    context_manager = _context_manager({"max_context_tokens": 1500, "keep_recent_messages": 3})
+
+    llm_use, report, _ = asyncio.run(context_manager.prepare(LLMUse(prompts)))
+
+    kept = llm_use.prompts
+    assert report["dropped_messages"] > 0 and report["dropped_messages"] % 2 == 0
+    assert report["tokens_after"] <= 1500
+    assert kept[:2] == prompts[:2]
+    # Each tool result follows the tool use it answers.
+    for previous, prompt in zip(kept[2:], kept[3:]):
+        if prompt["content"].startswith("<title>Result of step "):
+            assert previous["content"].startswith(f"<title>Step {prompt['content'][len('<title>Result of step '):][0]}</title>")
+    # The most recent messages are kept with the tool use of the oldest of them.
+    assert kept[-4:] == prompts[-4:]
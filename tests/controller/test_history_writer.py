@@ -0,0 +1,62 @@
+import asyncio
+
+from gensee_agent.controller.history_writer import HistoryWriter
+
+def _writer(**config) -> HistoryWriter:
+    return HistoryWriter({"history_writer": {"enabled": True, "flush_interval_seconds": 0.01, **config}})
+
+def test_failed_writes_are_retried_in_order(tmp_path):
+    dump_path = tmp_path / "missing" / "dump.jsonl"
+
+    async def run():
+        writer = _writer(flush_interval_seconds=10)
+        writer.append_dump(str(dump_path), b"1\n")
+        try:
+            await writer.flush()
+        except OSError:
+            pass
+        writer.append_dump(str(dump_path), b"2\n")
+        assert writer.stats()["pending_entries"] == 2
+        assert writer.stats()["consecutive_failures"] == 1
+        dump_path.parent.mkdir()
+        await writer.shutdown()
+        return writer
+    writer = asyncio.run(run())
+    assert dump_path.read_bytes() == b"1\n2\n"
+    assert writer.stats()["consecutive_failures"] == 0
+
+def test_retries_back_off_and_give_up(tmp_path):
+    dump_path = str(tmp_path / "missing" / "dump.jsonl")
+
+    async def run():
+        writer = _writer(max_retries=3, retry_base_delay_seconds=0.05)
+        writer.append_dump(dump_path, b"1\n")
+        await asyncio.sleep(0.1)
+        # Flushes fail at 0.01s, then retry after 0.05s, 0.1s...
+        assert writer.writer_stats["flushes"] <= 2
+        await asyncio.sleep(0.3)
+        stats = writer.stats()
+        writer.flush_task.cancel()
+        return stats
+    stats = asyncio.run(run())
+    assert stats["writes"]["flushes"] == 3
+    assert stats["writes"]["dropped_entries"] == 1
+    assert stats["pending_entries"] == 0
+    assert stats["pending_bytes"] == 0
+
+def test_failed_writes_over_max_pending_bytes_are_dropped(tmp_path):
+    dump_path = str(tmp_path / "missing" / "dump.jsonl")
+
+    async def run():
+        writer = _writer(flush_interval_seconds=10, max_pending_bytes=10)
+        writer.append_dump(dump_path, b"0123456789abcdef\n")
+        try:
+            await writer.flush()
+        except OSError:
+            pass
+        stats = writer.stats()
+        writer.flush_task.cancel()
+        return stats
+    stats = asyncio.run(run())
+    assert stats["writes"]["dropped_entries"] == 1
+    assert stats["pending_bytes"] == 0
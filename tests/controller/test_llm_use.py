@@ -0,0 +1,22 @@
+from gensee_agent.controller.dataclass.llm_use import LLMUse
+
+def test_prompts_are_copied_once_per_length():
+    llm_use = LLMUse([{"role": "system", "content": "Be brief."}])
+    llm_use.append_user_prompt("Count the letters.", "Task")
+    prompts = llm_use.prompts
+    assert llm_use.prompts is prompts
+    assert llm_use.copy().prompts is prompts
+
+    snapshot = llm_use.copy()
+    llm_use.append_assistant_prompt("<title>Count</title>3")
+    assert len(llm_use.prompts) == 3
+    assert snapshot.prompts == prompts and len(prompts) == 2
+
+def test_updating_the_system_prompt_keeps_earlier_snapshots():
+    llm_use = LLMUse([{"role": "system", "content": "Be brief."}, {"role": "user", "content": "Hi"}])
+    snapshot = llm_use.copy()
+    prompts = snapshot.prompts
+    llm_use.set_or_update_system_prompt("system", "Be verbose.")
+    assert llm_use.prompts[0]["content"] == "Be verbose."
+    assert snapshot.prompts is prompts
+    assert prompts[0]["content"] == "Be brief."
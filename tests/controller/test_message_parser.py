@@ -0,0 +1,38 @@
+import pytest
+
+from gensee_agent.controller.message_parser import StreamingMessageParser
+
+def _feed(message: str, chunk_size: int, stop_sequences=None) -> tuple[StreamingMessageParser, int | None]:
+    """Feed `message` in chunks, and return the parser with the position of the chunk that emitted the first tool use."""
+    parser = StreamingMessageParser(stop_sequences)
+    emitted_at = None
+    for start in range(0, len(message), chunk_size):
+        if any(event.type == "tool_use" for event in parser.feed(message[start:start + chunk_size])) and emitted_at is None:
+            emitted_at = start
+    parser.close()
+    return parser, emitted_at
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 1000])
+def test_tool_use_is_emitted_at_tool_use_closing(chunk_size):
+    message = '<title>Count</title><tool_use>\n<name>a.b</name>\n<arguments>\n{"s": "</arguments>"}\n</arguments>\n</tool_use>'
+    parser, emitted_at = _feed(message, chunk_size)
+    assert parser.title == "Count"
+    assert [(tool_use.api_name, tool_use.params) for tool_use in parser.tool_uses] == [("a.b", {"s": "</arguments>"})]
+    assert emitted_at is not None
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 1000])
+def test_tool_use_is_emitted_at_arguments_closing_when_tool_use_closing_is_a_stop_sequence(chunk_size):
+    # </tool_use> never comes, so the tool use is emitted before the message ends.
+    message = '<tool_use><name>a.b</name><arguments>{"s": "</arguments>"}</arguments>\n'
+    parser, emitted_at = _feed(message + "more text", chunk_size, stop_sequences=["</tool_use>"])
+    assert [(tool_use.api_name, tool_use.params) for tool_use in parser.tool_uses] == [("a.b", {"s": "</arguments>"})]
+    assert emitted_at is not None and emitted_at < len(message)
+
+    # Without the stop sequence, the tool use is not confirmed by </tool_use>.
+    parser, emitted_at = _feed(message + "more text", chunk_size)
+    assert parser.tool_uses == []
+
+def test_tool_use_is_emitted_once():
+    message = '<tool_use><name>a.b</name><arguments>{"x": 1}</arguments></tool_use>'
+    parser, _ = _feed(message, 5, stop_sequences=["</tool_use>"])
+    assert len(parser.tool_uses) == 1
@@ -0,0 +1,85 @@
+import asyncio
+import os
+import textwrap
+import threading
+
+import pytest
+
+from gensee_agent.controller.tool_executor import ToolExecutor, close_tool_executors
+from gensee_agent.exceptions.gensee_exceptions import ToolExecutionError
+
+# Registered in the worker processes, which load it from the user tool path.
+_WORKER_TOOL = textwrap.dedent('''
+    import os
+    import threading
+
+    from gensee_agent.exceptions.gensee_exceptions import ToolExecutionError
+    from gensee_agent.tools.base import BaseTool, public_api, register_tool
+
+    class WorkerTool(BaseTool):
+        @public_api
+        def pid(self) -> dict:
+            """Process ID of the worker."""
+            return {"pid": os.getpid()}
+
+        @public_api
+        def lock(self) -> object:
+            """A result that cannot be pickled."""
+            return threading.Lock()
+
+        @public_api
+        def fail(self) -> str:
+            """A retryable error."""
+            raise ToolExecutionError("backend down", retryable=True)
+
+    register_tool("test.worker", WorkerTool)
+''')
+
+def _current_thread(tool) -> str:
+    return threading.current_thread().name
+
+def test_modes():
+    executor = ToolExecutor({"tool_executor": {"api_execution": {"tool.threaded": "thread"}}}, [])
+    assert executor.mode("tool.api", None) == "inline"
+    assert executor.mode("tool.api", "process") == "process"
+    assert executor.mode("tool.threaded", "process") == "thread"
+
+def test_thread_mode_runs_off_the_event_loop():
+    executor = ToolExecutor({}, [])
+
+    async def run():
+        return await asyncio.gather(executor.run("inline", "tool", None, _current_thread, "current_thread", {}),
+                                    executor.run("thread", "tool", None, _current_thread, "current_thread", {}))
+    try:
+        inline_thread, thread = asyncio.run(run())
+    finally:
+        asyncio.run(close_tool_executors())
+    assert inline_thread == threading.main_thread().name
+    assert thread.startswith("gensee-tool")
+    stats = executor.stats()
+    assert (stats["inline_calls"], stats["thread_calls"]) == (1, 1)
+
+@pytest.fixture
+def worker_tool_path(tmp_path) -> str:
+    (tmp_path / "worker_tool.py").write_text(_WORKER_TOOL)
+    return str(tmp_path)
+
+def test_process_mode(worker_tool_path):
+    executor = ToolExecutor({"tool_executor": {"max_processes": 1}}, [worker_tool_path])
+
+    async def run(func_name: str):
+        return await executor.run("process", "test.worker", None, None, func_name, {})
+
+    try:
+        # dict results come back as JSON.
+        assert f'"pid": {os.getpid()}' not in asyncio.run(run("pid"))
+        with pytest.raises(ToolExecutionError, match="cannot be sent back") as error:
+            asyncio.run(run("lock"))
+        assert not error.value.retryable
+        # Errors of the tool are pickled back with their retryable flag.
+        with pytest.raises(ToolExecutionError, match="backend down") as error:
+            asyncio.run(run("fail"))
+        assert error.value.retryable
+    finally:
+        asyncio.run(close_tool_executors())
+    assert executor.stats()["process_calls"] == 3
@@ -0,0 +1,127 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from gensee_agent.controller.tool_executor import ToolExecutor, close_tool_executors
+from gensee_agent.controller.tool_guard import ToolGuard
+from gensee_agent.exceptions.gensee_exceptions import ToolExecutionError
+
+def _guard(**config) -> ToolGuard:
+    return ToolGuard({"tool_guard": config})
+
+def test_concurrency_cap():
+    guard = _guard(max_concurrency=2)
+    running = 0
+    max_running = 0
+
+    async def call():
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return "ok"
+
+    async def run():
+        return await asyncio.gather(*(guard.run("tool.api", "tool", call) for _ in range(6)))
+    assert asyncio.run(run()) == ["ok"] * 6
+    assert max_running == 2
+    stats = guard.stats()["tool"]
+    assert stats["calls"] == 6
+    assert stats["max_queue_depth"] == 4
+    assert stats["running"] == 0
+
+def test_timeout():
+    guard = _guard(timeout_seconds=0.01)
+
+    async def call():
+        await asyncio.sleep(1)
+
+    with pytest.raises(ToolExecutionError) as error:
+        asyncio.run(guard.run("tool.api", "tool", call))
+    assert error.value.retryable
+    assert guard.stats()["tool"]["timeouts"] == 1
+
+def test_timed_out_thread_keeps_its_slot():
+    guard = _guard(max_concurrency=1, timeout_seconds=0.05)
+    executor = ToolExecutor({}, [])
+    intervals: list[tuple[float, float]] = []
+
+    def slow(tool):
+        start = time.monotonic()
+        time.sleep(0.2)
+        intervals.append((start, time.monotonic()))
+        return "ok"
+
+    async def run():
+        call = lambda: executor.run("thread", "tool", None, slow, "slow", {})
+        return await asyncio.gather(*(guard.run("tool.api", "tool", call) for _ in range(2)), return_exceptions=True)
+    try:
+        results = asyncio.run(run())
+    finally:
+        asyncio.run(close_tool_executors())
+    assert all(isinstance(result, ToolExecutionError) for result in results)
+    # The second call only started once the thread of the first one returned.
+    (_, first_end), (second_start, _) = sorted(intervals)
+    assert second_start >= first_end
+    assert guard.stats()["tool"]["running"] == 0
+
+def test_circuit_breaker():
+    guard = _guard(failure_threshold=2, reset_seconds=0.05)
+    fail = True
+
+    async def call():
+        if fail:
+            raise ToolExecutionError("backend down", retryable=True)
+        return "ok"
+
+    async def run():
+        nonlocal fail
+        for _ in range(2):
+            with pytest.raises(ToolExecutionError, match="backend down"):
+                await guard.run("tool.api", "tool", call)
+        assert guard.stats()["tool"]["state"] == "open"
+        # Open: calls fail fast, without calling the backend.
+        with pytest.raises(ToolExecutionError, match="unavailable"):
+            await guard.run("tool.api", "tool", call)
+        assert guard.stats()["tool"]["rejected"] == 1
+
+        # Half open: a failed trial call keeps it open.
+        await asyncio.sleep(0.06)
+        assert guard.stats()["tool"]["state"] == "half_open"
+        with pytest.raises(ToolExecutionError, match="backend down"):
+            await guard.run("tool.api", "tool", call)
+        assert guard.stats()["tool"]["state"] == "open"
+
+        # A successful trial call closes it.
+        await asyncio.sleep(0.06)
+        fail = False
+        assert await guard.run("tool.api", "tool", call) == "ok"
+        assert guard.stats()["tool"]["state"] == "closed"
+        assert guard.stats()["tool"]["opened"] == 1
+    asyncio.run(run())
+
+def test_non_retryable_errors_do_not_open_the_breaker():
+    guard = _guard(failure_threshold=1)
+
+    async def call():
+        raise ToolExecutionError("no such channel", retryable=False)
+
+    for _ in range(2):
+        with pytest.raises(ToolExecutionError, match="no such channel"):
+            asyncio.run(guard.run("tool.api", "tool", call))
+    assert guard.stats()["tool"]["state"] == "closed"
+
+def test_overrides_apply_per_api():
+    guard = _guard(overrides={"tool.slow_api": {"timeout_seconds": 0.01}})
+
+    async def call():
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    with pytest.raises(ToolExecutionError):
+        asyncio.run(guard.run("tool.slow_api", "tool", call))
+    assert asyncio.run(guard.run("tool.other_api", "tool", call)) == "ok"
+    assert set(guard.stats()) == {"tool.slow_api", "tool"}
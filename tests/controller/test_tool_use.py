@@ -0,0 +1,5 @@
+from gensee_agent.controller.dataclass.tool_use import ToolUse
+
+def test_call_ids_are_unique():
+    tool_uses = [ToolUse("gensee.letter_counter.count_letters", {"text": "hello", "letter": "l"}) for _ in range(10000)]
+    assert len({tool_use.call_id for tool_use in tool_uses}) == len(tool_uses)
@@ -0,0 +1,80 @@
+import asyncio
+
+import orjson
+import pytest
+
+from gensee_agent.controller.dataclass.llm_use import LLMUse
+from gensee_agent.history_backends.redis_backend import RedisSessionStore
+
+fakeredis = pytest.importorskip("fakeredis")
+
+def _llm_use(*contents: str) -> LLMUse:
+    llm_use = LLMUse(prompts=[{"role": "system", "content": "You are a helpful assistant."}], model_name="openai.gpt-4o")
+    for content in contents:
+        llm_use.append_user_prompt(content, title=content)
+    return llm_use
+
+def _run(test):
+    async def run():
+        redis_client = fakeredis.FakeAsyncRedis()
+        try:
+            await test(redis_client)
+        finally:
+            await redis_client.aclose()
+    asyncio.run(run())
+
+def test_round_trip():
+    async def test(redis_client):
+        llm_use = _llm_use("first", "second")
+        llm_use.provider_state = {"response_id": "resp_1", "model_name": "openai.gpt-4o", "length": 3}
+        await RedisSessionStore(redis_client, "s1").save("Second step", llm_use)
+
+        title, loaded = await RedisSessionStore(redis_client, "s1").load()
+        assert title == "Second step"
+        assert loaded == llm_use
+        assert loaded.model_name == "openai.gpt-4o"
+        assert loaded.provider_state == llm_use.provider_state
+        assert await RedisSessionStore(redis_client, "other").load() is None
+    _run(test)
+
+def test_save_only_appends_new_prompts():
+    async def test(redis_client):
+        store = RedisSessionStore(redis_client, "s1")
+        await store.save("First step", _llm_use("first"))
+        # Marks the stored prompts, to tell whether the next saves rewrite them.
+        marker = orjson.dumps({"role": "system", "content": "marker"})
+        await redis_client.lset(store.messages_key, 0, marker)
+
+        await store.save("Second step", _llm_use("first", "second", "third"))
+        messages = await redis_client.lrange(store.messages_key, 0, -1)
+        assert messages[0] == marker
+        assert [orjson.loads(message)["content"] for message in messages[1:]] == [
+            prompt["content"] for prompt in _llm_use("first", "second", "third").prompts[1:]]
+
+        # A changed prompt trims the list to the unchanged prefix, then pushes the rest.
+        await store.save("Third step", _llm_use("first", "changed"))
+        messages = await redis_client.lrange(store.messages_key, 0, -1)
+        assert messages[0] == marker
+        assert [orjson.loads(message)["content"] for message in messages[1:]] == [
+            prompt["content"] for prompt in _llm_use("first", "changed").prompts[1:]]
+
+        # A new store knows nothing of what is stored, so it rewrites the whole session.
+        await RedisSessionStore(redis_client, "s1").save("Fourth step", _llm_use("first"))
+        _, loaded = await RedisSessionStore(redis_client, "s1").load()
+        assert loaded == _llm_use("first")
+    _run(test)
+
+def test_ttl():
+    async def test(redis_client):
+        store = RedisSessionStore(redis_client, "s1", ttl_seconds=60)
+        await store.save("First step", _llm_use("first"))
+        for key in (store.messages_key, store.meta_key):
+            assert 0 < await redis_client.ttl(key) <= 60
+
+        untimed_store = RedisSessionStore(redis_client, "s2")
+        await untimed_store.save("First step", _llm_use("first"))
+        assert await redis_client.ttl(untimed_store.messages_key) == -1
+
+        await store.delete()
+        assert await store.load() is None
+    _run(test)
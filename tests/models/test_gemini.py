@@ -0,0 +1,141 @@
+import asyncio
+from types import SimpleNamespace
+
+from google.genai import errors
+from google.genai.types import GenerateContentResponse
+import pytest
+
+from gensee_agent.controller.dataclass.llm_use import LLMUse
+from gensee_agent.models.gemini import GeminiModel
+
+class FakeGeminiClient:
+    """Stand-in for `genai.Client`, recording the requests instead of sending them."""
+
+    def __init__(self):
+        self.requests: list[dict] = []
+        self.created_caches: list = []
+        self.rejected_caches: set[str] = set()
+        self.aio = SimpleNamespace(models=SimpleNamespace(generate_content=self.generate_content, generate_content_stream=self.generate_content_stream),
+                                   caches=SimpleNamespace(create=self.create_cache))
+
+    async def generate_content(self, model: str, contents: list, config):
+        self.requests.append({"model": model, "contents": contents, "config": config})
+        self._check_cache(config)
+        return _response("<title>Done</title>ok")
+
+    async def generate_content_stream(self, model: str, contents: list, config):
+        async def stream():
+            # As the real client, the request is only sent when the stream is read.
+            self.requests.append({"model": model, "contents": contents, "config": config})
+            self._check_cache(config)
+            for text in ("<title>Done</title>", "ok"):
+                yield _response(text)
+        return stream()
+
+    def _check_cache(self, config):
+        if config is not None and config.cached_content in self.rejected_caches:
+            raise errors.ClientError(404, {"error": {"code": 404, "message": "cache not found", "status": "NOT_FOUND"}})
+
+    async def create_cache(self, model: str, config):
+        self.created_caches.append(config)
+        return SimpleNamespace(name=f"cachedContents/{len(self.created_caches)}")
+
+def _response(text: str) -> GenerateContentResponse:
+    return GenerateContentResponse.model_validate({
+        "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finish_reason": "STOP"}],
+        "usage_metadata": {"prompt_token_count": 10, "candidates_token_count": 2},
+    })
+
+@pytest.fixture
+def client(monkeypatch) -> FakeGeminiClient:
+    client = FakeGeminiClient()
+    monkeypatch.setattr(GeminiModel, "client", property(lambda self: client))
+    return client
+
+def _model(**config) -> GeminiModel:
+    return GeminiModel("gemini.gemini-2.5-flash", {"gemini": config})
+
+def _llm_use(system_prompt: str = "You are a helpful assistant.") -> LLMUse:
+    llm_use = LLMUse(prompts=[{"role": "system", "content": system_prompt}])
+    llm_use.append_user_prompt("Count the letters.", title="Task")
+    return llm_use
+
+def test_messages_are_converted_once(client):
+    model = _model()
+    llm_use = _llm_use()
+    asyncio.run(model.completion(llm_use.prompts))
+    llm_use.append_assistant_prompt("<title>Step</title>thinking")
+    llm_use.append_user_prompt("More context.", title="Context")
+    asyncio.run(model.completion(llm_use.prompts))
+
+    first, second = client.requests
+    assert [content.role for content in second["contents"]] == ["user", "model", "user"]
+    # The message of the first step is the same object at the second step, so its conversion is reused.
+    assert second["contents"][0] is first["contents"][0]
+    assert len(model.converted_messages) == 3
+
+    # An equal message that is another object is converted again, since the cache is keyed by identity.
+    copied = [dict(prompt) for prompt in llm_use.prompts]
+    asyncio.run(model.completion(copied))
+    assert client.requests[-1]["contents"][0] is not first["contents"][0]
+    assert client.requests[-1]["contents"][0] == first["contents"][0]
+
+def test_conversion_cache_is_bounded(client):
+    model = _model(conversion_cache_size=2)
+    llm_use = _llm_use()
+    for index in range(4):
+        llm_use.append_assistant_prompt(f"<title>Step {index}</title>step")
+    asyncio.run(model.completion(llm_use.prompts))
+    assert len(model.converted_messages) == 2
+    assert [entry[0] for entry in model.converted_messages.values()] == llm_use.prompts[-2:]
+
+def test_system_messages_are_sent_as_system_instruction(client):
+    model = _model()
+    asyncio.run(model.completion(_llm_use("Be brief.").prompts, stop=["</tool_use>"]))
+    request = client.requests[-1]
+    assert request["config"].system_instruction == "Be brief."
+    assert request["config"].stop_sequences == ["</tool_use>"]
+    assert request["config"].cached_content is None
+    assert [content.parts[0].text for content in request["contents"]] == ["<title>Task</title>\nCount the letters."]
+
+def test_system_prompt_is_sent_as_cached_content(client):
+    model = _model(cache_system_prompt=True, min_system_cache_tokens=1)
+    for _ in range(2):
+        asyncio.run(model.completion(_llm_use().prompts))
+
+    assert len(client.created_caches) == 1
+    assert client.created_caches[0].system_instruction == "You are a helpful assistant."
+    for request in client.requests:
+        assert request["config"].cached_content == "cachedContents/1"
+        assert request["config"].system_instruction is None
+
+    # A rejected cached content is forgotten, and the request is sent again with the system instruction.
+    client.rejected_caches.add("cachedContents/1")
+    asyncio.run(model.completion(_llm_use().prompts))
+    rejected, resent = client.requests[-2:]
+    assert rejected["config"].cached_content == "cachedContents/1"
+    assert resent["config"].cached_content is None
+    assert resent["config"].system_instruction == "You are a helpful assistant."
+    assert model.system_caches == {}
+
+def test_rejected_cached_content_is_resent_when_streaming(client):
+    model = _model(cache_system_prompt=True, min_system_cache_tokens=1)
+
+    async def stream() -> str:
+        return "".join([model._content(chunk) async for chunk in model.completion_stream(_llm_use().prompts)])
+    assert asyncio.run(stream()) == "<title>Done</title>ok"
+    assert client.requests[-1]["config"].cached_content == "cachedContents/1"
+
+    client.rejected_caches.add("cachedContents/1")
+    assert asyncio.run(stream()) == "<title>Done</title>ok"
+    rejected, resent = client.requests[-2:]
+    assert rejected["config"].cached_content == "cachedContents/1"
+    assert resent["config"].cached_content is None
+    assert resent["config"].system_instruction == "You are a helpful assistant."
+    assert model.system_caches == {}
+
+def test_short_system_prompt_is_not_cached(client):
+    model = _model(cache_system_prompt=True)
+    asyncio.run(model.completion(_llm_use().prompts))
+    assert client.created_caches == []
+    assert client.requests[-1]["config"].system_instruction == "You are a helpful assistant."
@@ -0,0 +1,197 @@
+import asyncio
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import itertools
+import json
+import threading
+
+import pytest
+
+from gensee_agent.controller.controller import Controller
+from gensee_agent.controller.llm_manager import LLMManager
+from gensee_agent.models.openai import OpenAIModel
+
+class MockResponsesServer(ThreadingHTTPServer):
+    """Local stand-in for the Responses API, which stores its responses and rejects unknown previous responses."""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), MockResponsesHandler)
+        self.stored: dict[str, dict] = {}
+        self.requests: list[dict] = []
+        self.retrieved: list[str] = []  # Paths of the GET requests, e.g., of the prewarm requests.
+        self.outputs: list[list[dict]] = []  # Output items of the next responses.
+        self.ids = itertools.count(1)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def respond(self, body: dict) -> tuple[int, dict]:
+        self.requests.append(body)
+        previous_response_id = body.get("previous_response_id")
+        if previous_response_id is not None and previous_response_id not in self.stored:
+            return 400, {"error": {"message": "Previous response not found.", "type": "invalid_request_error",
+                                   "param": "previous_response_id", "code": "previous_response_not_found"}}
+        response_id = f"resp_{next(self.ids)}"
+        output = self.outputs.pop(0) if self.outputs else [_text("<title>Done</title>ok")]
+        response = {
+            "id": response_id, "object": "response", "created_at": 0, "model": body["model"], "status": "completed", "output": output,
+            "parallel_tool_calls": True, "tool_choice": "auto", "tools": [], "error": None, "incomplete_details": None,
+            "instructions": None, "metadata": {}, "temperature": 1, "top_p": 1,
+            "usage": {"input_tokens": 100, "input_tokens_details": {"cached_tokens": 0}, "output_tokens": 10,
+                      "output_tokens_details": {"reasoning_tokens": 0}, "total_tokens": 110},
+        }
+        self.stored[response_id] = response
+        return 200, response
+
+class MockResponsesHandler(BaseHTTPRequestHandler):
+    server: MockResponsesServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.retrieved.append(self.path)
+        self._send(200, {"id": self.path.rsplit("/", 1)[-1], "object": "model", "created": 0, "owned_by": "openai"})
+
+    def do_POST(self):
+        self._send(*self.server.respond(json.loads(self.rfile.read(int(self.headers["content-length"])))))
+
+    def _send(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+def _text(text: str) -> dict:
+    return {"type": "message", "id": "msg_1", "role": "assistant", "status": "completed",
+            "content": [{"type": "output_text", "text": text, "annotations": []}]}
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    server = MockResponsesServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def _model(server: MockResponsesServer) -> OpenAIModel:
+    return OpenAIModel("openai.gpt-5", {"openai": {"base_url": server.base_url, "responses_api": True}})
+
+def test_continues_from_previous_response(server):
+    model = _model(server)
+    messages = [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "Count the letters."}]
+
+    async def run():
+        server.outputs.append([{"type": "function_call", "id": "fc_1", "call_id": "call_1", "name": "gensee__letter_counter__count_letters",
+                                "arguments": '{"text": "hello", "letter": "l"}', "status": "completed"}])
+        first = await model.completion(messages)
+        state = {**model.to_provider_state(first), "length": len(messages) + 1}
+        assert state["call_ids"] == ["call_1"]
+        second = await model.completion([*messages, {"role": "assistant", "content": "calling"}, {"role": "user", "content": "2"}],
+                                        provider_state=state)
+        return first, second
+    first, second = asyncio.run(run())
+
+    request = server.requests[-1]
+    assert request["previous_response_id"] == first.id
+    # Only the message added since the previous response is sent, as the output of the function call.
+    assert request["input"] == [{"type": "function_call_output", "call_id": "call_1", "output": "2"}]
+    assert model.to_llm_responses(second)[0].content == "<title>Done</title>ok"
+
+def test_falls_back_to_full_replay_when_previous_response_is_not_found(server):
+    model = _model(server)
+    messages = [{"role": "user", "content": "Count the letters."}, {"role": "assistant", "content": "3"}, {"role": "user", "content": "Thanks."}]
+    response = asyncio.run(model.completion(messages, provider_state={"response_id": "resp_expired", "call_ids": ["call_1"], "length": 2}))
+
+    rejected, replayed = server.requests
+    assert rejected["previous_response_id"] == "resp_expired"
+    assert "previous_response_id" not in replayed
+    assert replayed["input"] == messages
+    assert model.to_llm_responses(response)[0].content == "<title>Done</title>ok"
+
+def test_provider_state_is_persisted_with_the_session(server, tmp_path):
+    config = {
+        "controller": {"name": "test", "allow_user_interaction": False},
+        "llm_manager": {"available_models": ["openai.gpt-5"], "default_model": "openai.gpt-5"},
+        "tool_manager": {"available_tools": []},
+        "openai": {"base_url": server.base_url, "responses_api": True},
+        "history_manager": {"backend": "sqlite"},
+        "sqlite_history_backend": {"path": str(tmp_path / "history.db")},
+    }
+
+    async def run(task: str) -> list[str]:
+        # A new controller each time, so that the session is loaded from the store.
+        controller = await Controller.create(config)
+        try:
+            return [chunk async for chunk in controller.run("Test", task, session_id="session-1")]
+        finally:
+            await controller.aclose()
+
+    asyncio.run(run("Count the letters."))
+    first_response_id = f"resp_{len(server.requests)}"
+    assert "previous_response_id" not in server.requests[0]
+
+    asyncio.run(run("Count them again."))
+    request = server.requests[-1]
+    assert request["previous_response_id"] == first_response_id
+    assert [item["content"] for item in request["input"] if item.get("role") == "user"][-1].endswith("Count them again.")
+    assert all(item.get("role") != "system" for item in request["input"])
+
+    # Once the stored response is gone, the whole conversation is sent again, and the session goes on.
+    server.stored.clear()
+    server.requests.clear()
+    chunks = asyncio.run(run("Once more."))
+    rejected, replayed = server.requests
+    assert rejected["previous_response_id"] is not None
+    assert "previous_response_id" not in replayed
+    assert [item["role"] for item in replayed["input"]][0] == "system"
+    assert any("ok" in chunk for chunk in chunks)
+
+def test_continues_from_previous_response_after_native_tool_call(server, tmp_path):
+    config = {
+        "controller": {"name": "test", "allow_user_interaction": False},
+        "llm_manager": {"available_models": ["openai.gpt-5"], "default_model": "openai.gpt-5", "native_tool_calls": True},
+        "tool_manager": {"available_tools": ["gensee.letter_counter"]},
+        "openai": {"base_url": server.base_url, "responses_api": True},
+    }
+    server.outputs.append([{"type": "function_call", "id": "fc_1", "call_id": "call_1", "name": "gensee__letter_counter__count_letters",
+                            "arguments": '{"text": "hello", "letter": "l"}', "status": "completed"}])
+
+    async def run() -> list[str]:
+        controller = await Controller.create(config)
+        try:
+            return [chunk async for chunk in controller.run("Test", "Count the l in hello.")]
+        finally:
+            await controller.aclose()
+    chunks = asyncio.run(run())
+
+    first, second = server.requests
+    assert "previous_response_id" not in first
+    assert second["previous_response_id"] == "resp_1"
+    # Only the tool result follows the stored response, as the output of the call.
+    [output] = second["input"]
+    assert output["type"] == "function_call_output" and output["call_id"] == "call_1"
+    assert "Result:\n2" in output["output"]
+    # Parallel tool use is off, so the model may only call one tool at a time.
+    assert first["parallel_tool_calls"] is False
+    assert any("ok" in chunk for chunk in chunks)
+
+def test_models_sharing_a_client_prewarm_it_once(server):
+    manager = LLMManager({
+        "llm_manager": {"available_models": ["openai.gpt-5", "openai.gpt-5-mini"], "default_model": "openai.gpt-5"},
+        "openai": {"base_url": server.base_url},
+        "provider_clients": {"prewarm_connections": 2},
+    })
+
+    async def run():
+        try:
+            await manager.prewarm()
+        finally:
+            await manager.aclose()
+    asyncio.run(run())
+
+    assert manager.models["openai.gpt-5"].client_key == manager.models["openai.gpt-5-mini"].client_key
+    assert len(server.retrieved) == 2